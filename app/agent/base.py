@@ -4,10 +4,14 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
+from app.config import config
 from app.llm import LLM
 from app.logger import logger
+from app.memory_summary import MemorySummarizer
 from app.sandbox.client import SANDBOX_CLIENT
 from app.schema import ROLE_TYPE, AgentState, Memory, Message
+from app.stream_sink import StreamSink, stream_to
+from app.usage_ledger import usage_scope
 
 
 class BaseAgent(BaseModel, ABC):
@@ -32,6 +36,10 @@ class BaseAgent(BaseModel, ABC):
     # Dependencies
     llm: LLM = Field(default_factory=LLM, description="Language model instance")
     memory: Memory = Field(default_factory=Memory, description="Agent's memory store")
+    stream_sink: Optional[StreamSink] = Field(
+        None,
+        description="Destination of the agent's streamed text (LLM default if None)",
+    )
     state: AgentState = Field(
         default=AgentState.IDLE, description="Current agent state"
     )
@@ -53,6 +61,12 @@ class BaseAgent(BaseModel, ABC):
             self.llm = LLM(config_name=self.name.lower())
         if not isinstance(self.memory, Memory):
             self.memory = Memory()
+        # Bound memory by tokens, replacing evicted messages with a summary
+        if config.memory.max_tokens and self.memory.max_tokens is None:
+            self.memory.max_tokens = config.memory.max_tokens
+            self.memory.token_counter = self.llm.token_counter
+        if config.memory.summarize and self.memory.summarizer is None:
+            self.memory.summarizer = MemorySummarizer(self.llm)
         return self
 
     @asynccontextmanager
@@ -128,6 +142,7 @@ class BaseAgent(BaseModel, ABC):
         if self.state != AgentState.IDLE:
             raise RuntimeError(f"Cannot run agent from state: {self.state}")
 
+        self.memory.unpark()
         if request:
             self.update_memory("user", request)
 
@@ -138,7 +153,9 @@ class BaseAgent(BaseModel, ABC):
             ):
                 self.current_step += 1
                 logger.info(f"Executing step {self.current_step}/{self.max_steps}")
-                step_result = await self.step()
+                with usage_scope(agent=self.name, step=self.current_step):
+                    with stream_to(self.stream_sink):
+                        step_result = await self.step()
 
                 # Check for stuck state
                 if self.is_stuck():
@@ -150,6 +167,9 @@ class BaseAgent(BaseModel, ABC):
                 self.current_step = 0
                 self.state = AgentState.IDLE
                 results.append(f"Terminated: Reached max steps ({self.max_steps})")
+        if config.memory.park_idle:
+            # Idle until the next run, e.g. between the steps of a flow
+            self.memory.park()
         await SANDBOX_CLIENT.cleanup()
         return "\n".join(results) if results else "No steps executed"
 
@@ -169,17 +189,18 @@ class BaseAgent(BaseModel, ABC):
 
     def is_stuck(self) -> bool:
         """Check if the agent is stuck in a loop by detecting duplicate content"""
-        if len(self.memory.messages) < 2:
+        messages = self.messages
+        if len(messages) < 2:
             return False
 
-        last_message = self.memory.messages[-1]
+        last_message = messages[-1]
         if not last_message.content:
             return False
 
         # Count identical content occurrences
         duplicate_count = sum(
             1
-            for msg in reversed(self.memory.messages[:-1])
+            for msg in reversed(messages[:-1])
             if msg.role == "assistant" and msg.content == last_message.content
         )
 
@@ -188,6 +209,7 @@ class BaseAgent(BaseModel, ABC):
     @property
     def messages(self) -> List[Message]:
         """Retrieve a list of messages from the agent's memory."""
+        self.memory.unpark()
         return self.memory.messages
 
     @messages.setter
@@ -1,12 +1,13 @@
 import json
 from typing import Any, Optional
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from app.agent.toolcall import ToolCallAgent
 from app.logger import logger
 from app.prompt.browser import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.schema import Message, ToolChoice
+from app.screenshots import ScreenshotPipeline
 from app.tool import BrowserUseTool, Terminate, ToolCollection
 
 
@@ -38,6 +39,9 @@ class BrowserAgent(ToolCallAgent):
 
     _current_base64_image: Optional[str] = None
 
+    # Downscales, deduplicates and ages out the screenshots kept in memory
+    _screenshots: ScreenshotPipeline = PrivateAttr(default_factory=ScreenshotPipeline)
+
     async def _handle_special_tool(self, name: str, result: Any, **kwargs):
         if not self._is_special_tool(name):
             return
@@ -102,14 +106,18 @@ class BrowserAgent(ToolCallAgent):
             if pixels_below > 0:
                 content_below_info = f" ({pixels_below} pixels)"
 
-            # Add screenshot as base64 if available
+            # Add screenshot as base64 if available and changed
             if self._current_base64_image:
-                # Create a message with image attachment
-                image_message = Message.user_message(
-                    content="Current browser screenshot:",
-                    base64_image=self._current_base64_image,
-                )
-                self.memory.add_message(image_message)
+                screenshot = self._screenshots.process(self._current_base64_image)
+                self._current_base64_image = None
+                if screenshot:
+                    # Create a message with image attachment
+                    image_message = Message.user_message(
+                        content="Current browser screenshot:",
+                        base64_image=screenshot,
+                    )
+                    self.memory.add_message(image_message)
+                    self._screenshots.age_out(self.messages)
 
         # Replace placeholders with actual browser state info
         self.next_step_prompt = NEXT_STEP_PROMPT.format(
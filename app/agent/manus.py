@@ -43,7 +43,7 @@ class Manus(BrowserAgent):
         original_prompt = self.next_step_prompt
 
         # Only check recent messages (last 3) for browser activity
-        recent_messages = self.memory.messages[-3:] if self.memory.messages else []
+        recent_messages = self.messages[-3:]
         browser_in_use = any(
             "browser_use" in msg.content.lower()
             for msg in recent_messages
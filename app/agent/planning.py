@@ -212,6 +212,9 @@ class PlanningAgent(ToolCallAgent):
             messages=messages,
             system_msgs=[Message.system_message(self.system_prompt)],
             tools=self.available_tools.to_params(),
+            tools_tokens=self.available_tools.params_token_count(
+                self.llm.count_tokens, self.llm.tokenizer.name
+            ),
             tool_choice=ToolChoice.AUTO,
         )
         assistant_msg = Message.from_tool_calls(
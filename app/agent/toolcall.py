@@ -1,9 +1,11 @@
+import asyncio
 import json
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from app.agent.react import ReActAgent
+from app.context_window import ContextWindow
 from app.exceptions import TokenLimitExceeded
 from app.logger import logger
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
@@ -32,36 +34,56 @@ class ToolCallAgent(ReActAgent):
     tool_calls: List[ToolCall] = Field(default_factory=list)
     _current_base64_image: Optional[str] = None
 
+    # Stream completions and start read-only tools as soon as their call is
+    # complete. Other tools wait for the whole response: if the stream fails
+    # or is retried, their side effects must not happen unrecorded.
+    stream_tool_calls: bool = False
+    _tool_tasks: Dict[str, asyncio.Task] = PrivateAttr(default_factory=dict)
+    _early_start: bool = PrivateAttr(default=True)
+
     max_steps: int = 30
     max_observe: Optional[Union[int, bool]] = None
 
+    # Token budget for each request, defaults to the LLM config's context window
+    context_window: Optional[ContextWindow] = None
+
     async def think(self) -> bool:
         """Process current state and decide next actions using tools"""
         if self.next_step_prompt:
             user_msg = Message.user_message(self.next_step_prompt)
             self.messages += [user_msg]
 
+        streaming = self.stream_tool_calls and self.tool_choices != ToolChoice.NONE
+        self._cancel_tool_tasks()
+        self._early_start = True
+
+        system_msgs = (
+            [Message.system_message(self.system_prompt)] if self.system_prompt else None
+        )
+        tools_tokens = self.available_tools.params_token_count(
+            self.llm.count_tokens, self.llm.tokenizer.name
+        )
+
         try:
             # Get response with tool options
             response = await self.llm.ask_tool(
-                messages=self.messages,
-                system_msgs=(
-                    [Message.system_message(self.system_prompt)]
-                    if self.system_prompt
-                    else None
-                ),
+                messages=self._fit_context(system_msgs, tools_tokens),
+                system_msgs=system_msgs,
                 tools=self.available_tools.to_params(),
+                tools_tokens=tools_tokens,
                 tool_choice=self.tool_choices,
+                stream=streaming,
+                on_tool_call=self._start_tool_call if streaming else None,
             )
         except ValueError:
+            self._cancel_tool_tasks()
             raise
         except Exception as e:
-            # Check if this is a RetryError containing TokenLimitExceeded
-            if hasattr(e, "__cause__") and isinstance(e.__cause__, TokenLimitExceeded):
-                token_limit_error = e.__cause__
-                logger.error(
-                    f"🚨 Token limit error (from RetryError): {token_limit_error}"
-                )
+            self._cancel_tool_tasks()
+            # TokenLimitExceeded is not retried, so it arrives as-is
+            token_limit_error = e if isinstance(e, TokenLimitExceeded) else e.__cause__
+            if isinstance(token_limit_error, TokenLimitExceeded):
+                logger.error(f"🚨 Token limit error: {token_limit_error}")
                 self.memory.add_message(
                     Message.assistant_message(
                         f"Maximum token limit reached, cannot continue execution: {str(token_limit_error)}"
@@ -76,6 +98,9 @@ class ToolCallAgent(ReActAgent):
         )
         content = response.content if response and response.content else ""
 
+        # Drop tool runs started for calls that did not make the final response
+        self._cancel_tool_tasks(keep={call.id for call in tool_calls})
+
         # Log response info
         logger.info(f"✨ {self.name}'s thoughts: {content}")
         logger.info(
@@ -119,6 +144,7 @@ class ToolCallAgent(ReActAgent):
 
             return bool(self.tool_calls)
         except Exception as e:
+            self._cancel_tool_tasks()
             logger.error(f"🚨 Oops! The {self.name}'s thinking process hit a snag: {e}")
             self.memory.add_message(
                 Message.assistant_message(
@@ -138,10 +164,12 @@ class ToolCallAgent(ReActAgent):
 
         results = []
         for command in self.tool_calls:
-            # Reset base64_image for each tool call
-            self._current_base64_image = None
-
-            result = await self.execute_tool(command)
+            # Reuse the run started while the response was streaming, if any
+            task = self._tool_tasks.pop(command.id, None)
+            if task is not None:
+                result, base64_image = await task
+            else:
+                result, base64_image = await self._run_tool_call(command)
 
             if self.max_observe:
                 result = result[: self.max_observe]
@@ -155,13 +183,79 @@ class ToolCallAgent(ReActAgent):
                 content=result,
                 tool_call_id=command.id,
                 name=command.function.name,
-                base64_image=self._current_base64_image,
+                base64_image=base64_image,
             )
             self.memory.add_message(tool_msg)
             results.append(result)
 
         return "\n\n".join(results)
 
+    def _fit_context(
+        self, system_msgs: Optional[List[Message]], tools_tokens: int
+    ) -> List[Union[Message, dict]]:
+        """Trim the history to the context window budget, if one is set.
+
+        An untrimmed history is handed over pre-formatted by the memory.
+        """
+        window = self.context_window or getattr(self.llm, "context_window", None)
+        if window is not None:
+            token_counter = self.llm.token_counter
+            reserved = tools_tokens + sum(
+                window.count(message, token_counter) for message in system_msgs or []
+            )
+            fitted = window.fit(self.messages, token_counter, reserved_tokens=reserved)
+            if fitted is not self.messages:
+                return fitted
+        return self.memory.formatted_messages(self.llm.supports_images)
+
+    def _start_tool_call(self, command: ToolCall) -> None:
+        """Start executing a streamed read-only tool call, after earlier ones.
+
+        Once a call has to wait for the full response, later calls wait too,
+        so no tool runs ahead of a call it may depend on.
+        """
+        tool = self.available_tools.get_tool(command.function.name)
+        try:
+            args = json.loads(command.function.arguments or "{}")
+        except json.JSONDecodeError:
+            args = None
+        if not (
+            self._early_start
+            and tool is not None
+            and isinstance(args, dict)
+            and tool.is_read_only(**args)
+        ):
+            self._early_start = False
+            return
+        # A retried stream reports its calls again; restart, don't run twice
+        started = self._tool_tasks.pop(command.id, None)
+        if started is not None:
+            started.cancel()
+        previous = next(reversed(self._tool_tasks.values()), None)
+        self._tool_tasks[command.id] = asyncio.create_task(
+            self._run_tool_call(command, previous)
+        )
+
+    async def _run_tool_call(
+        self, command: ToolCall, previous: Optional[asyncio.Task] = None
+    ) -> Tuple[str, Optional[str]]:
+        """Execute a tool call, returning its observation and any screenshot"""
+        if previous is not None:
+            # Keep tool calls sequential, whether or not the earlier one succeeded
+            await asyncio.wait([previous])
+
+        # Reset base64_image for each tool call
+        self._current_base64_image = None
+        result = await self.execute_tool(command)
+        return result, self._current_base64_image
+
+    def _cancel_tool_tasks(self, keep: Optional[set] = None) -> None:
+        """Cancel streamed tool runs, except those whose call ids are in keep"""
+        keep = keep or set()
+        for call_id in list(self._tool_tasks):
+            if call_id not in keep:
+                self._tool_tasks.pop(call_id).cancel()
+
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
         if not command or not command.function or not command.function.name:
@@ -0,0 +1,326 @@
+"""Batch submission of independent LLM requests.
+
+`LLM.submit_batch` turns a list of independent requests (per-page content
+extraction, plan summaries across flows, ...) into a `BatchJob`. Where the
+provider has a batch API (OpenAI, Azure) the requests go out as one batch
+job; otherwise they are dispatched concurrently under the config's rate
+limiter. Job state is written to disk as the job progresses, so a restarted
+process can pick the job up again with `LLM.resume_batch`.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+from urllib.parse import urlparse
+
+from openai.types.chat import ChatCompletionMessage
+from openai.types.completion_usage import CompletionUsage
+from pydantic import BaseModel, Field
+
+from app.config import PROJECT_ROOT, config
+from app.exceptions import BatchRequestError
+from app.logger import logger
+from app.schema import Message, ToolChoice
+
+
+PROVIDER = "provider"
+CONCURRENT = "concurrent"
+
+OPENAI_BATCH_ENDPOINT = "/v1/chat/completions"
+AZURE_BATCH_ENDPOINT = "/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequest(BaseModel):
+    """One independent request of a batch, mirroring `LLM.ask_tool` arguments"""
+
+    messages: List[Union[dict, Message]]
+    system_msgs: Optional[List[Union[dict, Message]]] = None
+    tools: Optional[List[dict]] = None
+    tool_choice: ToolChoice = ToolChoice.AUTO
+    temperature: Optional[float] = None
+    custom_id: Optional[str] = Field(
+        None, description="Caller-chosen id, unique within the batch"
+    )
+
+
+class BatchJob:
+    """A submitted batch and its results.
+
+    ``futures`` holds one future per request, in submission order, resolving
+    to the model's ChatCompletionMessage or raising `BatchRequestError`.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        config_name: str,
+        mode: str,
+        requests: Dict[str, dict],
+        state_dir: Path,
+        provider_batch_id: Optional[str] = None,
+        results: Optional[Dict[str, dict]] = None,
+        errors: Optional[Dict[str, str]] = None,
+        created_at: Optional[float] = None,
+    ):
+        self.id = job_id
+        self.config_name = config_name
+        self.mode = mode
+        # custom_id -> chat completion params, in submission order
+        self.requests = requests
+        self.state_dir = Path(state_dir)
+        self.provider_batch_id = provider_batch_id
+        self.results: Dict[str, dict] = results or {}
+        self.errors: Dict[str, str] = errors or {}
+        self.created_at = created_at or time.time()
+        self._futures: Dict[str, asyncio.Future] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def create(
+        cls, config_name: str, mode: str, requests: Dict[str, dict], state_dir: Path
+    ) -> "BatchJob":
+        return cls(
+            f"batch-{uuid.uuid4().hex[:12]}", config_name, mode, requests, state_dir
+        )
+
+    @property
+    def path(self) -> Path:
+        return self.state_dir / f"{self.id}.json"
+
+    @property
+    def pending(self) -> List[str]:
+        return [
+            custom_id
+            for custom_id in self.requests
+            if custom_id not in self.results and custom_id not in self.errors
+        ]
+
+    @property
+    def done(self) -> bool:
+        return not self.pending
+
+    @property
+    def futures(self) -> List[asyncio.Future]:
+        return [self._get_future(custom_id) for custom_id in self.requests]
+
+    def _get_future(self, custom_id: str) -> asyncio.Future:
+        future = self._futures.get(custom_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[custom_id] = loop.create_future()
+            if custom_id in self.results:
+                future.set_result(
+                    ChatCompletionMessage.model_validate(self.results[custom_id])
+                )
+            elif custom_id in self.errors:
+                future.set_exception(BatchRequestError(self.errors[custom_id]))
+        return future
+
+    def set_result(self, custom_id: str, message: dict) -> None:
+        self.results[custom_id] = message
+        future = self._get_future(custom_id)
+        if not future.done():
+            future.set_result(ChatCompletionMessage.model_validate(message))
+
+    def set_error(self, custom_id: str, error: str) -> None:
+        self.errors[custom_id] = error
+        future = self._get_future(custom_id)
+        if not future.done():
+            future.set_exception(BatchRequestError(error))
+            # Errors are reported through the job as well; don't warn if unread
+            future.exception()
+
+    def abort(self, error: BaseException) -> None:
+        """Fail the pending futures without recording errors in the job state.
+
+        Used when the job itself breaks (e.g. polling fails); the saved state
+        still lists the requests as pending, so the job can be resumed.
+        """
+        for custom_id in self.pending:
+            future = self._get_future(custom_id)
+            if not future.done():
+                future.set_exception(
+                    BatchRequestError(f"Batch job {self.id} interrupted: {error}")
+                )
+                future.exception()
+
+    async def wait(self) -> List[Optional[ChatCompletionMessage]]:
+        """Wait for every request; failed requests yield None"""
+        if self.task is not None:
+            await self.task
+        results = await asyncio.gather(*self.futures, return_exceptions=True)
+        return [None if isinstance(r, BaseException) else r for r in results]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "config_name": self.config_name,
+            "mode": self.mode,
+            "provider_batch_id": self.provider_batch_id,
+            "created_at": self.created_at,
+            "requests": self.requests,
+            "results": self.results,
+            "errors": self.errors,
+        }
+
+    def save(self) -> None:
+        """Write the job state atomically"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, default=str))
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, job_id: str, state_dir: Path) -> "BatchJob":
+        path = Path(state_dir) / f"{job_id}.json"
+        data = json.loads(path.read_text())
+        return cls(
+            data["id"],
+            data["config_name"],
+            data["mode"],
+            data["requests"],
+            state_dir,
+            provider_batch_id=data.get("provider_batch_id"),
+            results=data.get("results"),
+            errors=data.get("errors"),
+            created_at=data.get("created_at"),
+        )
+
+
+def get_state_dir() -> Path:
+    """Directory holding batch job state, from the [llm_batch] config"""
+    state_dir = Path(config.llm_batch.state_dir)
+    return state_dir if state_dir.is_absolute() else PROJECT_ROOT / state_dir
+
+
+UsageCallback = Callable[[CompletionUsage], None]
+
+
+def provider_batch_endpoint(api_type: str, base_url: str) -> Optional[str]:
+    """The batch API endpoint of a config, or None if it has no batch API.
+
+    Every OpenAI client has ``files`` and ``batches``, but only OpenAI and
+    Azure OpenAI serve them; other OpenAI-compatible endpoints (Anthropic,
+    Ollama, proxies) are dispatched concurrently.
+    """
+    if api_type == "azure":
+        return AZURE_BATCH_ENDPOINT
+    if api_type in ("", "openai") and urlparse(base_url).hostname == "api.openai.com":
+        return OPENAI_BATCH_ENDPOINT
+    return None
+
+
+async def submit_provider_batch(job: BatchJob, client: Any, endpoint: str) -> None:
+    """Upload the pending requests of a job as one provider batch"""
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": endpoint,
+                "body": job.requests[custom_id],
+            },
+            default=str,
+        )
+        for custom_id in job.pending
+    ]
+    input_file = await client.files.create(
+        file=(f"{job.id}.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=endpoint,
+        completion_window="24h",
+        metadata={"job_id": job.id},
+    )
+    job.provider_batch_id = batch.id
+    job.save()
+    logger.info(f"Submitted {len(lines)} requests as provider batch {batch.id}")
+
+
+async def run_provider_batch(
+    job: BatchJob,
+    client: Any,
+    endpoint: str,
+    poll_interval: float,
+    on_usage: Optional[UsageCallback] = None,
+) -> None:
+    """Wait for a job's provider batch to finish and collect its results"""
+    if job.provider_batch_id is None:
+        await submit_provider_batch(job, client, endpoint)
+
+    while True:
+        batch = await client.batches.retrieve(job.provider_batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if line.strip():
+                _apply_batch_output(job, json.loads(line), on_usage)
+
+    for custom_id in job.pending:
+        job.set_error(custom_id, f"Provider batch ended with status {batch.status}")
+    job.save()
+
+
+def _apply_batch_output(
+    job: BatchJob, output: dict, on_usage: Optional[UsageCallback]
+) -> None:
+    custom_id = output.get("custom_id")
+    if custom_id not in job.requests:
+        return
+    response = output.get("response") or {}
+    body = response.get("body") or {}
+    if output.get("error") or response.get("status_code", 200) >= 400:
+        error = output.get("error") or body.get("error") or response
+        job.set_error(custom_id, json.dumps(error, default=str))
+        return
+    if on_usage is not None and body.get("usage"):
+        on_usage(CompletionUsage.model_validate(body["usage"]))
+    job.set_result(custom_id, body["choices"][0]["message"])
+
+
+async def run_concurrent_batch(
+    job: BatchJob,
+    send: Callable[[dict], Any],
+    concurrency: int,
+    save_interval: float = 5.0,
+) -> None:
+    """Dispatch the pending requests of a job concurrently.
+
+    ``send`` takes chat completion params and returns the message as a dict;
+    rate and retry handling are left to it. State is saved at most every
+    ``save_interval`` seconds and once more when dispatching ends, so a
+    resumed job repeats at most the requests of the last interval.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    last_save = time.monotonic()
+
+    async def run_one(custom_id: str) -> None:
+        async with semaphore:
+            try:
+                message = await send(job.requests[custom_id])
+            except Exception as e:
+                logger.warning(f"Batch request {custom_id} failed: {e}")
+                job.set_error(custom_id, f"{type(e).__name__}: {e}")
+            else:
+                job.set_result(custom_id, message)
+        nonlocal last_save
+        if time.monotonic() - last_save >= save_interval:
+            last_save = time.monotonic()
+            job.save()
+
+    try:
+        await asyncio.gather(*(run_one(custom_id) for custom_id in job.pending))
+    finally:
+        job.save()
@@ -1,16 +1,16 @@
+import asyncio
 import json
 import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Literal, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Union
 
 import boto3
+from botocore.config import Config as BotocoreConfig
 
-
-# Global variables to track the current tool use ID across function calls
-# Tmp solution
-CURRENT_TOOLUSE_ID = None
+from app.stream_sink import StdoutSink, StreamSink, current_stream_sink
 
 
 # Class to handle OpenAI-style response formatting
@@ -36,11 +36,24 @@ class OpenAIResponse:
 
 # Main client class for interacting with Amazon Bedrock
 class BedrockClient:
-    def __init__(self):
-        # Initialize Bedrock client, you need to configure AWS env first
+    def __init__(self, max_concurrency: int = 10, **client_kwargs):
+        # Initialize Bedrock client, you need to configure AWS env first.
+        # boto3 is synchronous: calls run on a bounded thread pool, with one
+        # pooled HTTP connection per worker. LLM's RetryPolicy and circuit
+        # breaker own retries, so botocore sends each request only once.
         try:
-            self.client = boto3.client("bedrock-runtime")
-            self.chat = Chat(self.client)
+            self.client = boto3.client(
+                "bedrock-runtime",
+                config=BotocoreConfig(
+                    max_pool_connections=max_concurrency,
+                    retries={"mode": "standard", "total_max_attempts": 1},
+                ),
+                **client_kwargs,
+            )
+            self.executor = ThreadPoolExecutor(
+                max_workers=max_concurrency, thread_name_prefix="bedrock"
+            )
+            self.chat = Chat(self.client, self.executor)
         except Exception as e:
             print(f"Error initializing Bedrock client: {e}")
             sys.exit(1)
@@ -48,14 +61,55 @@ class BedrockClient:
 
 # Chat interface class
 class Chat:
-    def __init__(self, client):
-        self.completions = ChatCompletions(client)
+    def __init__(self, client, executor: Optional[ThreadPoolExecutor] = None):
+        self.completions = ChatCompletions(client, executor)
 
 
 # Core class handling chat completions functionality
 class ChatCompletions:
-    def __init__(self, client):
+    def __init__(self, client, executor: Optional[ThreadPoolExecutor] = None):
         self.client = client
+        self.executor = executor
+
+    async def _run(self, func: Callable[..., Any], **kwargs) -> Any:
+        # Run a blocking boto3 call without blocking the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(**kwargs))
+
+    async def stream_events(self, **request) -> AsyncIterator[dict]:
+        """Call converse_stream and yield its events as they arrive.
+
+        A worker thread reads the (blocking) event stream and hands events
+        to the event loop, so other coroutines keep running meanwhile.
+        """
+        response = await self._run(self.client.converse_stream, **request)
+        stream = response.get("stream") or []
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for event in stream:
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        reader = loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            if not reader.done() and hasattr(stream, "close"):
+                # Stop reading a stream the caller abandoned
+                stream.close()
 
     def _convert_openai_tools_to_bedrock_format(self, tools):
         # Convert OpenAI function calling format to Bedrock tool format
@@ -81,52 +135,88 @@ class ChatCompletions:
                     }
                 }
                 bedrock_tools.append(bedrock_tool)
+                if tool.get("cache_control"):
+                    # Cache the tool config along with the prompt before it
+                    bedrock_tools.append({"cachePoint": {"type": "default"}})
         return bedrock_tools
 
+    @staticmethod
+    def _convert_openai_content_to_bedrock_format(content):
+        # Convert OpenAI message content to Bedrock content blocks; a
+        # cache_control breakpoint becomes a cachePoint after its block
+        if not isinstance(content, list):
+            # Bedrock rejects blank text blocks (e.g. tool-call-only turns)
+            return [{"text": content}] if content else []
+        bedrock_content = []
+        for item in content:
+            if isinstance(item, str):
+                bedrock_content.append({"text": item})
+            elif item.get("type") == "text":
+                bedrock_content.append({"text": item["text"]})
+                if item.get("cache_control"):
+                    bedrock_content.append({"cachePoint": {"type": "default"}})
+        return bedrock_content
+
     def _convert_openai_messages_to_bedrock_format(self, messages):
         # Convert OpenAI message format to Bedrock message format
         bedrock_messages = []
         system_prompt = []
         for message in messages:
             if message.get("role") == "system":
-                system_prompt = [{"text": message.get("content")}]
+                system_prompt.extend(
+                    self._convert_openai_content_to_bedrock_format(
+                        message.get("content")
+                    )
+                )
             elif message.get("role") == "user":
                 bedrock_message = {
                     "role": message.get("role", "user"),
-                    "content": [{"text": message.get("content")}],
+                    "content": self._convert_openai_content_to_bedrock_format(
+                        message.get("content")
+                    ),
                 }
                 bedrock_messages.append(bedrock_message)
             elif message.get("role") == "assistant":
                 bedrock_message = {
                     "role": "assistant",
-                    "content": [{"text": message.get("content")}],
+                    "content": self._convert_openai_content_to_bedrock_format(
+                        message.get("content")
+                    ),
                 }
-                openai_tool_calls = message.get("tool_calls", [])
-                if openai_tool_calls:
-                    bedrock_tool_use = {
-                        "toolUseId": openai_tool_calls[0]["id"],
-                        "name": openai_tool_calls[0]["function"]["name"],
-                        "input": json.loads(
-                            openai_tool_calls[0]["function"]["arguments"]
-                        ),
-                    }
-                    bedrock_message["content"].append({"toolUse": bedrock_tool_use})
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = openai_tool_calls[0]["id"]
-                bedrock_messages.append(bedrock_message)
-            elif message.get("role") == "tool":
-                bedrock_message = {
-                    "role": "user",
-                    "content": [
+                for tool_call in message.get("tool_calls") or []:
+                    bedrock_message["content"].append(
                         {
-                            "toolResult": {
-                                "toolUseId": CURRENT_TOOLUSE_ID,
-                                "content": [{"text": message.get("content")}],
+                            "toolUse": {
+                                "toolUseId": tool_call["id"],
+                                "name": tool_call["function"]["name"],
+                                "input": json.loads(
+                                    tool_call["function"]["arguments"] or "{}"
+                                ),
                             }
                         }
-                    ],
-                }
+                    )
                 bedrock_messages.append(bedrock_message)
+            elif message.get("role") == "tool":
+                result_content = self._convert_openai_content_to_bedrock_format(
+                    message.get("content")
+                )
+                # Tool results cannot hold a cachePoint, it follows the result
+                cache_points = [c for c in result_content if "cachePoint" in c]
+                tool_result = {
+                    "toolResult": {
+                        "toolUseId": message["tool_call_id"],
+                        "content": [c for c in result_content if "cachePoint" not in c]
+                        or [{"text": ""}],
+                    }
+                }
+                # Results of one turn's tool calls go in a single user message
+                previous = bedrock_messages[-1] if bedrock_messages else None
+                if previous and any("toolResult" in c for c in previous["content"]):
+                    previous["content"].extend([tool_result] + cache_points)
+                else:
+                    bedrock_messages.append(
+                        {"role": "user", "content": [tool_result] + cache_points}
+                    )
             else:
                 raise ValueError(f"Invalid role: {message.get('role')}")
         return system_prompt, bedrock_messages
@@ -146,10 +236,8 @@ class ChatCompletions:
             for content_item in bedrock_response["output"]["message"]["content"]:
                 if content_item.get("toolUse"):
                     bedrock_tool_use = content_item["toolUse"]
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = bedrock_tool_use["toolUseId"]
                     openai_tool_call = {
-                        "id": CURRENT_TOOLUSE_ID,
+                        "id": bedrock_tool_use["toolUseId"],
                         "type": "function",
                         "function": {
                             "name": bedrock_tool_use["name"],
@@ -180,18 +268,71 @@ class ChatCompletions:
                     },
                 }
             ],
-            "usage": {
-                "completion_tokens": bedrock_response.get("usage", {}).get(
-                    "outputTokens", 0
-                ),
-                "prompt_tokens": bedrock_response.get("usage", {}).get(
-                    "inputTokens", 0
-                ),
-                "total_tokens": bedrock_response.get("usage", {}).get("totalTokens", 0),
-            },
+            "usage": self._convert_bedrock_usage(
+                bedrock_response.get("usage", {}), bedrock_response.get("metrics", {})
+            ),
         }
         return OpenAIResponse(openai_format)
 
+    @staticmethod
+    def _convert_bedrock_usage(usage: dict, metrics: dict) -> dict:
+        # Bedrock's inputTokens excludes cache reads and writes; OpenAI's
+        # prompt_tokens includes cached tokens, so they are added back
+        cache_read = usage.get("cacheReadInputTokens", 0)
+        cache_write = usage.get("cacheWriteInputTokens", 0)
+        return {
+            "completion_tokens": usage.get("outputTokens", 0),
+            "prompt_tokens": usage.get("inputTokens", 0) + cache_read + cache_write,
+            "total_tokens": usage.get("totalTokens", 0),
+            "prompt_tokens_details": {"cached_tokens": cache_read},
+            # Anthropic's names, as read by app.prompt_cache
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+            "latency_ms": metrics.get("latencyMs"),
+        }
+
+    @staticmethod
+    def _build_request(
+        model: str,
+        system_prompt: List[dict],
+        bedrock_messages: List[dict],
+        max_tokens: int,
+        temperature: float,
+        tools: Optional[List[dict]] = None,
+        tool_choice: Union[str, dict] = "auto",
+    ) -> Dict[str, Any]:
+        # boto3 rejects None parameters, so optional ones are left out
+        request = {
+            "modelId": model,
+            "system": system_prompt,
+            "messages": bedrock_messages,
+            "inferenceConfig": {"temperature": temperature, "maxTokens": max_tokens},
+        }
+        if tool_choice == "none" and not any(
+            "toolUse" in block or "toolResult" in block
+            for message in bedrock_messages
+            for block in message["content"]
+        ):
+            # Bedrock has no "none" choice; without tools none can be called.
+            # Tools must stay declared once the history holds tool blocks.
+            tools = None
+        if tools:
+            request["toolConfig"] = {"tools": tools}
+            bedrock_tool_choice = ChatCompletions._convert_tool_choice(tool_choice)
+            if bedrock_tool_choice:
+                request["toolConfig"]["toolChoice"] = bedrock_tool_choice
+        return request
+
+    @staticmethod
+    def _convert_tool_choice(tool_choice: Union[str, dict]) -> Optional[dict]:
+        # Map OpenAI tool_choice to Bedrock's; "auto" is Bedrock's default and
+        # is left out, since only some models accept an explicit toolChoice
+        if tool_choice == "required":
+            return {"any": {}}
+        if isinstance(tool_choice, dict) and tool_choice.get("function"):
+            return {"tool": {"name": tool_choice["function"]["name"]}}
+        return None
+
     async def _invoke_bedrock(
         self,
         model: str,
@@ -199,7 +340,7 @@ class ChatCompletions:
         max_tokens: int,
         temperature: float,
         tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
+        tool_choice: Union[Literal["none", "auto", "required"], dict] = "auto",
         **kwargs,
     ) -> OpenAIResponse:
         # Non-streaming invocation of Bedrock model
@@ -207,12 +348,17 @@ class ChatCompletions:
             system_prompt,
             bedrock_messages,
         ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+        response = await self._run(
+            self.client.converse,
+            **self._build_request(
+                model,
+                system_prompt,
+                bedrock_messages,
+                max_tokens,
+                temperature,
+                tools,
+                tool_choice,
+            ),
         )
         openai_response = self._convert_bedrock_response_to_openai_format(response)
         return openai_response
@@ -224,20 +370,23 @@ class ChatCompletions:
         max_tokens: int,
         temperature: float,
         tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
+        tool_choice: Union[Literal["none", "auto", "required"], dict] = "auto",
+        sink: Optional[StreamSink] = None,
         **kwargs,
     ) -> OpenAIResponse:
-        # Streaming invocation of Bedrock model
+        # Streaming invocation of Bedrock model; text deltas go to sink
         (
             system_prompt,
             bedrock_messages,
         ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse_stream(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+        request = self._build_request(
+            model,
+            system_prompt,
+            bedrock_messages,
+            max_tokens,
+            temperature,
+            tools,
+            tool_choice,
         )
 
         # Initialize response structure
@@ -247,51 +396,48 @@ class ChatCompletions:
             "usage": {},
             "metrics": {},
         }
-        bedrock_response_text = ""
-        bedrock_response_tool_input = ""
+        # Content blocks by index; tool inputs arrive as JSON fragments
+        blocks: Dict[int, dict] = {}
+        tool_inputs: Dict[int, str] = {}
 
         # Process streaming response
-        stream = response.get("stream")
-        if stream:
-            for event in stream:
-                if event.get("messageStart", {}).get("role"):
-                    bedrock_response["output"]["message"]["role"] = event[
-                        "messageStart"
-                    ]["role"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("text"):
-                    bedrock_response_text += event["contentBlockDelta"]["delta"]["text"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["text"], end="", flush=True
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 0:
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"text": bedrock_response_text}
-                    )
-                if event.get("contentBlockStart", {}).get("start", {}).get("toolUse"):
-                    bedrock_tool_use = event["contentBlockStart"]["start"]["toolUse"]
-                    tool_use = {
-                        "toolUseId": bedrock_tool_use["toolUseId"],
-                        "name": bedrock_tool_use["name"],
+        sink = sink or current_stream_sink() or StdoutSink()
+        async for event in self.stream_events(**request):
+            if event.get("messageStart", {}).get("role"):
+                bedrock_response["output"]["message"]["role"] = event["messageStart"][
+                    "role"
+                ]
+            if "contentBlockStart" in event:
+                start = event["contentBlockStart"]
+                tool_use = start.get("start", {}).get("toolUse")
+                if tool_use:
+                    blocks[start["contentBlockIndex"]] = {
+                        "toolUse": {
+                            "toolUseId": tool_use["toolUseId"],
+                            "name": tool_use["name"],
+                        }
                     }
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"toolUse": tool_use}
-                    )
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = bedrock_tool_use["toolUseId"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("toolUse"):
-                    bedrock_response_tool_input += event["contentBlockDelta"]["delta"][
-                        "toolUse"
-                    ]["input"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["toolUse"]["input"],
-                        end="",
-                        flush=True,
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 1:
-                    bedrock_response["output"]["message"]["content"][1]["toolUse"][
-                        "input"
-                    ] = json.loads(bedrock_response_tool_input)
-        print()
+                    tool_inputs[start["contentBlockIndex"]] = ""
+            if "contentBlockDelta" in event:
+                index = event["contentBlockDelta"]["contentBlockIndex"]
+                delta = event["contentBlockDelta"]["delta"]
+                if delta.get("text"):
+                    block = blocks.setdefault(index, {"text": ""})
+                    block["text"] += delta["text"]
+                    sink.write(delta["text"])
+                if delta.get("toolUse"):
+                    tool_inputs[index] += delta["toolUse"]["input"]
+            if "stopReason" in event.get("messageStop", {}):
+                bedrock_response["stopReason"] = event["messageStop"]["stopReason"]
+            if "metadata" in event:
+                bedrock_response["usage"] = event["metadata"].get("usage", {})
+                bedrock_response["metrics"] = event["metadata"].get("metrics", {})
+        for index, tool_input in tool_inputs.items():
+            blocks[index]["toolUse"]["input"] = json.loads(tool_input or "{}")
+        bedrock_response["output"]["message"]["content"] = [
+            blocks[index] for index in sorted(blocks)
+        ]
+        sink.end()
         openai_response = self._convert_bedrock_response_to_openai_format(
             bedrock_response
         )
@@ -305,7 +451,8 @@ class ChatCompletions:
         temperature: float,
         stream: Optional[bool] = True,
         tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
+        tool_choice: Union[Literal["none", "auto", "required"], dict] = "auto",
+        sink: Optional[StreamSink] = None,
         **kwargs,
     ) -> OpenAIResponse:
         # Main entry point for chat completion
@@ -320,6 +467,7 @@ class ChatCompletions:
                 temperature,
                 bedrock_tools,
                 tool_choice,
+                sink=sink,
                 **kwargs,
             )
         else:
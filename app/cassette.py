@@ -0,0 +1,216 @@
+"""Record/replay LLM backend for offline benchmarks and tests.
+
+A cassette is a JSONL file of request/response pairs. `CassetteClient`
+exposes the same ``chat.completions.create`` interface as `AsyncOpenAI` and
+`BedrockClient`:
+
+- ``record`` sends every request to the real client and appends the pair
+- ``replay`` answers from the cassette only and never touches the network
+- ``auto`` replays known requests and records the rest
+
+Requests are matched on a hash of their normalized params, so tool call ids
+and transport-only options do not break matching. Repeated identical
+requests replay the recorded responses in order. Recorded latency can be
+injected on replay (scaled by ``latency_scale``) to load-test the agent loop
+under realistic timing.
+"""
+import asyncio
+import inspect
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+from app.bedrock import OpenAIResponse
+from app.exceptions import CassetteMissError
+from app.llm_cache import make_cache_key
+from app.logger import logger
+
+
+RECORD = "record"
+REPLAY = "replay"
+AUTO = "auto"
+MODES = (RECORD, REPLAY, AUTO)
+
+# Params that only affect transport, not the completion
+IGNORED_PARAMS = ("stream_options", "timeout", "extra_headers", "user", "sink")
+
+
+def normalize_request(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip transport options and renumber tool call ids in order of use"""
+    request = json.loads(
+        json.dumps(
+            {k: v for k, v in params.items() if k not in IGNORED_PARAMS},
+            default=str,
+        )
+    )
+    ids: Dict[str, str] = {}
+
+    def rename(call_id: Optional[str]) -> Optional[str]:
+        if call_id is None:
+            return None
+        return ids.setdefault(call_id, f"call_{len(ids)}")
+
+    for message in request.get("messages") or []:
+        for call in message.get("tool_calls") or []:
+            call["id"] = rename(call.get("id"))
+        if "tool_call_id" in message:
+            message["tool_call_id"] = rename(message["tool_call_id"])
+    return request
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    return make_cache_key(**normalize_request(params))
+
+
+def _to_data(value: Any) -> Any:
+    """JSON-ready copy of an OpenAI or Bedrock response object"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, OpenAIResponse):
+        return {key: _to_data(item) for key, item in vars(value).items()}
+    if isinstance(value, list):
+        return [_to_data(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_data(item) for key, item in value.items()}
+    return value
+
+
+class Cassette:
+    """Recorded interactions of one file, indexed by request key"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.interactions: Dict[str, List[dict]] = {}
+        # Replay position per request key
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self.interactions.setdefault(interaction["key"], []).append(
+                            interaction
+                        )
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.interactions.values())
+
+    def next(self, key: str) -> Optional[dict]:
+        """The next recorded interaction for key; the last one repeats"""
+        items = self.interactions.get(key)
+        if not items:
+            return None
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return items[min(position, len(items) - 1)]
+
+    def append(self, interaction: dict) -> None:
+        with self._lock:
+            self.interactions.setdefault(interaction["key"], []).append(interaction)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+
+
+class CassetteClient:
+    """Chat completions client recording to or replaying from a cassette"""
+
+    def __init__(
+        self,
+        path: Path,
+        mode: str = REPLAY,
+        client: Any = None,
+        latency_scale: float = 0.0,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        if mode != REPLAY and client is None:
+            raise ValueError(f"Cassette mode {mode!r} needs a client to record from")
+        self.cassette = Cassette(path)
+        self.mode = mode
+        self.client = client
+        self.latency_scale = latency_scale
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.stats: Dict[str, int] = {"replayed": 0, "recorded": 0}
+
+    async def create(self, **params):
+        key = request_key(params)
+        if self.mode != RECORD:
+            interaction = self.cassette.next(key)
+            if interaction is not None:
+                return await self._replay(interaction)
+            if self.mode == REPLAY:
+                raise CassetteMissError(
+                    f"No recorded response in {self.cassette.path} for request {key[:12]}"
+                )
+        return await self._record(key, params)
+
+    async def _replay(self, interaction: dict):
+        self.stats["replayed"] += 1
+        delay = interaction.get("latency", 0.0) * self.latency_scale
+        kind = interaction["kind"]
+        if kind == "stream":
+            chunks = [
+                ChatCompletionChunk.model_validate(chunk)
+                for chunk in interaction["response"]
+            ]
+            return self._replay_stream(chunks, delay)
+        if delay:
+            await asyncio.sleep(delay)
+        if kind == "bedrock":
+            return OpenAIResponse(interaction["response"])
+        return ChatCompletion.model_validate(interaction["response"])
+
+    @staticmethod
+    async def _replay_stream(
+        chunks: List[ChatCompletionChunk], delay: float
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        # Spread the recorded latency over the chunks
+        step = delay / len(chunks) if chunks else 0.0
+        for chunk in chunks:
+            if step:
+                await asyncio.sleep(step)
+            yield chunk
+
+    async def _record(self, key: str, params: Dict[str, Any]):
+        start = time.monotonic()
+        response = self.client.chat.completions.create(**params)
+        if inspect.isawaitable(response):
+            response = await response
+        if hasattr(response, "__aiter__"):
+            return self._record_stream(key, params, response, start)
+        kind = "bedrock" if isinstance(response, OpenAIResponse) else "completion"
+        self._save(key, params, kind, _to_data(response), time.monotonic() - start)
+        return response
+
+    async def _record_stream(
+        self, key: str, params: Dict[str, Any], stream: Any, start: float
+    ) -> AsyncIterator[Any]:
+        chunks = []
+        async for chunk in stream:
+            chunks.append(_to_data(chunk))
+            yield chunk
+        self._save(key, params, "stream", chunks, time.monotonic() - start)
+
+    def _save(
+        self, key: str, params: Dict[str, Any], kind: str, response: Any, latency: float
+    ) -> None:
+        self.stats["recorded"] += 1
+        self.cassette.append(
+            {
+                "key": key,
+                "request": normalize_request(params),
+                "kind": kind,
+                "response": response,
+                "latency": latency,
+            }
+        )
+        logger.debug(f"Recorded LLM interaction {key[:12]} to {self.cassette.path}")
@@ -15,6 +15,20 @@ PROJECT_ROOT = get_project_root()
 WORKSPACE_ROOT = PROJECT_ROOT / "workspace"
 
 
+class EndpointSettings(BaseModel):
+    """One of several endpoints serving the same LLM config"""
+
+    base_url: str = Field(..., description="API base URL")
+    api_key: Optional[str] = Field(
+        None, description="API key (defaults to the config's api_key)"
+    )
+    api_version: Optional[str] = Field(
+        None, description="Azure Openai version (defaults to the config's api_version)"
+    )
+    weight: int = Field(1, description="Relative share of traffic")
+    name: Optional[str] = Field(None, description="Label used in endpoint stats")
+
+
 class LLMSettings(BaseModel):
     model: str = Field(..., description="Model name")
     base_url: str = Field(..., description="API base URL")
@@ -27,6 +41,86 @@ class LLMSettings(BaseModel):
     temperature: float = Field(1.0, description="Sampling temperature")
     api_type: str = Field(..., description="Azure, Openai, or Ollama")
     api_version: str = Field(..., description="Azure Openai version if AzureOpenai")
+    rpm_limit: Optional[int] = Field(
+        None, description="Requests per minute shared by all users of this config"
+    )
+    tpm_limit: Optional[int] = Field(
+        None, description="Tokens per minute shared by all users of this config"
+    )
+    endpoints: Optional[List[EndpointSettings]] = Field(
+        None, description="Endpoints to load balance across instead of base_url"
+    )
+    load_balancing: str = Field(
+        "least_outstanding",
+        description="Endpoint selection: least_outstanding or weighted_round_robin",
+    )
+    endpoint_failure_threshold: int = Field(
+        3, description="Consecutive failures before an endpoint is ejected"
+    )
+    endpoint_ejection_seconds: float = Field(
+        30.0, description="How long an ejected endpoint is skipped"
+    )
+    context_window_tokens: Optional[int] = Field(
+        None,
+        description="Per-request input token budget; old tool observations are condensed or dropped to fit (None to disable)",
+    )
+    context_keep_recent_turns: int = Field(
+        2, description="Most recent user turns never trimmed by the context window"
+    )
+    prompt_cache: bool = Field(
+        False,
+        description="Mark the system prompt, tools and history prefix as cacheable for providers that need explicit breakpoints",
+    )
+    hedge_percentile: Optional[float] = Field(
+        None,
+        description="Send a duplicate request when one is slower than this latency percentile of the model (None to disable)",
+    )
+    hedge_min_samples: int = Field(
+        20, description="Latency samples needed before requests are hedged"
+    )
+    token_estimate_threshold: Optional[int] = Field(
+        4000,
+        description="Texts of at least this many characters are estimated instead of encoded, None to always encode",
+    )
+    exact_count_margin: float = Field(
+        0.1,
+        description="Count exactly once a request comes within this share of max_input_tokens",
+    )
+    bedrock_max_concurrency: int = Field(
+        10, description="Concurrent Bedrock calls (worker threads and HTTP connections)"
+    )
+    stream_sink: str = Field(
+        "stdout", description="Default destination of streamed text: stdout or null"
+    )
+    stream_flush_interval: float = Field(
+        0.05, description="Seconds streamed text is buffered before it is written"
+    )
+    coalesce_requests: bool = Field(
+        True,
+        description="Share one call among identical concurrent temperature 0 requests",
+    )
+    retry_max_attempts: int = Field(
+        6, description="Attempts per call for retryable errors (1 disables retries)"
+    )
+    retry_max_seconds: float = Field(
+        120.0, description="Maximum time a call may spend retrying"
+    )
+    circuit_failure_threshold: int = Field(
+        5, description="Consecutive endpoint failures that open its circuit breaker"
+    )
+    circuit_reset_seconds: float = Field(
+        30.0, description="Seconds an open circuit fails fast before a trial call"
+    )
+    cassette: Optional[str] = Field(
+        None,
+        description="JSONL file of recorded requests/responses, relative to the project root (None to call the provider)",
+    )
+    cassette_mode: str = Field(
+        "replay", description="Cassette mode: record, replay or auto"
+    )
+    cassette_latency_scale: float = Field(
+        0.0, description="Share of the recorded latency injected on replay"
+    )
 
 
 class ProxySettings(BaseModel):
@@ -90,6 +184,148 @@ class SandboxSettings(BaseModel):
     )
 
 
+class LLMCacheSettings(BaseModel):
+    """Configuration for the LLM response cache"""
+
+    enabled: bool = Field(False, description="Whether to cache LLM responses")
+    memory_max_entries: int = Field(
+        256, description="Maximum number of responses kept in the in-memory tier"
+    )
+    disk_enabled: bool = Field(True, description="Whether to use the on-disk tier")
+    disk_path: str = Field(
+        "cache/llm_cache.sqlite3",
+        description="SQLite file for the on-disk tier, relative to the project root",
+    )
+    disk_max_bytes: int = Field(
+        256 * 1024 * 1024, description="Maximum size of the on-disk tier in bytes"
+    )
+    ttl: Optional[int] = Field(
+        7 * 24 * 3600, description="Entry time-to-live in seconds (None for no expiry)"
+    )
+    deterministic_only: bool = Field(
+        True, description="Only cache requests sampled with temperature 0"
+    )
+
+
+class LLMBatchSettings(BaseModel):
+    """Configuration for LLM.submit_batch"""
+
+    provider_batches: bool = Field(
+        True, description="Use the provider's batch API where it is available"
+    )
+    state_dir: str = Field(
+        "cache/batches",
+        description="Directory for batch job state, relative to the project root",
+    )
+    poll_interval: float = Field(
+        30.0, description="Seconds between provider batch status checks"
+    )
+    concurrency: int = Field(
+        8, description="Requests in flight when dispatching a batch concurrently"
+    )
+    save_interval: float = Field(
+        5.0,
+        description="Seconds between job state saves while dispatching concurrently",
+    )
+
+
+class ModelPrice(BaseModel):
+    """Model price in USD per million tokens"""
+
+    input: float = Field(..., description="Uncached prompt tokens")
+    output: float = Field(..., description="Completion tokens")
+    cached_input: Optional[float] = Field(
+        None, description="Prompt tokens served from cache (defaults to input)"
+    )
+    cache_write_input: Optional[float] = Field(
+        None, description="Prompt tokens written to the cache (defaults to input)"
+    )
+
+
+class UsageLedgerSettings(BaseModel):
+    """Configuration for the per-call usage ledger"""
+
+    enabled: bool = Field(True, description="Whether to record LLM usage per call")
+    max_records: int = Field(
+        100_000, description="Records kept in memory (oldest are dropped)"
+    )
+    export_path: Optional[str] = Field(
+        None,
+        description="JSONL file every record is appended to, relative to the project root",
+    )
+    export_interval: float = Field(
+        5.0,
+        description="Seconds between appends of buffered records to export_path",
+    )
+    prices: Dict[str, ModelPrice] = Field(
+        default_factory=dict,
+        description="Per-model prices, overriding the built-in table",
+    )
+
+
+class RouteRule(BaseModel):
+    """Send matching LLM sub-tasks to another [llm.<name>] config"""
+
+    config: str = Field(..., description="Name of the LLM config to use")
+    task: Optional[str] = Field(
+        None, description="Task kind (plan, summarize, extract, ...), None for any"
+    )
+    min_input_tokens: Optional[int] = Field(
+        None, description="Only requests with at least this many input tokens"
+    )
+    max_input_tokens: Optional[int] = Field(
+        None, description="Only requests with at most this many input tokens"
+    )
+    max_output_tokens: Optional[int] = Field(
+        None, description="Only calls expecting at most this many output tokens"
+    )
+
+
+class LLMRouterSettings(BaseModel):
+    """Configuration for routing LLM sub-tasks by call-site policy"""
+
+    rules: List[RouteRule] = Field(
+        default_factory=list, description="Checked in order, the first match wins"
+    )
+
+
+class ScreenshotSettings(BaseModel):
+    """Configuration for screenshots attached to agent memory"""
+
+    max_width: int = Field(1280, description="Screenshots are downscaled to fit")
+    max_height: int = Field(
+        2048, description="Taller (full page) screenshots are cropped to this height"
+    )
+    quality: int = Field(60, description="JPEG quality of recompressed screenshots")
+    dedupe_distance: Optional[int] = Field(
+        0,
+        description="Skip screenshots within this perceptual hash distance (0-256) of the last attached one, None to keep all",
+    )
+    keep_last: int = Field(
+        3, description="Images kept in memory; older ones become placeholders"
+    )
+
+
+class MemorySettings(BaseModel):
+    """Configuration for agent memory eviction"""
+
+    max_tokens: Optional[int] = Field(
+        None,
+        description="Token budget of an agent's memory, None to bound it by message count only",
+    )
+    summarize: bool = Field(
+        False,
+        description="Replace evicted messages with a rolling summary (routed as a summarize task)",
+    )
+    summary_max_tokens: int = Field(
+        500, description="Expected size of the summary, used for routing"
+    )
+    park_idle: bool = Field(
+        False,
+        description="Keep the memory of agents between runs in a compact message store",
+    )
+
+
 class AppConfig(BaseModel):
     llm: Dict[str, LLMSettings]
     sandbox: Optional[SandboxSettings] = Field(
@@ -101,6 +337,24 @@ class AppConfig(BaseModel):
     search_config: Optional[SearchSettings] = Field(
         None, description="Search configuration"
     )
+    llm_cache: LLMCacheSettings = Field(
+        default_factory=LLMCacheSettings, description="LLM response cache configuration"
+    )
+    llm_batch: LLMBatchSettings = Field(
+        default_factory=LLMBatchSettings, description="LLM batch mode configuration"
+    )
+    usage_ledger: UsageLedgerSettings = Field(
+        default_factory=UsageLedgerSettings, description="Usage ledger configuration"
+    )
+    screenshots: ScreenshotSettings = Field(
+        default_factory=ScreenshotSettings, description="Screenshot configuration"
+    )
+    llm_router: LLMRouterSettings = Field(
+        default_factory=LLMRouterSettings, description="LLM router configuration"
+    )
+    memory: MemorySettings = Field(
+        default_factory=MemorySettings, description="Agent memory configuration"
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -158,6 +412,32 @@ class Config:
             "temperature": base_llm.get("temperature", 1.0),
             "api_type": base_llm.get("api_type", ""),
             "api_version": base_llm.get("api_version", ""),
+            "rpm_limit": base_llm.get("rpm_limit"),
+            "tpm_limit": base_llm.get("tpm_limit"),
+            "endpoints": base_llm.get("endpoints"),
+            "load_balancing": base_llm.get("load_balancing", "least_outstanding"),
+            "endpoint_failure_threshold": base_llm.get("endpoint_failure_threshold", 3),
+            "endpoint_ejection_seconds": base_llm.get(
+                "endpoint_ejection_seconds", 30.0
+            ),
+            "context_window_tokens": base_llm.get("context_window_tokens"),
+            "context_keep_recent_turns": base_llm.get("context_keep_recent_turns", 2),
+            "prompt_cache": base_llm.get("prompt_cache", False),
+            "hedge_percentile": base_llm.get("hedge_percentile"),
+            "hedge_min_samples": base_llm.get("hedge_min_samples", 20),
+            "token_estimate_threshold": base_llm.get("token_estimate_threshold", 4000),
+            "exact_count_margin": base_llm.get("exact_count_margin", 0.1),
+            "bedrock_max_concurrency": base_llm.get("bedrock_max_concurrency", 10),
+            "stream_sink": base_llm.get("stream_sink", "stdout"),
+            "stream_flush_interval": base_llm.get("stream_flush_interval", 0.05),
+            "coalesce_requests": base_llm.get("coalesce_requests", True),
+            "retry_max_attempts": base_llm.get("retry_max_attempts", 6),
+            "retry_max_seconds": base_llm.get("retry_max_seconds", 120.0),
+            "circuit_failure_threshold": base_llm.get("circuit_failure_threshold", 5),
+            "circuit_reset_seconds": base_llm.get("circuit_reset_seconds", 30.0),
+            "cassette": base_llm.get("cassette"),
+            "cassette_mode": base_llm.get("cassette_mode", "replay"),
+            "cassette_latency_scale": base_llm.get("cassette_latency_scale", 0.0),
         }
 
         # handle browser config.
@@ -202,6 +482,15 @@ class Config:
             sandbox_settings = SandboxSettings(**sandbox_config)
         else:
             sandbox_settings = SandboxSettings()
+        llm_cache_config = raw_config.get("llm_cache", {})
+        llm_cache_settings = LLMCacheSettings(**llm_cache_config)
+        llm_batch_settings = LLMBatchSettings(**raw_config.get("llm_batch", {}))
+        usage_ledger_settings = UsageLedgerSettings(
+            **raw_config.get("usage_ledger", {})
+        )
+        screenshot_settings = ScreenshotSettings(**raw_config.get("screenshots", {}))
+        llm_router_settings = LLMRouterSettings(**raw_config.get("llm_router", {}))
+        memory_settings = MemorySettings(**raw_config.get("memory", {}))
 
         config_dict = {
             "llm": {
@@ -214,6 +503,12 @@ class Config:
             "sandbox": sandbox_settings,
             "browser_config": browser_settings,
             "search_config": search_settings,
+            "llm_cache": llm_cache_settings,
+            "llm_batch": llm_batch_settings,
+            "usage_ledger": usage_ledger_settings,
+            "screenshots": screenshot_settings,
+            "llm_router": llm_router_settings,
+            "memory": memory_settings,
         }
 
         self._config = AppConfig(**config_dict)
@@ -234,6 +529,30 @@ class Config:
     def search_config(self) -> Optional[SearchSettings]:
         return self._config.search_config
 
+    @property
+    def llm_cache(self) -> LLMCacheSettings:
+        return self._config.llm_cache
+
+    @property
+    def llm_batch(self) -> LLMBatchSettings:
+        return self._config.llm_batch
+
+    @property
+    def usage_ledger(self) -> UsageLedgerSettings:
+        return self._config.usage_ledger
+
+    @property
+    def screenshots(self) -> ScreenshotSettings:
+        return self._config.screenshots
+
+    @property
+    def llm_router(self) -> LLMRouterSettings:
+        return self._config.llm_router
+
+    @property
+    def memory(self) -> MemorySettings:
+        return self._config.memory
+
     @property
     def workspace_root(self) -> Path:
         """Get the workspace root directory"""
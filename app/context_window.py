@@ -0,0 +1,159 @@
+"""Fit a conversation into a per-request token budget.
+
+`ContextWindow` sits between an agent's `Memory` and `LLM.format_messages`.
+Instead of letting the prompt grow until the provider (or
+`TokenLimitExceeded`) stops the agent, it condenses and then drops the
+oldest tool observations. System messages and the most recent turns are
+never touched, and an assistant message with ``tool_calls`` is always
+kept or dropped together with its tool results.
+"""
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.logger import logger
+from app.schema import Message, Role
+
+
+class ContextWindow(BaseModel):
+    max_tokens: int = Field(..., description="Token budget for the messages")
+    keep_recent_turns: int = Field(
+        2, description="Number of most recent user turns that are never modified"
+    )
+    condensed_chars: int = Field(
+        500, description="Characters of an old observation kept when condensing"
+    )
+
+    @staticmethod
+    def group_messages(messages: List[Message]) -> List[List[Message]]:
+        """Split messages into atomic groups.
+
+        An assistant message with tool calls forms one group together with
+        the tool messages answering it; every other message is its own group.
+        """
+        groups: List[List[Message]] = []
+        pending_ids: set = set()
+        for message in messages:
+            if message.role == Role.TOOL and message.tool_call_id in pending_ids:
+                groups[-1].append(message)
+                continue
+            groups.append([message])
+            pending_ids = (
+                {call.id for call in message.tool_calls}
+                if message.role == Role.ASSISTANT and message.tool_calls
+                else set()
+            )
+        return groups
+
+    def _protected_from(self, groups: List[List[Message]]) -> int:
+        """Index of the first group belonging to the most recent turns"""
+        turns = 0
+        for index in range(len(groups) - 1, -1, -1):
+            if groups[index][0].role == Role.USER:
+                turns += 1
+                if turns >= self.keep_recent_turns:
+                    return index
+        return 0
+
+    @staticmethod
+    def count(message: Message, token_counter) -> int:
+        tokens = token_counter.count_single_message(message.to_dict())
+        if message.base64_image:
+            tokens += token_counter.count_image({"detail": "medium"})
+        return tokens
+
+    def condense(self, message: Message) -> Message:
+        """Shorten an old tool observation and drop its screenshot"""
+        content = message.content or ""
+        if len(content) > self.condensed_chars:
+            omitted = len(content) - self.condensed_chars
+            content = (
+                f"{content[: self.condensed_chars]}\n"
+                f"...[observation condensed, {omitted} characters omitted]"
+            )
+        return message.model_copy(update={"content": content, "base64_image": None})
+
+    @staticmethod
+    def _omission_note(dropped: int) -> Message:
+        return Message.user_message(
+            f"[{dropped} earlier messages omitted to fit the context window]"
+        )
+
+    def fit(
+        self,
+        messages: List[Message],
+        token_counter,
+        reserved_tokens: int = 0,
+    ) -> List[Message]:
+        """Return messages that fit in max_tokens minus reserved_tokens.
+
+        Memory itself is not modified; condensed messages are copies.
+
+        Args:
+            messages: Conversation history, oldest first
+            token_counter: `TokenCounter` used to measure messages
+            reserved_tokens: Tokens already taken by the system prompt and tools
+        """
+        budget = self.max_tokens - reserved_tokens
+        counts = [self.count(message, token_counter) for message in messages]
+        total = sum(counts)
+        if total <= budget:
+            return messages
+
+        groups = self.group_messages(messages)
+        protected_from = self._protected_from(groups)
+        group_counts: List[List[int]] = []
+        position = 0
+        for group in groups:
+            group_counts.append(counts[position : position + len(group)])
+            position += len(group)
+
+        def evictable(index: int) -> bool:
+            return index < protected_from and groups[index][0].role != Role.SYSTEM
+
+        # First pass: condense the oldest tool observations
+        for index, group in enumerate(groups):
+            if total <= budget:
+                break
+            if not evictable(index):
+                continue
+            for offset, message in enumerate(group):
+                if message.role != Role.TOOL:
+                    continue
+                condensed = self.condense(message)
+                new_count = self.count(condensed, token_counter)
+                total -= group_counts[index][offset] - new_count
+                group[offset] = condensed
+                group_counts[index][offset] = new_count
+
+        # Second pass: drop the oldest groups entirely, leaving a short note
+        dropped = 0
+        kept: List[Optional[List[Message]]] = list(groups)
+        for index in range(len(groups)):
+            if total <= budget:
+                break
+            if not evictable(index):
+                continue
+            if not dropped:
+                total += self.count(self._omission_note(len(messages)), token_counter)
+            total -= sum(group_counts[index])
+            dropped += len(groups[index])
+            kept[index] = None
+
+        if total > budget:
+            logger.warning(
+                f"Context still exceeds its budget after trimming ({total} > {budget} tokens)"
+            )
+
+        result: List[Message] = []
+        note_added = False
+        for group in kept:
+            if group is None:
+                if not note_added:
+                    result.append(self._omission_note(dropped))
+                    note_added = True
+                continue
+            result.extend(group)
+        if dropped:
+            logger.info(f"Context window dropped {dropped} old messages")
+        return result
@@ -0,0 +1,324 @@
+"""Load balancing and failover across several endpoints of one LLM config.
+
+Each ``[llm.*]`` config may list several ``endpoints`` (API keys, regional
+deployments). Requests go to the endpoint picked by the configured strategy;
+endpoints that keep failing are ejected for a cool-down period and the
+request fails over to the next healthy one. A throttled endpoint is not
+ejected: it is skipped for the ``Retry-After`` it asked for, and when every
+endpoint is throttled the error is left to the retry policy's backoff.
+"""
+import functools
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AuthenticationError,
+    PermissionDeniedError,
+    RateLimitError,
+)
+
+from app.logger import logger
+from app.retry_policy import get_retry_after, is_outage, is_throttled
+
+
+LEAST_OUTSTANDING = "least_outstanding"
+WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+STRATEGIES = (LEAST_OUTSTANDING, WEIGHTED_ROUND_ROBIN)
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Whether an error says something about the endpoint rather than the request.
+
+    Connection problems, timeouts, throttling, bad credentials and 5xx
+    responses trigger failover, and all but throttling count towards
+    ejecting the endpoint; other 4xx errors would fail the same way
+    everywhere and are raised as-is.
+    """
+    if isinstance(
+        error,
+        (
+            APIConnectionError,
+            APITimeoutError,
+            RateLimitError,
+            AuthenticationError,
+            PermissionDeniedError,
+        ),
+    ):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+class Endpoint:
+    """One upstream endpoint with its client, load and health state"""
+
+    def __init__(self, name: str, client: Any, weight: int = 1):
+        self.name = name
+        self.client = client
+        self.weight = max(1, weight)
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        # Skipped until then, as asked by a throttling response's Retry-After
+        self.throttled_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.latency_min: Optional[float] = None
+        self.latency_max: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Running weight for smooth weighted round-robin
+        self.current_weight = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def available_at(self) -> float:
+        """When the endpoint is neither ejected nor backing off from throttling"""
+        return max(self.ejected_until, self.throttled_until)
+
+    def record_latency(self, latency: float, alpha: float = 0.2) -> None:
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_ewma = (
+            latency
+            if self.latency_ewma is None
+            else alpha * latency + (1 - alpha) * self.latency_ewma
+        )
+        self.latency_min = (
+            latency if self.latency_min is None else min(self.latency_min, latency)
+        )
+        self.latency_max = (
+            latency if self.latency_max is None else max(self.latency_max, latency)
+        )
+
+    def get_stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "healthy": self.is_healthy(now),
+            "latency_avg": (
+                self.latency_total / self.latency_count if self.latency_count else None
+            ),
+            "latency_ewma": self.latency_ewma,
+            "latency_min": self.latency_min,
+            "latency_max": self.latency_max,
+            "last_error": self.last_error,
+        }
+
+
+class OutstandingStream:
+    """A streamed response that counts as outstanding on its endpoint.
+
+    The endpoint's slot is released once the stream is exhausted, fails or
+    is closed, rather than when the provider starts responding. ``on_done``
+    is called with None when the stream is exhausted and with the error when
+    reading it fails.
+    """
+
+    def __init__(
+        self,
+        stream: Any,
+        endpoint: Endpoint,
+        on_done: Optional[Callable[[Optional[BaseException]], None]] = None,
+    ):
+        self._stream = stream
+        self._endpoint: Optional[Endpoint] = endpoint
+        self._on_done = on_done
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            if self._on_done is not None:
+                self._on_done(e)
+            raise
+        else:
+            if self._on_done is not None:
+                self._on_done(None)
+        finally:
+            self._release()
+
+    async def close(self) -> None:
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            self._release()
+
+    async def __aenter__(self) -> "OutstandingStream":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __del__(self):
+        # A stream dropped without being read must not hold its slot forever
+        self._release()
+
+    def _release(self) -> None:
+        if self._endpoint is not None:
+            self._endpoint.outstanding -= 1
+            self._endpoint = None
+
+
+class EndpointPool:
+    """Pick, health-track and fail over between the endpoints of one config"""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        strategy: str = LEAST_OUTSTANDING,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool requires at least one endpoint")
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Invalid load balancing strategy: {strategy}. Use one of {STRATEGIES}"
+            )
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self._clock = clock
+        self._rotation = 0
+
+    def select(self, exclude: Optional[set] = None) -> Endpoint:
+        """Pick an endpoint, skipping excluded names and ejected endpoints.
+
+        If every candidate is ejected or throttled, the one available first
+        is used so requests keep flowing instead of failing outright.
+        """
+        exclude = exclude or set()
+        now = self._clock()
+        candidates = [e for e in self.endpoints if e.name not in exclude]
+        if not candidates:
+            raise RuntimeError("No endpoints left to try")
+        healthy = [e for e in candidates if e.available_at() <= now]
+        if not healthy:
+            return min(candidates, key=lambda e: e.available_at())
+
+        if self.strategy == WEIGHTED_ROUND_ROBIN:
+            # Smooth weighted round-robin (as used by nginx)
+            total = sum(e.weight for e in healthy)
+            for endpoint in healthy:
+                endpoint.current_weight += endpoint.weight
+            chosen = max(healthy, key=lambda e: e.current_weight)
+            chosen.current_weight -= total
+            return chosen
+
+        # Least outstanding requests per unit of weight; rotate among ties
+        self._rotation += 1
+        return min(
+            healthy,
+            key=lambda e: (
+                e.outstanding / e.weight,
+                (self.endpoints.index(e) - self._rotation) % len(self.endpoints),
+            ),
+        )
+
+    def record_success(self, endpoint: Endpoint, latency: float) -> None:
+        endpoint.consecutive_failures = 0
+        endpoint.ejected_until = 0.0
+        endpoint.record_latency(latency)
+
+    def record_throttle(self, endpoint: Endpoint, error: BaseException) -> None:
+        """Back off from a throttled endpoint for its Retry-After, without ejecting it"""
+        endpoint.throttled += 1
+        endpoint.last_error = f"{type(error).__name__}: {error}"
+        endpoint.throttled_until = self._clock() + (get_retry_after(error) or 0.0)
+
+    def record_stream_end(
+        self, endpoint: Endpoint, error: Optional[BaseException]
+    ) -> None:
+        """Count a stream that failed mid-response against its endpoint"""
+        if error is None:
+            endpoint.consecutive_failures = 0
+            endpoint.ejected_until = 0.0
+        elif is_outage(error):
+            self.record_failure(endpoint, error)
+
+    def record_failure(self, endpoint: Endpoint, error: BaseException) -> None:
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        endpoint.last_error = f"{type(error).__name__}: {error}"
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.ejected_until = self._clock() + self.ejection_seconds
+            logger.warning(
+                f"Ejecting LLM endpoint {endpoint.name} for {self.ejection_seconds}s "
+                f"after {endpoint.consecutive_failures} consecutive failures"
+            )
+
+    async def create_completion(self, **params) -> Any:
+        """Send a chat completion, failing over across endpoints.
+
+        Latency is measured until the provider responds, i.e. until the
+        first byte of a streamed response. A streamed response keeps its
+        endpoint's request outstanding until it has been read or closed, and
+        only counts as a success once it has been read to the end.
+        """
+        tried = set()
+        last_error: Optional[BaseException] = None
+        for _ in range(len(self.endpoints)):
+            endpoint = self.select(exclude=tried)
+            tried.add(endpoint.name)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            start = self._clock()
+            held = False
+            try:
+                response = await endpoint.client.chat.completions.create(**params)
+                if params.get("stream"):
+                    response = OutstandingStream(
+                        response,
+                        endpoint,
+                        functools.partial(self.record_stream_end, endpoint),
+                    )
+                    held = True
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                if is_throttled(e):
+                    self.record_throttle(endpoint, e)
+                else:
+                    self.record_failure(endpoint, e)
+                last_error = e
+                logger.warning(
+                    f"LLM endpoint {endpoint.name} failed, failing over: {e}"
+                )
+                continue
+            finally:
+                if not held:
+                    endpoint.outstanding -= 1
+            if held:
+                endpoint.record_latency(self._clock() - start)
+            else:
+                self.record_success(endpoint, self._clock() - start)
+            return response
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint load, health and latency figures"""
+        now = self._clock()
+        return {endpoint.name: endpoint.get_stats(now) for endpoint in self.endpoints}
@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class ToolError(Exception):
     """Raised when a tool encounters an error."""
 
@@ -11,3 +14,20 @@ class OpenManusError(Exception):
 
 class TokenLimitExceeded(OpenManusError):
     """Exception raised when the token limit is exceeded"""
+
+
+class BatchRequestError(OpenManusError):
+    """Exception raised when a request in an LLM batch fails"""
+
+
+class CassetteMissError(OpenManusError):
+    """Exception raised when a replayed request is not in the LLM cassette"""
+
+
+class CircuitOpenError(OpenManusError):
+    """Exception raised when an LLM endpoint's circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # Seconds until the breaker lets a trial call through, if known
+        self.retry_after = retry_after
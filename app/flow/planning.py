@@ -9,8 +9,10 @@ from app.agent.base import BaseAgent
 from app.flow.base import BaseFlow
 from app.llm import LLM
 from app.logger import logger
+from app.router import PLAN, SUMMARIZE, get_model_router
 from app.schema import AgentState, Message, ToolChoice
 from app.tool import PlanningTool
+from app.usage_ledger import usage_scope
 
 
 class PlanStepStatus(str, Enum):
@@ -93,6 +95,11 @@ class PlanningFlow(BaseFlow):
 
     async def execute(self, input_text: str) -> str:
         """Execute the planning flow with agents."""
+        with usage_scope(flow=type(self).__name__, plan_id=self.active_plan_id):
+            return await self._execute(input_text)
+
+    async def _execute(self, input_text: str) -> str:
+        """Run the plan steps with agents; see `execute`."""
         try:
             if not self.primary_agent:
                 raise ValueError("No primary agent available")
@@ -149,12 +156,18 @@ class PlanningFlow(BaseFlow):
             f"Create a reasonable plan with clear steps to accomplish the task: {request}"
         )
 
-        # Call LLM with PlanningTool
-        response = await self.llm.ask_tool(
-            messages=[user_message],
-            system_msgs=[system_message],
-            tools=[self.planning_tool.to_param()],
-            tool_choice=ToolChoice.AUTO,
+        # Call LLM with PlanningTool, on the config routed for planning
+        response = await get_model_router().run(
+            PLAN,
+            lambda llm: llm.ask_tool(
+                messages=[user_message],
+                system_msgs=[system_message],
+                tools=[self.planning_tool.to_param()],
+                tool_choice=ToolChoice.AUTO,
+            ),
+            default=self.llm,
+            messages=[system_message, user_message],
+            expected_output_tokens=500,
         )
 
         # Process tool calls if present
@@ -275,7 +288,8 @@ class PlanningFlow(BaseFlow):
 
         # Use agent.run() to execute the step
         try:
-            step_result = await executor.run(step_prompt)
+            with usage_scope(plan_step=self.current_step_index):
+                step_result = await executor.run(step_prompt)
 
             # Mark the step as completed after successful execution
             await self._mark_step_completed()
@@ -399,8 +413,14 @@ class PlanningFlow(BaseFlow):
                 f"The plan has been completed. Here is the final plan status:\n\n{plan_text}\n\nPlease provide a summary of what was accomplished and any final thoughts."
             )
 
-            response = await self.llm.ask(
-                messages=[user_message], system_msgs=[system_message]
+            response = await get_model_router().run(
+                SUMMARIZE,
+                lambda llm: llm.ask(
+                    messages=[user_message], system_msgs=[system_message]
+                ),
+                default=self.llm,
+                messages=[system_message, user_message],
+                expected_output_tokens=500,
             )
 
             return f"Plan completed:\n\n{response}"
@@ -0,0 +1,155 @@
+"""Hedged LLM requests for tail-latency control.
+
+When a request has not returned within a chosen percentile of the model's
+recent latencies, a duplicate is sent (to another endpoint when the config
+has an endpoint pool). Whichever response arrives first is used and the
+other request is cancelled, so only the winner's usage is accounted.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.logger import logger
+
+
+class LatencyTracker:
+    """Sliding window of recent request latencies for one model"""
+
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Nearest-rank percentile (0-100) of the window, None if empty"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    def tail_mean(self, threshold: float) -> Optional[float]:
+        """Mean latency of the requests slower than threshold"""
+        tail = [sample for sample in self.samples if sample > threshold]
+        return sum(tail) / len(tail) if tail else None
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(model: str) -> LatencyTracker:
+    """Return the latency window shared by every LLM using model"""
+    with _trackers_lock:
+        tracker = _trackers.get(model)
+        if tracker is None:
+            tracker = _trackers[model] = LatencyTracker()
+        return tracker
+
+
+class HedgePolicy:
+    """Send a duplicate request once the first one is slower than a percentile.
+
+    Hedging only starts once ``min_samples`` latencies have been seen for
+    the model. Latency saved by a winning hedge is estimated against the
+    mean of past requests slower than the hedge delay, as the cancelled
+    original's own latency is never observed. Its elapsed time is recorded
+    instead, as a lower bound, so slow requests keep their weight in the
+    percentile rather than being replaced by the hedges' short latencies.
+    """
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError(
+                f"Hedge percentile must be between 0 and 100: {percentile}"
+            )
+        self.tracker = tracker
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._clock = clock
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "latency_saved": 0.0,
+        }
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None until enough samples exist"""
+        if len(self.tracker) < self.min_samples:
+            return None
+        return self.tracker.percentile(self.percentile)
+
+    async def run(self, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Run send, hedging it with a second call to send if it is slow"""
+        self.stats["requests"] += 1
+        delay = self.delay()
+        start = self._clock()
+        primary = asyncio.create_task(send())
+        if delay is None:
+            result = await primary
+            self.tracker.record(self._clock() - start)
+            return result
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            result = primary.result()
+            self.tracker.record(self._clock() - start)
+            return result
+
+        self.stats["hedged"] += 1
+        hedge = asyncio.create_task(send())
+        logger.debug(f"Hedging LLM request after {delay:.2f}s")
+        pending = {primary, hedge}
+        errors: List[BaseException] = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((task for task in done if task.exception() is None), None)
+                errors.extend(
+                    task.exception() for task in done if task.exception() is not None
+                )
+                if winner is None:
+                    continue
+                now = self._clock()
+                if winner is hedge:
+                    self.stats["hedge_wins"] += 1
+                    expected = self.tracker.tail_mean(delay)
+                    if expected is not None:
+                        self.stats["latency_saved"] += max(
+                            0.0, expected - (now - start)
+                        )
+                # The primary took at least this long, whichever task won
+                self.tracker.record(now - start)
+                return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise errors[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "hedge_rate": self.stats["hedged"] / requests if requests else 0.0,
+            "delay": self.delay(),
+            "samples": len(self.tracker),
+        }
@@ -1,5 +1,15 @@
+import asyncio
+import copy
+import functools
 import math
-from typing import Dict, List, Optional, Union
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple, Union
 
 import tiktoken
 from openai import (
@@ -11,24 +21,50 @@ from openai import (
     RateLimitError,
 )
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
-)
 
+from app.batch import (
+    CONCURRENT,
+    PROVIDER,
+    BatchJob,
+    BatchRequest,
+    get_state_dir,
+    provider_batch_endpoint,
+    run_concurrent_batch,
+    run_provider_batch,
+    submit_provider_batch,
+)
 from app.bedrock import BedrockClient
-from app.config import LLMSettings, config
+from app.cassette import REPLAY, CassetteClient
+from app.config import PROJECT_ROOT, LLMSettings, config
+from app.context_window import ContextWindow
+from app.endpoint_pool import Endpoint, EndpointPool
 from app.exceptions import TokenLimitExceeded
+from app.hedging import HedgePolicy, get_latency_tracker
+from app.llm_cache import get_response_cache, make_cache_key
 from app.logger import logger  # Assuming a logger is set up in your app
+from app.prompt_cache import (
+    add_cache_breakpoint,
+    add_tools_breakpoint,
+    get_cache_style,
+    get_cache_write_tokens,
+    get_cached_tokens,
+    uses_breakpoints,
+)
+from app.rate_limiter import RateLimiter, get_rate_limiter
+from app.retry_policy import RetryPolicy, get_circuit_breaker, is_outage, with_retries
 from app.schema import (
     ROLE_VALUES,
     TOOL_CHOICE_TYPE,
     TOOL_CHOICE_VALUES,
     Message,
     ToolChoice,
+    format_message_dict,
 )
+from app.single_flight import SingleFlight
+from app.stream_sink import StreamSink, current_stream_sink, make_stream_sink, stream_to
+from app.streaming import ToolCallAssembler, ToolCallCallback, notify_tool_call
+from app.token_estimator import TokenEstimator, last_estimate
+from app.usage_ledger import get_usage_ledger
 
 
 REASONING_MODELS = ["o1", "o3-mini"]
@@ -54,12 +90,41 @@ class TokenCounter:
     HIGH_DETAIL_TARGET_SHORT_SIDE = 768
     TILE_SIZE = 512
 
-    def __init__(self, tokenizer):
+    # Per-message memo size (0 disables memoization)
+    MESSAGE_CACHE_SIZE = 4096
+
+    def __init__(
+        self,
+        tokenizer,
+        cache_size: Optional[int] = None,
+        estimator: Optional[TokenEstimator] = None,
+    ):
         self.tokenizer = tokenizer
+        self.cache_size = self.MESSAGE_CACHE_SIZE if cache_size is None else cache_size
+        # Estimates long texts instead of encoding them, None to always encode
+        self.estimator = estimator
+        # Memo of message key -> (encoded tokens, estimated bytes), so cached
+        # messages follow the estimator's latest calibration
+        self._message_cache: "OrderedDict[Hashable, Tuple[int, int]]" = OrderedDict()
+        self._exact = False
+        self._estimated_bytes = 0
+        self._estimated_tokens = 0
 
     def count_text(self, text: str) -> int:
         """Calculate tokens for a text string"""
-        return 0 if not text else len(self.tokenizer.encode(text))
+        if not text:
+            return 0
+        if (
+            self.estimator is not None
+            and not self._exact
+            and self.estimator.should_estimate(text)
+        ):
+            n_bytes = self.estimator.measure(text)
+            tokens = self.estimator.tokens_for(n_bytes)
+            self._estimated_bytes += n_bytes
+            self._estimated_tokens += tokens
+            return tokens
+        return len(self.tokenizer.encode(text))
 
     def count_image(self, image_item: dict) -> int:
         """
@@ -151,44 +216,161 @@ class TokenCounter:
                 token_count += self.count_text(function.get("arguments", ""))
         return token_count
 
-    def count_message_tokens(self, messages: List[dict]) -> int:
-        """Calculate the total number of tokens in a message list"""
-        total_tokens = self.FORMAT_TOKENS  # Base format tokens
+    @staticmethod
+    def _message_key(message: dict) -> Optional[Hashable]:
+        """Build a hashable key identifying the token-relevant parts of a message.
 
-        for message in messages:
-            tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+        Message contents are usually the very same string objects on every
+        step, so hashing and comparing the key is cheap compared to encoding.
+        """
+        content = message.get("content")
+        if isinstance(content, list):
+            items = []
+            for item in content:
+                if isinstance(item, str):
+                    items.append(item)
+                elif isinstance(item, dict) and "text" in item:
+                    items.append(("text", item["text"]))
+                elif isinstance(item, dict) and "image_url" in item:
+                    image_url = item["image_url"]
+                    if isinstance(image_url, dict):
+                        image_url = image_url.get("url")
+                    items.append(
+                        (
+                            "image",
+                            image_url,
+                            item.get("detail"),
+                            tuple(item.get("dimensions") or ()),
+                        )
+                    )
+                else:
+                    return None
+            content = tuple(items)
+        elif content is not None and not isinstance(content, str):
+            return None
+
+        tool_calls = message.get("tool_calls")
+        if tool_calls is not None:
+            tool_calls = tuple(
+                (
+                    call.get("function", {}).get("name"),
+                    call.get("function", {}).get("arguments"),
+                )
+                for call in tool_calls
+            )
 
-            # Add role tokens
-            tokens += self.count_text(message.get("role", ""))
+        return (
+            message.get("role"),
+            "content" in message,
+            content,
+            tool_calls,
+            message.get("name"),
+            message.get("tool_call_id"),
+        )
 
-            # Add content tokens
-            if "content" in message:
-                tokens += self.count_content(message["content"])
+    def count_single_message(self, message: dict) -> int:
+        """Calculate the tokens of one message, memoized by message content"""
+        exact_tokens, estimated_bytes = self._measure_message(message)
+        if not estimated_bytes:
+            return exact_tokens
+        estimated_tokens = self.estimator.tokens_for(estimated_bytes)
+        self._estimated_bytes += estimated_bytes
+        self._estimated_tokens += estimated_tokens
+        return exact_tokens + estimated_tokens
+
+    def _measure_message(self, message: dict) -> Tuple[int, int]:
+        """Return (encoded tokens, estimated bytes) of one message"""
+        key = self._message_key(message) if self.cache_size > 0 else None
+        if key is not None:
+            cached = self._message_cache.get(key)
+            if cached is not None and not (self._exact and cached[1]):
+                self._message_cache.move_to_end(key)
+                return cached
+
+        outer = self._estimated_bytes, self._estimated_tokens
+        self._estimated_bytes = self._estimated_tokens = 0
+        tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+
+        # Add role tokens
+        tokens += self.count_text(message.get("role", ""))
+
+        # Add content tokens
+        if "content" in message:
+            tokens += self.count_content(message["content"])
+
+        # Add tool calls tokens
+        if "tool_calls" in message:
+            tokens += self.count_tool_calls(message["tool_calls"])
+
+        # Add name and tool_call_id tokens
+        tokens += self.count_text(message.get("name", ""))
+        tokens += self.count_text(message.get("tool_call_id", ""))
+
+        measured = (tokens - self._estimated_tokens, self._estimated_bytes)
+        self._estimated_bytes, self._estimated_tokens = outer
+
+        # Exact recounts of estimated messages are not memoized, the estimate
+        # is what later calibration applies to
+        if key is not None and not (self._exact and key in self._message_cache):
+            self._message_cache[key] = measured
+            if len(self._message_cache) > self.cache_size:
+                self._message_cache.popitem(last=False)
+
+        return measured
+
+    def count_message_tokens(self, messages: List[dict], exact: bool = False) -> int:
+        """Calculate the total number of tokens in a message list.
+
+        Each message is only encoded the first time it is seen, so counting a
+        growing conversation costs O(new tokens) per step. With an estimator,
+        long texts are estimated unless exact is set; the estimated share of
+        the count is kept for `calibrate`.
+        """
+        total_tokens = self.FORMAT_TOKENS  # Base format tokens
 
-            # Add tool calls tokens
-            if "tool_calls" in message:
-                tokens += self.count_tool_calls(message["tool_calls"])
+        self._exact = exact
+        self._estimated_bytes = self._estimated_tokens = 0
+        try:
+            for message in messages:
+                total_tokens += self.count_single_message(message)
+            last_estimate.set((self._estimated_bytes, self._estimated_tokens))
+        finally:
+            self._exact = False
+            self._estimated_bytes = self._estimated_tokens = 0
 
-            # Add name and tool_call_id tokens
-            tokens += self.count_text(message.get("name", ""))
-            tokens += self.count_text(message.get("tool_call_id", ""))
+        return total_tokens
 
-            total_tokens += tokens
+    def calibrate(self, counted_tokens: int, prompt_tokens: int) -> None:
+        """Calibrate the estimator against the provider's prompt token count.
 
-        return total_tokens
+        counted_tokens is the local count of the same request, made by the
+        last `count_message_tokens` call in the current task.
+        """
+        estimated_bytes, estimated_tokens = last_estimate.get()
+        if self.estimator is not None and estimated_bytes:
+            self.estimator.calibrate(
+                counted_tokens, prompt_tokens, estimated_bytes, estimated_tokens
+            )
+        last_estimate.set((0, 0))
+
+    def clear_cache(self) -> None:
+        """Drop all memoized message counts"""
+        self._message_cache.clear()
 
 
 class LLM:
     _instances: Dict[str, "LLM"] = {}
+    _instances_lock = threading.Lock()
 
     def __new__(
         cls, config_name: str = "default", llm_config: Optional[LLMSettings] = None
     ):
-        if config_name not in cls._instances:
-            instance = super().__new__(cls)
-            instance.__init__(config_name, llm_config)
-            cls._instances[config_name] = instance
-        return cls._instances[config_name]
+        with cls._instances_lock:
+            if config_name not in cls._instances:
+                instance = super().__new__(cls)
+                instance.__init__(config_name, llm_config)
+                cls._instances[config_name] = instance
+            return cls._instances[config_name]
 
     def __init__(
         self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
@@ -196,6 +378,7 @@ class LLM:
         if not hasattr(self, "client"):  # Only initialize if not already initialized
             llm_config = llm_config or config.llm
             llm_config = llm_config.get(config_name, llm_config["default"])
+            self.config_name = config_name
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
             self.temperature = llm_config.temperature
@@ -207,6 +390,8 @@ class LLM:
             # Add token counting related attributes
             self.total_input_tokens = 0
             self.total_completion_tokens = 0
+            self.total_cached_tokens = 0
+            self.total_cache_write_tokens = 0
             self.max_input_tokens = (
                 llm_config.max_input_tokens
                 if hasattr(llm_config, "max_input_tokens")
@@ -220,18 +405,131 @@ class LLM:
                 # If the model is not in tiktoken's presets, use cl100k_base as default
                 self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
-            if self.api_type == "azure":
+            if llm_config.cassette and llm_config.cassette_mode == REPLAY:
+                # Replay needs no provider client (nor credentials)
+                self.client = None
+            elif self.api_type == "azure":
                 self.client = AsyncAzureOpenAI(
                     base_url=self.base_url,
                     api_key=self.api_key,
                     api_version=self.api_version,
                 )
             elif self.api_type == "aws":
-                self.client = BedrockClient()
+                self.client = BedrockClient(llm_config.bedrock_max_concurrency)
             else:
                 self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
 
-            self.token_counter = TokenCounter(self.tokenizer)
+            if llm_config.cassette:
+                # Record or replay requests instead of (only) calling the provider
+                cassette_path = Path(llm_config.cassette)
+                self.client = CassetteClient(
+                    (
+                        cassette_path
+                        if cassette_path.is_absolute()
+                        else PROJECT_ROOT / cassette_path
+                    ),
+                    mode=llm_config.cassette_mode,
+                    client=self.client,
+                    latency_scale=llm_config.cassette_latency_scale,
+                )
+                self.endpoint_pool = None
+            else:
+                # Optional pool of endpoints to load balance and fail over across
+                self.endpoint_pool = self._build_endpoint_pool(llm_config)
+
+            # Long texts are estimated from their size, calibrated on usage
+            self.token_counter = TokenCounter(
+                self.tokenizer,
+                estimator=(
+                    TokenEstimator(llm_config.token_estimate_threshold)
+                    if llm_config.token_estimate_threshold
+                    else None
+                ),
+            )
+            self.exact_count_margin = llm_config.exact_count_margin
+
+            # Per-request context budget applied by agents, None if unbounded
+            self.context_window = (
+                ContextWindow(
+                    max_tokens=llm_config.context_window_tokens,
+                    keep_recent_turns=llm_config.context_keep_recent_turns,
+                )
+                if llm_config.context_window_tokens
+                else None
+            )
+
+            # Shared response cache, None unless enabled in [llm_cache]
+            self.response_cache = get_response_cache()
+
+            # Provider prompt caching: which mechanism, and whether to add markers
+            self.cache_style = get_cache_style(self.api_type, self.model)
+            self.cache_breakpoints = llm_config.prompt_cache and uses_breakpoints(
+                self.cache_style
+            )
+
+            # Duplicate slow requests past a latency percentile, None if disabled.
+            # A Bedrock call keeps running on its worker thread when its task
+            # is cancelled, so a losing duplicate would still be billed.
+            self.hedge_policy = (
+                HedgePolicy(
+                    get_latency_tracker(self.model),
+                    percentile=llm_config.hedge_percentile,
+                    min_samples=llm_config.hedge_min_samples,
+                )
+                if llm_config.hedge_percentile and self.api_type != "aws"
+                else None
+            )
+
+            # Per-call usage records with agent/step attribution, None if disabled
+            self.usage_ledger = get_usage_ledger()
+
+            # Where streamed text goes unless a call or agent picks a sink. Each
+            # call gets its own sink: agents share this instance concurrently.
+            self.stream_sink_kind = llm_config.stream_sink
+            self.stream_flush_interval = llm_config.stream_flush_interval
+
+            # Identical concurrent requests share one provider call
+            self.single_flight = (
+                SingleFlight() if llm_config.coalesce_requests else None
+            )
+
+            # Retry only retryable errors, within a per-call time budget
+            self.retry_policy = RetryPolicy(
+                max_attempts=llm_config.retry_max_attempts,
+                max_total_seconds=llm_config.retry_max_seconds,
+            )
+            # Fail fast while the endpoint is down; pooled endpoints are ejected
+            # by the pool instead. Keyed per config so one config's bad key or
+            # outage doesn't cut off others that share its base_url
+            self.circuit_breaker = (
+                get_circuit_breaker(
+                    config_name,
+                    llm_config.circuit_failure_threshold,
+                    llm_config.circuit_reset_seconds,
+                )
+                if self.endpoint_pool is None and llm_config.circuit_failure_threshold
+                else None
+            )
+
+            # Process-wide RPM/TPM limiter for this config, None if unlimited
+            self.rate_limiter = get_rate_limiter(
+                config_name, llm_config.rpm_limit, llm_config.tpm_limit
+            )
+
+            # Set on session handles created by LLMRegistry.session
+            self.session_id: Optional[str] = None
+            self.session_rate_limiter: Optional[RateLimiter] = None
+
+    def _rate_limiters(self) -> List[RateLimiter]:
+        return [
+            limiter
+            for limiter in (self.session_rate_limiter, self.rate_limiter)
+            if limiter is not None
+        ]
+
+    @property
+    def supports_images(self) -> bool:
+        return self.model in MULTIMODAL_MODELS
 
     def count_tokens(self, text: str) -> int:
         """Calculate the number of tokens in a text"""
@@ -240,19 +538,104 @@ class LLM:
         return len(self.tokenizer.encode(text))
 
     def count_message_tokens(self, messages: List[dict]) -> int:
-        return self.token_counter.count_message_tokens(messages)
+        """Count (or, for long texts, estimate) the tokens of messages.
+
+        Estimates are replaced by an exact count when the request would come
+        within exact_count_margin of max_input_tokens.
+        """
+        tokens = self.token_counter.count_message_tokens(messages)
+        if (
+            self.max_input_tokens is not None
+            and last_estimate.get()[0]
+            and self.total_input_tokens + tokens
+            >= (1 - self.exact_count_margin) * self.max_input_tokens
+        ):
+            tokens = self.token_counter.count_message_tokens(messages, exact=True)
+        return tokens
+
+    def update_token_count(
+        self,
+        input_tokens: int,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        cache_write_tokens: int = 0,
+    ) -> None:
+        """Update token counts
 
-    def update_token_count(self, input_tokens: int, completion_tokens: int = 0) -> None:
-        """Update token counts"""
+        Args:
+            input_tokens: Prompt tokens of the request, cached ones included
+            completion_tokens: Generated tokens
+            cached_tokens: Prompt tokens served from the provider's prompt cache
+            cache_write_tokens: Prompt tokens written to the provider's cache
+        """
         # Only track tokens if max_input_tokens is set
         self.total_input_tokens += input_tokens
         self.total_completion_tokens += completion_tokens
+        self.total_cached_tokens += cached_tokens
+        self.total_cache_write_tokens += cache_write_tokens
         logger.info(
             f"Token usage: Input={input_tokens}, Completion={completion_tokens}, "
+            f"Cached={cached_tokens}, Cache writes={cache_write_tokens}, "
             f"Cumulative Input={self.total_input_tokens}, Cumulative Completion={self.total_completion_tokens}, "
+            f"Cumulative Cached={self.total_cached_tokens}, "
             f"Total={input_tokens + completion_tokens}, Cumulative Total={self.total_input_tokens + self.total_completion_tokens}"
         )
 
+    def _record_usage(
+        self,
+        call: str,
+        latency: Optional[float],
+        usage=None,
+        input_tokens: int = 0,
+        completion_tokens: int = 0,
+    ) -> None:
+        """Account a completed call in the token counters and the usage ledger.
+
+        Provider usage is preferred; without it the given local estimates
+        are used and recorded as estimated.
+        """
+        if usage is not None:
+            input_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+        cached_tokens = get_cached_tokens(usage)
+        cache_write_tokens = get_cache_write_tokens(usage)
+        self.update_token_count(
+            input_tokens, completion_tokens, cached_tokens, cache_write_tokens
+        )
+        if self.usage_ledger is not None:
+            # Bedrock reports the time spent server-side
+            server_latency_ms = getattr(usage, "latency_ms", None)
+            self.usage_ledger.record(
+                self.model,
+                call,
+                input_tokens,
+                completion_tokens,
+                cached_tokens,
+                latency=latency,
+                estimated=usage is None,
+                config_name=self.config_name,
+                session_id=self.session_id,
+                cache_write_tokens=cache_write_tokens,
+                server_latency=(
+                    server_latency_ms / 1000 if server_latency_ms is not None else None
+                ),
+            )
+
+    def get_prompt_cache_stats(self) -> dict:
+        """Cumulative prompt cache hits as a share of input tokens"""
+        return {
+            "style": self.cache_style,
+            "breakpoints": self.cache_breakpoints,
+            "cached_tokens": self.total_cached_tokens,
+            "cache_write_tokens": self.total_cache_write_tokens,
+            "input_tokens": self.total_input_tokens,
+            "hit_rate": (
+                self.total_cached_tokens / self.total_input_tokens
+                if self.total_input_tokens
+                else 0.0
+            ),
+        }
+
     def check_token_limit(self, input_tokens: int) -> bool:
         """Check if token limits are exceeded"""
         if self.max_input_tokens is not None:
@@ -270,16 +653,427 @@ class LLM:
 
         return "Token limit exceeded"
 
+    def _build_endpoint_pool(self, llm_config: LLMSettings) -> Optional[EndpointPool]:
+        """Create an EndpointPool when the config lists several endpoints"""
+        if not llm_config.endpoints:
+            return None
+        if self.api_type == "aws":
+            logger.warning("Endpoint pools are not supported for Bedrock, ignoring")
+            return None
+
+        endpoints = []
+        names = set()
+        for endpoint in llm_config.endpoints:
+            api_key = endpoint.api_key or self.api_key
+            # Failover replaces the client's own retries on a pooled endpoint
+            if self.api_type == "azure":
+                client = AsyncAzureOpenAI(
+                    base_url=endpoint.base_url,
+                    api_key=api_key,
+                    api_version=endpoint.api_version or self.api_version,
+                    max_retries=0,
+                )
+            else:
+                client = AsyncOpenAI(
+                    api_key=api_key, base_url=endpoint.base_url, max_retries=0
+                )
+            name = endpoint.name or endpoint.base_url
+            if name in names:
+                name = f"{name}#{len(endpoints)}"
+            names.add(name)
+            endpoints.append(Endpoint(name, client, endpoint.weight))
+
+        return EndpointPool(
+            endpoints,
+            strategy=llm_config.load_balancing,
+            failure_threshold=llm_config.endpoint_failure_threshold,
+            ejection_seconds=llm_config.endpoint_ejection_seconds,
+        )
+
+    async def _create_completion(self, input_tokens: int, **params):
+        """Send a chat completion request once the rate limiter admits it.
+
+        Non-streaming requests are hedged when a hedge policy is configured;
+        the duplicate is not charged to the rate limiter again. Greedy
+        (temperature 0) requests are also coalesced with an identical request
+        in flight from the same session: the caller gets a copy of its
+        response without usage, so the tokens are accounted once. Sampled
+        requests are always sent, as callers expect independent samples.
+        """
+        if (
+            self.single_flight is not None
+            and not params.get("stream")
+            and not params.get("temperature")
+        ):
+            request = {k: v for k, v in params.items() if k != "timeout"}
+            response, shared = await self.single_flight.run(
+                make_cache_key(session_id=self.session_id, **request),
+                functools.partial(self._send_completion, input_tokens, **params),
+            )
+            if shared:
+                # Callers may modify their message; don't share its objects
+                response = copy.deepcopy(response)
+                response.usage = None
+            return response
+        return await self._send_completion(input_tokens, **params)
+
+    async def _send_completion(self, input_tokens: int, **params):
+        for limiter in self._rate_limiters():
+            await limiter.acquire(input_tokens)
+        if self.api_type == "aws" and params.get("stream"):
+            # Bedrock writes the text deltas to the sink itself
+            params["sink"] = self.get_stream_sink()
+        if self.endpoint_pool is not None:
+            send = functools.partial(self.endpoint_pool.create_completion, **params)
+        else:
+            send = functools.partial(self.client.chat.completions.create, **params)
+            if self.circuit_breaker is not None:
+                send = functools.partial(self._send_through_breaker, send)
+        if self.hedge_policy is not None and not params.get("stream"):
+            return await self.hedge_policy.run(send)
+        return await send()
+
+    async def _send_through_breaker(self, send):
+        breaker = self.circuit_breaker
+        breaker.before_call()
+        try:
+            response = await send()
+        except Exception as e:
+            # Throttling and bad credentials say nothing about the endpoint
+            if is_outage(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return response
+
+    def get_retry_stats(self) -> dict:
+        """Retries, fatal errors and exhausted calls, plus the circuit breaker state"""
+        stats = self.retry_policy.get_stats()
+        if self.circuit_breaker is not None:
+            stats["circuit"] = self.circuit_breaker.get_stats()
+        return stats
+
+    def get_coalescing_stats(self) -> dict:
+        """Requests sent and coalesced into an identical in-flight request"""
+        return self.single_flight.get_stats() if self.single_flight else {}
+
+    def get_hedge_stats(self) -> dict:
+        """Hedge rate, wins and estimated latency saved (empty if hedging is off)"""
+        return self.hedge_policy.get_stats() if self.hedge_policy else {}
+
+    def get_endpoint_stats(self) -> Dict[str, dict]:
+        """Per-endpoint load, health and latency (empty without an endpoint pool)"""
+        return self.endpoint_pool.get_stats() if self.endpoint_pool else {}
+
+    def _reconcile_usage(self, estimated_tokens: int, usage=None) -> None:
+        """Correct the rate limiters' pre-flight estimate with actual usage"""
+        if usage is None:
+            return
+        actual = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        self._reconcile_tokens(estimated_tokens, actual)
+        if usage.prompt_tokens:
+            self.token_counter.calibrate(estimated_tokens, usage.prompt_tokens)
+
+    def _reconcile_tokens(self, estimated_tokens: int, actual_tokens: int) -> None:
+        for limiter in self._rate_limiters():
+            limiter.reconcile(estimated_tokens, actual_tokens)
+
+    def get_cache_key(self, params: dict) -> Optional[str]:
+        """Return the response cache key for a request, or None if it must not be cached"""
+        if self.response_cache is None or not self.response_cache.should_cache(
+            params.get("temperature")
+        ):
+            return None
+        return make_cache_key(
+            **{k: v for k, v in params.items() if k not in ("stream", "timeout")}
+        )
+
+    @staticmethod
+    def dump_message(message) -> dict:
+        """Convert a completion message (OpenAI or Bedrock) to a cacheable dict"""
+        tool_calls = [
+            {
+                "id": call.id,
+                "type": "function",
+                "function": {
+                    "name": call.function.name,
+                    "arguments": call.function.arguments,
+                },
+            }
+            for call in (getattr(message, "tool_calls", None) or [])
+        ]
+        return {
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": tool_calls or None,
+        }
+
+    def get_cache_stats(self) -> dict:
+        """Hit/miss counters of the response cache (empty if caching is disabled)"""
+        return self.response_cache.get_stats() if self.response_cache else {}
+
+    def _build_batch_params(self, request: BatchRequest) -> dict:
+        """Build the chat completion params for one request of a batch"""
+        supports_images = self.supports_images
+        messages = self.format_messages(
+            request.messages, supports_images, self.cache_breakpoints
+        )
+        if request.system_msgs:
+            messages = (
+                self.format_messages(
+                    request.system_msgs, supports_images, self.cache_breakpoints
+                )
+                + messages
+            )
+
+        params = {"model": self.model, "messages": messages}
+        if request.tools:
+            tools = request.tools
+            if self.cache_breakpoints:
+                tools = add_tools_breakpoint(tools)
+            params["tools"] = tools
+            params["tool_choice"] = request.tool_choice.value
+        if self.model in REASONING_MODELS:
+            params["max_completion_tokens"] = self.max_tokens
+        else:
+            params["max_tokens"] = self.max_tokens
+            params["temperature"] = (
+                request.temperature
+                if request.temperature is not None
+                else self.temperature
+            )
+        return params
+
+    @with_retries
+    async def _send_batch_request(self, params: dict) -> dict:
+        """Send one request of a concurrently dispatched batch"""
+        input_tokens = self.count_message_tokens(params["messages"])
+        start = time.monotonic()
+        response = await self._create_completion(input_tokens, **params, stream=False)
+        self._reconcile_usage(input_tokens, response.usage)
+        if not response.choices or not response.choices[0].message:
+            raise ValueError("Empty or invalid response from LLM")
+        self._record_usage("batch", time.monotonic() - start, response.usage)
+        return self.dump_message(response.choices[0].message)
+
+    def _start_batch(self, job: BatchJob) -> None:
+        if job.done:
+            return
+        settings = config.llm_batch
+        if job.mode == PROVIDER:
+            coro = run_provider_batch(
+                job,
+                self.client,
+                provider_batch_endpoint(self.api_type, self.base_url),
+                settings.poll_interval,
+                # Provider batches report no per-request latency
+                on_usage=functools.partial(self._record_usage, "batch", None),
+            )
+        else:
+            coro = run_concurrent_batch(
+                job,
+                self._send_batch_request,
+                settings.concurrency,
+                settings.save_interval,
+            )
+        job.task = asyncio.create_task(coro)
+
+        def on_done(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Batch job {job.id} failed: {task.exception()}")
+                job.abort(task.exception())
+
+        job.task.add_done_callback(on_done)
+
+    async def submit_batch(
+        self,
+        requests: List[Union[BatchRequest, dict]],
+        use_provider_batch: Optional[bool] = None,
+    ) -> BatchJob:
+        """
+        Submit independent requests as one batch.
+
+        Requests go out as a provider batch job where the endpoint supports
+        it (OpenAI, Azure) and otherwise, or if submitting the batch fails,
+        are dispatched concurrently under the rate limiter. Job state is persisted in the [llm_batch] state
+        directory; use `resume_batch` with the job id after a restart.
+
+        Args:
+            requests: `BatchRequest`s or dicts with the same fields
+            use_provider_batch: Override [llm_batch] provider_batches
+
+        Returns:
+            BatchJob: Running job; ``job.futures`` resolve to one
+                ChatCompletionMessage per request, in order
+
+        Raises:
+            ValueError: If requests are invalid or custom ids repeat
+        """
+        batch_params: Dict[str, dict] = {}
+        for index, request in enumerate(requests):
+            if isinstance(request, dict):
+                request = BatchRequest(**request)
+            custom_id = request.custom_id or f"request-{index}"
+            if custom_id in batch_params:
+                raise ValueError(f"Duplicate custom_id in batch: {custom_id}")
+            batch_params[custom_id] = self._build_batch_params(request)
+
+        if use_provider_batch is None:
+            use_provider_batch = config.llm_batch.provider_batches
+        endpoint = provider_batch_endpoint(self.api_type, self.base_url)
+        mode = (
+            PROVIDER
+            if use_provider_batch
+            and self.endpoint_pool is None
+            and endpoint is not None
+            else CONCURRENT
+        )
+
+        job = BatchJob.create(self.config_name, mode, batch_params, get_state_dir())
+        job.save()
+        if mode == PROVIDER:
+            try:
+                await submit_provider_batch(job, self.client, endpoint)
+            except Exception as e:
+                logger.warning(
+                    f"Provider batch submission failed, dispatching concurrently: {e}"
+                )
+                job.mode = CONCURRENT
+                job.provider_batch_id = None
+                job.save()
+        logger.info(f"Batch job {job.id}: {len(batch_params)} requests, mode={mode}")
+        self._start_batch(job)
+        return job
+
+    async def resume_batch(self, job_id: str) -> BatchJob:
+        """Reload a persisted batch job and collect its remaining results"""
+        job = BatchJob.load(job_id, get_state_dir())
+        if (
+            job.mode == PROVIDER
+            and provider_batch_endpoint(self.api_type, self.base_url) is None
+        ):
+            raise ValueError(
+                f"Batch job {job_id} needs an endpoint with the provider batch API"
+            )
+        self._start_batch(job)
+        return job
+
+    def _stream_params(self, params: dict) -> dict:
+        """Params for a streamed request, asking for a final usage chunk"""
+        stream_params = {**params, "stream": True}
+        if self.api_type not in ("ollama", "aws"):
+            stream_params["stream_options"] = {"include_usage": True}
+        return stream_params
+
+    def get_stream_sink(self, sink: Optional[StreamSink] = None) -> StreamSink:
+        """The sink for a streamed call: sink, the scope's, or a new default sink"""
+        return (
+            sink
+            or current_stream_sink()
+            or make_stream_sink(self.stream_sink_kind, self.stream_flush_interval)
+        )
+
+    @staticmethod
+    async def _collect_text_stream(response, sink: StreamSink) -> tuple:
+        """Write a streamed text completion to sink and collect it.
+
+        Returns:
+            tuple: The completion text and the provider usage (None if the
+                provider sent no usage chunk)
+        """
+        if not hasattr(response, "__aiter__"):
+            # Bedrock streams into the sink itself and returns the whole response
+            return response.choices[0].message.content or "", response.usage
+        collected_messages = []
+        usage = None
+        async for chunk in response:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            chunk_message = chunk.choices[0].delta.content or ""
+            collected_messages.append(chunk_message)
+            sink.write(chunk_message)
+
+        sink.end()
+        return "".join(collected_messages), usage
+
+    def _finish_text_stream(
+        self, call: str, start: float, input_tokens: int, completion_text: str, usage
+    ) -> None:
+        """Account a streamed text completion, estimating usage if none was sent"""
+        latency = time.monotonic() - start
+        if usage is not None:
+            self._record_usage(call, latency, usage)
+            self._reconcile_usage(input_tokens, usage)
+            return
+        completion_tokens = self.count_tokens(completion_text)
+        logger.info(
+            f"Estimated completion tokens for streaming response: {completion_tokens}"
+        )
+        self._record_usage(
+            call,
+            latency,
+            input_tokens=input_tokens,
+            completion_tokens=completion_tokens,
+        )
+        self._reconcile_tokens(input_tokens, input_tokens + completion_tokens)
+
+    async def _stream_tool_completion(
+        self,
+        params: dict,
+        input_tokens: int,
+        on_tool_call: Optional[ToolCallCallback] = None,
+    ) -> Optional[ChatCompletionMessage]:
+        """Stream a tool completion, firing on_tool_call as each call completes"""
+        start = time.monotonic()
+        response = await self._create_completion(
+            input_tokens, **self._stream_params(params)
+        )
+
+        assembler = ToolCallAssembler(on_tool_call)
+        async for chunk in response:
+            await assembler.add_chunk(chunk)
+        message = await assembler.finish()
+        latency = time.monotonic() - start
+
+        if assembler.usage is not None:
+            self._record_usage("ask_tool", latency, assembler.usage)
+            self._reconcile_usage(input_tokens, assembler.usage)
+        else:
+            # Provider sent no usage chunk, fall back to local estimates
+            completion_tokens = self.count_tokens(assembler.completion_text)
+            self._record_usage(
+                "ask_tool",
+                latency,
+                input_tokens=input_tokens,
+                completion_tokens=completion_tokens,
+            )
+            self._reconcile_tokens(input_tokens, input_tokens + completion_tokens)
+        return message
+
     @staticmethod
     def format_messages(
-        messages: List[Union[dict, Message]], supports_images: bool = False
+        messages: List[Union[dict, Message]],
+        supports_images: bool = False,
+        cache_breakpoint: bool = False,
     ) -> List[dict]:
         """
         Format messages for LLM by converting them to OpenAI message format.
 
         Args:
-            messages: List of messages that can be either dict or Message objects
+            messages: List of messages that can be either dict or Message objects.
+                Message objects are formatted once and cached on the message;
+                already formatted dicts (see `Memory.formatted_messages`)
+                pass through unchanged
             supports_images: Flag indicating if the target model supports image inputs
+            cache_breakpoint: Mark the end of the messages as a cacheable prompt
+                prefix (``cache_control``) for providers that need breakpoints
 
         Returns:
             List[dict]: List of formatted messages in OpenAI format
@@ -299,78 +1093,40 @@ class LLM:
         formatted_messages = []
 
         for message in messages:
-            # Convert Message objects to dictionaries
             if isinstance(message, Message):
-                message = message.to_dict()
-
-            if isinstance(message, dict):
+                # Cached on the message; the dict must not be modified here
+                message = message.to_formatted(supports_images)
+            elif isinstance(message, dict):
                 # If message is a dict, ensure it has required fields
                 if "role" not in message:
                     raise ValueError("Message dict must contain 'role' field")
-
-                # Process base64 images if present and model supports images
-                if supports_images and message.get("base64_image"):
-                    # Initialize or convert content to appropriate format
-                    if not message.get("content"):
-                        message["content"] = []
-                    elif isinstance(message["content"], str):
-                        message["content"] = [
-                            {"type": "text", "text": message["content"]}
-                        ]
-                    elif isinstance(message["content"], list):
-                        # Convert string items to proper text objects
-                        message["content"] = [
-                            (
-                                {"type": "text", "text": item}
-                                if isinstance(item, str)
-                                else item
-                            )
-                            for item in message["content"]
-                        ]
-
-                    # Add the image to content
-                    message["content"].append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{message['base64_image']}"
-                            },
-                        }
-                    )
-
-                    # Remove the base64_image field
-                    del message["base64_image"]
-                # If model doesn't support images but message has base64_image, handle gracefully
-                elif not supports_images and message.get("base64_image"):
-                    # Just remove the base64_image field and keep the text content
-                    del message["base64_image"]
-
-                if "content" in message or "tool_calls" in message:
-                    formatted_messages.append(message)
-                # else: do not include the message
+                # Process base64 images if present
+                format_message_dict(message, supports_images)
             else:
                 raise TypeError(f"Unsupported message type: {type(message)}")
 
+            if "content" in message or "tool_calls" in message:
+                formatted_messages.append(message)
+            # else: do not include the message
+
         # Validate all messages have required fields
         for msg in formatted_messages:
             if msg["role"] not in ROLE_VALUES:
                 raise ValueError(f"Invalid role: {msg['role']}")
 
+        if cache_breakpoint:
+            add_cache_breakpoint(formatted_messages)
+
         return formatted_messages
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @with_retries
     async def ask(
         self,
         messages: List[Union[dict, Message]],
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = True,
         temperature: Optional[float] = None,
+        sink: Optional[StreamSink] = None,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
@@ -380,6 +1136,8 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            sink: Where streamed text goes (defaults to the sink set with
+                stream_to, then the config's stream_sink)
 
         Returns:
             str: The generated response
@@ -392,14 +1150,20 @@ class LLM:
         """
         try:
             # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
+            supports_images = self.supports_images
 
             # Format system and user messages with image support check
             if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
+                system_msgs = self.format_messages(
+                    system_msgs, supports_images, self.cache_breakpoints
+                )
+                messages = system_msgs + self.format_messages(
+                    messages, supports_images, self.cache_breakpoints
+                )
             else:
-                messages = self.format_messages(messages, supports_images)
+                messages = self.format_messages(
+                    messages, supports_images, self.cache_breakpoints
+                )
 
             # Calculate input token count
             input_tokens = self.count_message_tokens(messages)
@@ -423,47 +1187,49 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
+            cache_key = self.get_cache_key(params)
+            if cache_key:
+                cached = await self.response_cache.aget(cache_key)
+                if cached is not None:
+                    logger.debug(f"Response cache hit for {self.model}")
+                    return cached["content"]
+
+            start = time.monotonic()
             if not stream:
                 # Non-streaming request
-                response = await self.client.chat.completions.create(
-                    **params, stream=False
+                response = await self._create_completion(
+                    input_tokens, **params, stream=False
                 )
+                self._reconcile_usage(input_tokens, response.usage)
 
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
 
                 # Update token counts
-                self.update_token_count(
-                    response.usage.prompt_tokens, response.usage.completion_tokens
-                )
+                self._record_usage("ask", time.monotonic() - start, response.usage)
 
+                if cache_key:
+                    await self.response_cache.aset(
+                        cache_key, self.dump_message(response.choices[0].message)
+                    )
                 return response.choices[0].message.content
 
-            # Streaming request, For streaming, update estimated token count before making the request
-            self.update_token_count(input_tokens)
-
-            response = await self.client.chat.completions.create(**params, stream=True)
-
-            collected_messages = []
-            completion_text = ""
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                completion_text += chunk_message
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
+            # Streaming request
+            sink = self.get_stream_sink(sink)
+            with stream_to(sink):
+                response = await self._create_completion(
+                    input_tokens, **self._stream_params(params)
+                )
+            completion_text, usage = await self._collect_text_stream(response, sink)
+            full_response = completion_text.strip()
+            self._finish_text_stream("ask", start, input_tokens, completion_text, usage)
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
 
-            # estimate completion tokens for streaming response
-            completion_tokens = self.count_tokens(completion_text)
-            logger.info(
-                f"Estimated completion tokens for streaming response: {completion_tokens}"
-            )
-            self.total_completion_tokens += completion_tokens
-
+            if cache_key:
+                await self.response_cache.aset(
+                    cache_key, {"role": "assistant", "content": full_response}
+                )
             return full_response
 
         except TokenLimitExceeded:
@@ -485,13 +1251,7 @@ class LLM:
             logger.exception(f"Unexpected error in ask")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @with_retries
     async def ask_with_images(
         self,
         messages: List[Union[dict, Message]],
@@ -499,6 +1259,7 @@ class LLM:
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = False,
         temperature: Optional[float] = None,
+        sink: Optional[StreamSink] = None,
     ) -> str:
         """
         Send a prompt with images to the LLM and get the response.
@@ -509,6 +1270,8 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            sink: Where streamed text goes (defaults to the sink set with
+                stream_to, then the config's stream_sink)
 
         Returns:
             str: The generated response
@@ -528,7 +1291,9 @@ class LLM:
                 )
 
             # Format messages with image support
-            formatted_messages = self.format_messages(messages, supports_images=True)
+            formatted_messages = self.format_messages(
+                messages, supports_images=True, cache_breakpoint=self.cache_breakpoints
+            )
 
             # Ensure the last message is from the user to attach images
             if not formatted_messages or formatted_messages[-1]["role"] != "user":
@@ -536,15 +1301,16 @@ class LLM:
                     "The last message must be from the user to attach images"
                 )
 
-            # Process the last user message to include images
-            last_message = formatted_messages[-1]
+            # Process a copy of the last user message to include images, the
+            # formatted dicts may be cached on Message objects
+            last_message = formatted_messages[-1] = dict(formatted_messages[-1])
 
             # Convert content to multimodal format if needed
             content = last_message["content"]
             multimodal_content = (
                 [{"type": "text", "text": content}]
                 if isinstance(content, str)
-                else content
+                else list(content)
                 if isinstance(content, list)
                 else []
             )
@@ -568,7 +1334,11 @@ class LLM:
             # Add system messages if provided
             if system_msgs:
                 all_messages = (
-                    self.format_messages(system_msgs, supports_images=True)
+                    self.format_messages(
+                        system_msgs,
+                        supports_images=True,
+                        cache_breakpoint=self.cache_breakpoints,
+                    )
                     + formatted_messages
                 )
             else:
@@ -595,32 +1365,50 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
+            cache_key = self.get_cache_key(params)
+            if cache_key:
+                cached = await self.response_cache.aget(cache_key)
+                if cached is not None:
+                    logger.debug(f"Response cache hit for {self.model}")
+                    return cached["content"]
+
+            start = time.monotonic()
             # Handle non-streaming request
             if not stream:
-                response = await self.client.chat.completions.create(**params)
+                response = await self._create_completion(input_tokens, **params)
+                self._reconcile_usage(input_tokens, response.usage)
 
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
 
-                self.update_token_count(response.usage.prompt_tokens)
+                self._record_usage(
+                    "ask_with_images", time.monotonic() - start, response.usage
+                )
+                if cache_key:
+                    await self.response_cache.aset(
+                        cache_key, self.dump_message(response.choices[0].message)
+                    )
                 return response.choices[0].message.content
 
             # Handle streaming request
-            self.update_token_count(input_tokens)
-            response = await self.client.chat.completions.create(**params)
-
-            collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
+            sink = self.get_stream_sink(sink)
+            with stream_to(sink):
+                response = await self._create_completion(
+                    input_tokens, **self._stream_params(params)
+                )
+            completion_text, usage = await self._collect_text_stream(response, sink)
+            full_response = completion_text.strip()
+            self._finish_text_stream(
+                "ask_with_images", start, input_tokens, completion_text, usage
+            )
 
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
 
+            if cache_key:
+                await self.response_cache.aset(
+                    cache_key, {"role": "assistant", "content": full_response}
+                )
             return full_response
 
         except TokenLimitExceeded:
@@ -641,13 +1429,7 @@ class LLM:
             logger.error(f"Unexpected error in ask_with_images: {e}")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @with_retries
     async def ask_tool(
         self,
         messages: List[Union[dict, Message]],
@@ -656,6 +1438,9 @@ class LLM:
         tools: Optional[List[dict]] = None,
         tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
         temperature: Optional[float] = None,
+        tools_tokens: Optional[int] = None,
+        stream: bool = False,
+        on_tool_call: Optional[ToolCallCallback] = None,
         **kwargs,
     ) -> ChatCompletionMessage | None:
         """
@@ -668,6 +1453,12 @@ class LLM:
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
+            tools_tokens: Precomputed token cost of the tool schemas, e.g. from
+                `ToolCollection.params_token_count`; counted here if omitted
+            stream: Stream the completion and assemble tool calls incrementally
+            on_tool_call: Sync or async callback invoked with each tool call as
+                soon as it is complete, before the rest of the response arrives
+                when streaming
             **kwargs: Additional completion arguments
 
         Returns:
@@ -685,22 +1476,28 @@ class LLM:
                 raise ValueError(f"Invalid tool_choice: {tool_choice}")
 
             # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
+            supports_images = self.supports_images
 
             # Format messages
             if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
+                system_msgs = self.format_messages(
+                    system_msgs, supports_images, self.cache_breakpoints
+                )
+                messages = system_msgs + self.format_messages(
+                    messages, supports_images, self.cache_breakpoints
+                )
             else:
-                messages = self.format_messages(messages, supports_images)
+                messages = self.format_messages(
+                    messages, supports_images, self.cache_breakpoints
+                )
 
             # Calculate input token count
             input_tokens = self.count_message_tokens(messages)
 
             # If there are tools, calculate token count for tool descriptions
-            tools_tokens = 0
-            if tools:
-                for tool in tools:
+            if tools_tokens is None:
+                tools_tokens = 0
+                for tool in tools or []:
                     tools_tokens += self.count_tokens(str(tool))
 
             input_tokens += tools_tokens
@@ -716,6 +1513,9 @@ class LLM:
                 for tool in tools:
                     if not isinstance(tool, dict) or "type" not in tool:
                         raise ValueError("Each tool must be a dict with 'type' field")
+                # The tool schemas come right after the system prompt in the prefix
+                if self.cache_breakpoints:
+                    tools = add_tools_breakpoint(tools)
 
             # Set up the completion request
             params = {
@@ -735,9 +1535,32 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
-            response: ChatCompletion = await self.client.chat.completions.create(
-                **params, stream=False
+            cache_key = self.get_cache_key(params)
+            if cache_key:
+                cached = await self.response_cache.aget(cache_key)
+                if cached is not None:
+                    logger.debug(f"Response cache hit for {self.model}")
+                    message = ChatCompletionMessage.model_validate(cached)
+                    for tool_call in message.tool_calls or []:
+                        await notify_tool_call(on_tool_call, tool_call)
+                    return message
+
+            # Bedrock streaming yields a complete response, so use the plain path
+            if stream and self.api_type != "aws":
+                message = await self._stream_tool_completion(
+                    params, input_tokens, on_tool_call
+                )
+                if message is not None and cache_key:
+                    await self.response_cache.aset(
+                        cache_key, self.dump_message(message)
+                    )
+                return message
+
+            start = time.monotonic()
+            response: ChatCompletion = await self._create_completion(
+                input_tokens, **params, stream=False
             )
+            self._reconcile_usage(input_tokens, getattr(response, "usage", None))
 
             # Check if response is valid
             if not response.choices or not response.choices[0].message:
@@ -746,10 +1569,14 @@ class LLM:
                 return None
 
             # Update token counts
-            self.update_token_count(
-                response.usage.prompt_tokens, response.usage.completion_tokens
-            )
+            self._record_usage("ask_tool", time.monotonic() - start, response.usage)
 
+            if cache_key:
+                await self.response_cache.aset(
+                    cache_key, self.dump_message(response.choices[0].message)
+                )
+            for tool_call in response.choices[0].message.tool_calls or []:
+                await notify_tool_call(on_tool_call, tool_call)
             return response.choices[0].message
 
         except TokenLimitExceeded:
@@ -770,3 +1597,129 @@ class LLM:
         except Exception as e:
             logger.error(f"Unexpected error in ask_tool: {e}")
             raise
+
+
+# Per-handle usage counters
+TOKEN_COUNTERS = (
+    "total_input_tokens",
+    "total_completion_tokens",
+    "total_cached_tokens",
+    "total_cache_write_tokens",
+)
+
+
+class LLMRegistry:
+    """Registry of shared LLM resources and lightweight per-session handles.
+
+    `LLM` instances are shared per config name, so their token counters and
+    limits mix every agent using the config. A worker hosting many sessions
+    asks the registry for a handle per session instead: handles share the
+    config's HTTP client, tokenizer, caches and process-wide rate limiter,
+    but each has its own token counters, input token budget and optional
+    session rate limits.
+    """
+
+    def __init__(self):
+        self._sessions: "weakref.WeakValueDictionary[str, LLM]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(
+        self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
+    ) -> LLM:
+        """Return the shared LLM for a config"""
+        return LLM(config_name, llm_config)
+
+    def session(
+        self,
+        config_name: str = "default",
+        session_id: Optional[str] = None,
+        max_input_tokens: Optional[int] = None,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+        llm_config: Optional[LLMSettings] = None,
+    ) -> LLM:
+        """Create (or return the live) handle for a session.
+
+        Args:
+            config_name: LLM config whose shared resources the handle uses
+            session_id: Session identifier, generated if omitted
+            max_input_tokens: Input token budget of the session (defaults to
+                the config's max_input_tokens)
+            rpm_limit: Requests per minute for this session alone, applied on
+                top of the config's shared limit
+            tpm_limit: Tokens per minute for this session alone
+            llm_config: Config mapping, as for `LLM`
+        """
+        base = self.get(config_name, llm_config)
+        with self._lock:
+            if session_id is not None and session_id in self._sessions:
+                return self._sessions[session_id]
+            session_id = session_id or f"session-{uuid.uuid4().hex[:12]}"
+            handle = self._make_handle(
+                base,
+                session_id,
+                max_input_tokens,
+                RateLimiter(rpm_limit, tpm_limit) if rpm_limit or tpm_limit else None,
+            )
+            self._sessions[session_id] = handle
+            return handle
+
+    @staticmethod
+    def _make_handle(
+        base: LLM,
+        session_id: str,
+        max_input_tokens: Optional[int],
+        session_rate_limiter: Optional[RateLimiter],
+    ) -> LLM:
+        # LLM.__new__ returns the shared instance, so build the handle directly
+        handle = object.__new__(LLM)
+        handle.__dict__.update(base.__dict__)
+        handle.session_id = session_id
+        for counter in TOKEN_COUNTERS:
+            setattr(handle, counter, 0)
+        if max_input_tokens is not None:
+            handle.max_input_tokens = max_input_tokens
+        handle.session_rate_limiter = session_rate_limiter
+        return handle
+
+    @contextmanager
+    def on_config(self, llm: LLM, config_name: str) -> Iterator[LLM]:
+        """Yield the LLM for config_name to use on behalf of llm.
+
+        A shared LLM yields the shared instance of config_name. A session
+        handle yields a handle on config_name that keeps the session's id,
+        rate limiter and input token budget; the tokens it uses are added
+        to the session's counters.
+        """
+        base = self.get(config_name)
+        if llm.session_id is None:
+            yield base
+            return
+        handle = self._make_handle(
+            base, llm.session_id, llm.max_input_tokens, llm.session_rate_limiter
+        )
+        for counter in TOKEN_COUNTERS:
+            setattr(handle, counter, getattr(llm, counter))
+        start = {counter: getattr(handle, counter) for counter in TOKEN_COUNTERS}
+        try:
+            yield handle
+        finally:
+            for counter in TOKEN_COUNTERS:
+                used = getattr(handle, counter) - start[counter]
+                setattr(llm, counter, getattr(llm, counter) + used)
+
+    def get_session(self, session_id: str) -> Optional[LLM]:
+        return self._sessions.get(session_id)
+
+    def close_session(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    @property
+    def session_ids(self) -> List[str]:
+        return list(self._sessions.keys())
+
+
+llm_registry = LLMRegistry()
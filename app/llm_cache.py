@@ -0,0 +1,292 @@
+"""Two-tier response cache for LLM requests.
+
+Responses are keyed on a stable hash of everything that influences the
+completion (model, formatted messages, tool schemas and sampling params).
+Lookups hit a small in-memory LRU first and fall back to an SQLite file
+that survives restarts, so replayed and regression runs skip the provider.
+`ResponseCache.aget` and `ResponseCache.aset` keep SQLite I/O off the event
+loop.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.config import PROJECT_ROOT, LLMCacheSettings, config
+from app.logger import logger
+
+
+def make_cache_key(**request: Any) -> str:
+    """Build a stable hash for a request.
+
+    Keyword order does not matter and non-JSON values (enums, pydantic
+    models) are stringified, so logically identical requests share a key.
+    """
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-memory LRU tier"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl: Optional[int] = None) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if ttl is not None and time.time() - created_at > ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict, created_at: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (created_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """SQLite-backed tier with TTL and size-based (least recently used) eviction.
+
+    Access times only drive eviction, so a hit records its access only when
+    the stored time is older than ``touch_interval`` seconds; repeated hits
+    are plain reads.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, touch_interval: float = 60.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, ttl: Optional[int] = None) -> Optional[tuple[float, dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, accessed_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, accessed_at = row
+            now = time.time()
+            if ttl is not None and now - created_at > ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            if now - accessed_at >= self.touch_interval:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                self._conn.commit()
+        return created_at, json.loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the tier fits in max_bytes"""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def purge_expired(self, ttl: int) -> int:
+        """Delete every entry older than ttl seconds, returning how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return count
+
+
+class ResponseCache:
+    """Response cache combining the in-memory and on-disk tiers.
+
+    Values are plain JSON-compatible dicts (e.g. a dumped
+    ``ChatCompletionMessage``); callers rebuild their own types on a hit.
+    """
+
+    def __init__(self, settings: Optional[LLMCacheSettings] = None):
+        self.settings = settings or LLMCacheSettings()
+        self.memory = MemoryCache(self.settings.memory_max_entries)
+        self.disk: Optional[DiskCache] = None
+        if self.settings.disk_enabled:
+            disk_path = Path(self.settings.disk_path)
+            if not disk_path.is_absolute():
+                disk_path = PROJECT_ROOT / disk_path
+            try:
+                self.disk = DiskCache(disk_path, self.settings.disk_max_bytes)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Disk response cache unavailable, memory only: {e}")
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+        }
+
+    def should_cache(self, temperature: Optional[float]) -> bool:
+        """Whether a request sampled at this temperature may be cached"""
+        if not self.settings.enabled:
+            return False
+        return not self.settings.deterministic_only or not temperature
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._get_from_memory(key)
+        if value is None and self.disk is not None:
+            value = self._get_from_disk(key)
+        if value is None:
+            self.stats["misses"] += 1
+        return value
+
+    async def aget(self, key: str) -> Optional[dict]:
+        """`get` for the event loop, reading the disk tier on a worker thread"""
+        value = self._get_from_memory(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self._get_from_disk, key)
+        if value is None:
+            self.stats["misses"] += 1
+        return value
+
+    def _get_from_memory(self, key: str) -> Optional[dict]:
+        value = self.memory.get(key, self.settings.ttl)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+        return value
+
+    def _get_from_disk(self, key: str) -> Optional[dict]:
+        entry = self.disk.get(key, self.settings.ttl)
+        if entry is None:
+            return None
+        created_at, value = entry
+        self.memory.set(key, value, created_at)
+        self.stats["disk_hits"] += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self._set_on_disk(key, value)
+        self.stats["writes"] += 1
+
+    async def aset(self, key: str, value: dict) -> None:
+        """`set` for the event loop, writing the disk tier on a worker thread"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self._set_on_disk, key, value)
+        self.stats["writes"] += 1
+
+    def _set_on_disk(self, key: str, value: dict) -> None:
+        try:
+            self.disk.set(key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write response to disk cache: {e}")
+
+    @property
+    def hits(self) -> int:
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def misses(self) -> int:
+        return self.stats["misses"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus the current hit rate"""
+        lookups = self.hits + self.misses
+        return {
+            **self.stats,
+            "hits": self.hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None when caching is disabled"""
+    global _shared_cache
+    if not config.llm_cache.enabled:
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache(config.llm_cache)
+    return _shared_cache
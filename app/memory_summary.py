@@ -0,0 +1,65 @@
+"""Rolling summaries of messages evicted from agent memory.
+
+When ``[memory] summarize`` is on, an agent's `Memory` hands the messages
+it evicts to `MemorySummarizer`, which folds them into the running summary
+in the background. The call is routed as a ``summarize`` task, so an
+``[[llm_router.rules]]`` entry can send it to a cheaper model.
+"""
+from typing import List, Optional
+
+from app.config import config
+from app.llm import LLM
+from app.router import SUMMARIZE, get_model_router
+from app.schema import Message
+
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the working memory of an autonomous agent. Merge the "
+    "previous summary and the new messages into one concise summary. Keep "
+    "the task, decisions, facts learned, files and URLs touched, and open "
+    "questions; drop pleasantries and raw tool output."
+)
+
+
+class MemorySummarizer:
+    """Summarizes evicted messages with the given LLM, or a routed one"""
+
+    def __init__(
+        self,
+        llm: LLM,
+        max_output_tokens: Optional[int] = None,
+        message_chars: int = 2000,
+    ):
+        self.llm = llm
+        self.max_output_tokens = max_output_tokens or config.memory.summary_max_tokens
+        self.message_chars = message_chars
+
+    def _render(self, message: Message) -> str:
+        content = message.content or ""
+        if len(content) > self.message_chars:
+            content = content[: self.message_chars] + " ...[truncated]"
+        calls = ", ".join(
+            f"{call.function.name}({call.function.arguments})"
+            for call in message.tool_calls or []
+        )
+        if calls:
+            content = f"{content}\n[called {calls}]".strip()
+        return f"{message.role}: {content}"
+
+    async def __call__(self, previous: Optional[str], messages: List[Message]) -> str:
+        prompt = "\n\n".join(
+            [f"Previous summary:\n{previous or '(none)'}", "New messages:"]
+            + [self._render(message) for message in messages]
+        )
+        request = [Message.user_message(prompt)]
+        return await get_model_router().run(
+            SUMMARIZE,
+            lambda llm: llm.ask(
+                request,
+                system_msgs=[Message.system_message(SUMMARY_SYSTEM_PROMPT)],
+                stream=False,
+            ),
+            default=self.llm,
+            messages=request,
+            expected_output_tokens=self.max_output_tokens,
+        )
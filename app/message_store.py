@@ -0,0 +1,288 @@
+"""Compact storage for long or parked message histories.
+
+A `Message` is a full pydantic model: with its dict, private caches and
+one string object per field it costs far more than its text. Holding the
+histories of thousands of sessions that way adds up. `MessageStore` keeps
+them as:
+
+- a deque of `__slots__` records, so appending and trimming the oldest
+  messages are O(1);
+- interned role, name and tool-name strings, shared by all records;
+- contents and images in one byte arena per store, images as raw bytes
+  rather than base64 text.
+
+Messages are only built back, on access, where a `Message` (or provider
+dict) is needed. `Memory.park` keeps an idle agent's history this way
+(``[memory] park_idle``) until its next run or request:
+
+    store = MessageStore.from_messages(agent.memory.messages)
+    ...
+    agent.memory.messages = store.to_messages()
+"""
+import base64
+import binascii
+import sys
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from app.schema import Function, Message, Role, ToolCall
+
+
+# Arena ranges are (start, end); None is stored as NONE
+NONE = -1
+
+
+class MessageRecord:
+    """One stored message; payloads live in the store's arena"""
+
+    __slots__ = (
+        "role",
+        "name",
+        "tool_call_id",
+        "tool_calls",
+        "content_start",
+        "content_end",
+        "image_start",
+        "image_end",
+        "image_raw",
+    )
+
+    def __init__(
+        self,
+        role: str,
+        name: Optional[str],
+        tool_call_id: Optional[str],
+        tool_calls: Optional[Tuple[Tuple[str, str, str], ...]],
+        content_start: int,
+        content_end: int,
+        image_start: int,
+        image_end: int,
+        image_raw: bool,
+    ):
+        self.role = role
+        self.name = name
+        self.tool_call_id = tool_call_id
+        self.tool_calls = tool_calls
+        self.content_start = content_start
+        self.content_end = content_end
+        self.image_start = image_start
+        self.image_end = image_end
+        self.image_raw = image_raw
+
+    @property
+    def nbytes(self) -> int:
+        """Arena bytes used by the record"""
+        size = 0
+        if self.content_start != NONE:
+            size += self.content_end - self.content_start
+        if self.image_start != NONE:
+            size += self.image_end - self.image_start
+        return size
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+class MessageStore:
+    """Append-only message log with O(1) trimming of the oldest messages.
+
+    Like `Memory`, trimming to max_messages drops an assistant message with
+    tool calls together with its tool results. Space freed in the arena is
+    reclaimed once it makes up half of it.
+    """
+
+    def __init__(self, max_messages: Optional[int] = None):
+        self.max_messages = max_messages
+        self._records: Deque[MessageRecord] = deque()
+        self._arena = bytearray()
+        # Absolute position of the arena's first byte; records keep absolute
+        # positions so compaction does not have to rewrite them
+        self._base = 0
+        self._dead_bytes = 0
+
+    @classmethod
+    def from_messages(
+        cls, messages: Iterable[Message], max_messages: Optional[int] = None
+    ) -> "MessageStore":
+        store = cls(max_messages)
+        store.extend(messages)
+        return store
+
+    def _put(self, data: Optional[bytes]) -> Tuple[int, int]:
+        if data is None:
+            return NONE, NONE
+        start = self._base + len(self._arena)
+        self._arena += data
+        return start, start + len(data)
+
+    def _get(self, start: int, end: int) -> Optional[bytes]:
+        if start == NONE:
+            return None
+        return bytes(self._arena[start - self._base : end - self._base])
+
+    def append(self, message: Message) -> None:
+        image = message.base64_image
+        image_raw = False
+        image_bytes = None
+        if image is not None:
+            try:
+                image_bytes = base64.b64decode(image, validate=True)
+                # Only store raw bytes if they encode back to the same text
+                image_raw = base64.b64encode(image_bytes) == image.encode("ascii")
+            except (binascii.Error, ValueError, UnicodeEncodeError):
+                pass
+            if not image_raw:
+                image_bytes = image.encode("utf-8")
+
+        content = message.content
+        content_start, content_end = self._put(
+            content.encode("utf-8") if content is not None else None
+        )
+        image_start, image_end = self._put(image_bytes)
+        self._records.append(
+            MessageRecord(
+                role=_intern(message.role),
+                name=_intern(message.name),
+                tool_call_id=message.tool_call_id,
+                tool_calls=(
+                    tuple(
+                        (call.id, _intern(call.function.name), call.function.arguments)
+                        for call in message.tool_calls
+                    )
+                    if message.tool_calls is not None
+                    else None
+                ),
+                content_start=content_start,
+                content_end=content_end,
+                image_start=image_start,
+                image_end=image_end,
+                image_raw=image_raw,
+            )
+        )
+        if self.max_messages is not None:
+            while len(self._records) > self.max_messages and self._trim_group():
+                pass
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def _trim_group(self) -> bool:
+        """Drop the oldest message with the tool results that answer it"""
+        records = self._records
+        if len(records) <= 1:
+            return False
+        first = records[0]
+        call_ids = {call[0] for call in first.tool_calls or ()}
+        size = 1
+        while size < len(records) and records[size].role == Role.TOOL:
+            if call_ids and records[size].tool_call_id not in call_ids:
+                break
+            size += 1
+        if size >= len(records):
+            return False
+        self.trim(size)
+        return True
+
+    def trim(self, count: int) -> None:
+        """Drop the count oldest messages"""
+        for _ in range(min(count, len(self._records))):
+            self._dead_bytes += self._records.popleft().nbytes
+        if not self._records:
+            self._base += len(self._arena)
+            self._arena = bytearray()
+            self._dead_bytes = 0
+        elif self._dead_bytes * 2 > len(self._arena):
+            self._compact()
+
+    def _compact(self) -> None:
+        # Live payloads are contiguous at the end of the arena, in order
+        live_from = self._base + len(self._arena)
+        for record in self._records:
+            start = (
+                record.content_start
+                if record.content_start != NONE
+                else record.image_start
+            )
+            if start != NONE:
+                live_from = start
+                break
+        del self._arena[: live_from - self._base]
+        self._base = live_from
+        self._dead_bytes = 0
+
+    def _to_message(self, record: MessageRecord) -> Message:
+        content = self._get(record.content_start, record.content_end)
+        image = self._get(record.image_start, record.image_end)
+        if image is not None:
+            image = (
+                base64.b64encode(image).decode("ascii")
+                if record.image_raw
+                else image.decode("utf-8")
+            )
+        return Message(
+            role=record.role,
+            content=content.decode("utf-8") if content is not None else None,
+            tool_calls=(
+                [
+                    ToolCall(id=call_id, function=Function(name=name, arguments=args))
+                    for call_id, name, args in record.tool_calls
+                ]
+                if record.tool_calls is not None
+                else None
+            ),
+            name=record.name,
+            tool_call_id=record.tool_call_id,
+            base64_image=image,
+        )
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index: int) -> Message:
+        return self._to_message(self._records[index])
+
+    def __iter__(self) -> Iterator[Message]:
+        """Yield messages, each built when reached"""
+        for record in list(self._records):
+            yield self._to_message(record)
+
+    def to_messages(self) -> List[Message]:
+        return list(self)
+
+    def to_dict_list(self) -> List[dict]:
+        """Messages as `Message.to_dict` dicts, without building Messages"""
+        dicts = []
+        for record in self._records:
+            message = {"role": record.role}
+            content = self._get(record.content_start, record.content_end)
+            if content is not None:
+                message["content"] = content.decode("utf-8")
+            if record.tool_calls is not None:
+                message["tool_calls"] = [
+                    {
+                        "id": call_id,
+                        "type": "function",
+                        "function": {"name": name, "arguments": args},
+                    }
+                    for call_id, name, args in record.tool_calls
+                ]
+            if record.name is not None:
+                message["name"] = record.name
+            if record.tool_call_id is not None:
+                message["tool_call_id"] = record.tool_call_id
+            image = self._get(record.image_start, record.image_end)
+            if image is not None:
+                message["base64_image"] = (
+                    base64.b64encode(image).decode("ascii")
+                    if record.image_raw
+                    else image.decode("utf-8")
+                )
+            dicts.append(message)
+        return dicts
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the payload arena"""
+        return len(self._arena)
@@ -0,0 +1,93 @@
+"""Provider prompt-prefix caching.
+
+Agents resend the same system prompt, tool schemas and history prefix on
+every step. Providers can serve that prefix from cache at a fraction of the
+price and latency:
+
+- OpenAI caches long prefixes automatically; nothing has to be marked.
+- Anthropic (Claude) models cache up to explicit ``cache_control``
+  breakpoints on content blocks and tool definitions.
+- Bedrock uses ``cachePoint`` blocks, which the Bedrock adapter derives
+  from the same ``cache_control`` markers (system prompt, tool config and
+  messages).
+"""
+from typing import Any, List, Optional
+
+
+OPENAI = "openai"
+ANTHROPIC = "anthropic"
+BEDROCK = "bedrock"
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def get_cache_style(api_type: str, model: str) -> str:
+    """Which prompt caching mechanism a config's provider uses"""
+    if api_type == "aws":
+        return BEDROCK
+    if "claude" in model.lower():
+        return ANTHROPIC
+    return OPENAI
+
+
+def uses_breakpoints(style: str) -> bool:
+    """Whether the style needs explicit markers on the cacheable prefix"""
+    return style in (ANTHROPIC, BEDROCK)
+
+
+def add_cache_breakpoint(messages: List[dict]) -> List[dict]:
+    """Mark the end of a message list as a cacheable prefix.
+
+    The marker goes on the last text block of the last message with text
+    content. The marked message is copied, so caller-owned dicts are not
+    modified; the list itself is updated in place and returned.
+    """
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        content = message.get("content")
+        if isinstance(content, str) and content:
+            blocks = [{"type": "text", "text": content}]
+        elif isinstance(content, list) and content:
+            blocks = [
+                {"type": "text", "text": item} if isinstance(item, str) else item
+                for item in content
+            ]
+        else:
+            continue
+
+        for position in range(len(blocks) - 1, -1, -1):
+            if blocks[position].get("type") == "text":
+                blocks[position] = {**blocks[position], "cache_control": CACHE_CONTROL}
+                messages[index] = {**message, "content": blocks}
+                return messages
+    return messages
+
+
+def add_tools_breakpoint(tools: Optional[List[dict]]) -> Optional[List[dict]]:
+    """Return tools with a cache breakpoint on the last definition.
+
+    The input list is often shared (see `ToolCollection.to_params`), so a
+    new list is returned instead of modifying it.
+    """
+    if not tools:
+        return tools
+    return [*tools[:-1], {**tools[-1], "cache_control": CACHE_CONTROL}]
+
+
+def get_cached_tokens(usage: Any) -> int:
+    """Prompt tokens served from the provider's cache, 0 if not reported"""
+    if usage is None:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        # Anthropic-compatible gateways report cache reads separately
+        cached = getattr(usage, "cache_read_input_tokens", None)
+    return cached or 0
+
+
+def get_cache_write_tokens(usage: Any) -> int:
+    """Prompt tokens written to the provider's cache, 0 if not reported"""
+    if usage is None:
+        return 0
+    return getattr(usage, "cache_creation_input_tokens", None) or 0
@@ -0,0 +1,156 @@
+"""Process-wide request and token rate limiting for LLM calls.
+
+Every ``LLM`` instance built from the same ``config_name`` shares one
+``RateLimiter``, so concurrent agents queue in arrival order instead of
+stampeding the provider and retrying blindly on 429s.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+from app.logger import logger
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute.
+
+    The level may drop below zero when a reservation is reconciled with a
+    larger actual usage; the debt is paid back by later refills.
+    """
+
+    def __init__(self, capacity: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._clock = clock
+        self._updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(
+            self.capacity, self.level + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        """Return (or, if negative, additionally charge) capacity"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter with FIFO queuing.
+
+    Callers reserve one request plus their estimated input tokens with
+    `acquire` and correct the estimate with `reconcile` once the provider
+    reports actual usage.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        clock=time.monotonic,
+    ):
+        self.requests = (
+            TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        )
+        # asyncio locks bind to the loop they are first used on
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.stats: Dict[str, float] = {"acquired": 0, "waited": 0, "wait_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until one request and the given tokens fit, then reserve them.
+
+        Waiters are served strictly in arrival order: the lock is FIFO and
+        only the head of the queue sleeps on the buckets.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if not self.enabled:
+            return 0.0
+
+        start = time.monotonic()
+        async with self._get_lock():
+            while (wait := self._wait_time(tokens)) > 0:
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+        waited = time.monotonic() - start
+        self.stats["acquired"] += 1
+        if waited > 0.001:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += waited
+            logger.debug(f"Rate limiter delayed request by {waited:.2f}s")
+        return waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct a reservation once the provider reports actual usage"""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.give(estimated_tokens - actual_tokens)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    config_name: str,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+) -> Optional[RateLimiter]:
+    """Return the limiter shared by every LLM using config_name.
+
+    Returns None when neither limit is configured.
+    """
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(config_name)
+        if limiter is None:
+            limiter = _limiters[config_name] = RateLimiter(
+                requests_per_minute, tokens_per_minute
+            )
+        return limiter
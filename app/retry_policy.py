@@ -0,0 +1,317 @@
+"""Retry policy and circuit breakers for LLM calls.
+
+Only errors that may succeed on a second attempt are retried: connection
+problems (including streams dropped mid-response), timeouts, throttling
+and 5xx responses. Bad requests, bad
+credentials and `TokenLimitExceeded` are raised at once. Waits honor the
+provider's ``Retry-After`` and the whole retry loop of a call is capped.
+
+Each LLM config also has a `CircuitBreaker`. After repeated endpoint failures
+it opens and calls fail fast with `CircuitOpenError` instead of every agent
+stalling on a dead endpoint; after a cool-down one trial call is let through.
+Only outages (connection problems, timeouts and 5xx responses) count as
+failures: throttling and bad credentials never open the circuit. A call
+whose retry budget outlasts the cool-down waits for the trial instead of
+failing.
+"""
+import asyncio
+import functools
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+from botocore.exceptions import HTTPClientError
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from app.exceptions import CircuitOpenError, OpenManusError
+from app.logger import logger
+
+
+T = TypeVar("T")
+
+# Retryable HTTP statuses besides 5xx
+RETRYABLE_STATUSES = (408, 409, 429)
+# Bedrock (botocore ClientError) codes worth retrying
+RETRYABLE_AWS_CODES = (
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+)
+# Bedrock codes that mean the endpoint itself is down
+OUTAGE_AWS_CODES = (
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed when simply sent again"""
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, OpenManusError):
+        return False
+    if isinstance(
+        error,
+        (
+            APIConnectionError,
+            APITimeoutError,
+            RateLimitError,
+            asyncio.TimeoutError,
+            # Raised as-is while iterating a stream (dropped connections)
+            httpx.TransportError,
+            # Bedrock connection errors and timeouts
+            BotocoreConnectionError,
+            HTTPClientError,
+        ),
+    ):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code in RETRYABLE_STATUSES
+    aws_error = getattr(error, "response", None)
+    if isinstance(aws_error, dict):
+        return aws_error.get("Error", {}).get("Code") in RETRYABLE_AWS_CODES
+    return isinstance(error, ConnectionError)
+
+
+def is_outage(error: BaseException) -> bool:
+    """Whether an error says the endpoint is unreachable or broken.
+
+    Only connection problems, timeouts and 5xx responses count; throttling,
+    bad credentials and other 4xx errors are about the caller, not the
+    endpoint, and must not trip its circuit breaker.
+    """
+    if isinstance(error, OpenManusError):
+        return False
+    if isinstance(
+        error,
+        (
+            APIConnectionError,
+            APITimeoutError,
+            asyncio.TimeoutError,
+            httpx.TransportError,
+            BotocoreConnectionError,
+            HTTPClientError,
+        ),
+    ):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    aws_error = getattr(error, "response", None)
+    if isinstance(aws_error, dict):
+        return aws_error.get("Error", {}).get("Code") in OUTAGE_AWS_CODES
+    return isinstance(error, ConnectionError)
+
+
+def is_throttled(error: BaseException) -> bool:
+    """Whether the provider asked to slow down (429, Retry-After, Bedrock throttling)"""
+    if isinstance(error, RateLimitError) or (
+        isinstance(error, APIStatusError) and error.status_code == 429
+    ):
+        return True
+    aws_error = getattr(error, "response", None)
+    if isinstance(aws_error, dict):
+        return aws_error.get("Error", {}).get("Code") == "ThrottlingException"
+    return get_retry_after(error) is not None
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Seconds to wait, from Retry-After(-Ms) headers or an open circuit"""
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for one endpoint"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats: Dict[str, int] = {"opened": 0, "rejected": 0}
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go to the endpoint now"""
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_seconds - self._clock()
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(
+                    f"Circuit for LLM config {self.name} is open after "
+                    f"{self.consecutive_failures} consecutive failures",
+                    retry_after=remaining,
+                )
+            self.state = HALF_OPEN
+        if self._trial_in_flight:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(
+                f"Circuit for LLM config {self.name} is half-open, trial in flight"
+            )
+        self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = OPEN
+            self.opened_at = self._clock()
+            self.stats["opened"] += 1
+            logger.warning(
+                f"Opening circuit for LLM config {self.name} for "
+                f"{self.reset_seconds}s after {self.consecutive_failures} failures"
+            )
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about the endpoint"""
+        self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(
+    name: str, failure_threshold: int = 5, reset_seconds: float = 30.0
+) -> CircuitBreaker:
+    """Return the breaker shared by every LLM using the named config"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name, failure_threshold, reset_seconds
+            )
+        return breaker
+
+
+class RetryPolicy:
+    """Retry retryable errors with jittered exponential backoff.
+
+    Attempts stop after max_attempts, or when the next wait would take the
+    call past max_total_seconds since its first attempt.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 6,
+        min_wait: float = 1.0,
+        max_wait: float = 60.0,
+        max_total_seconds: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.max_total_seconds = max_total_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self.stats: Dict[str, int] = {"retries": 0, "fatal": 0, "exhausted": 0}
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Seconds to wait after the given (1-based) failed attempt"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        ceiling = min(self.max_wait, self.min_wait * 2**attempt)
+        return random.uniform(self.min_wait, max(self.min_wait, ceiling))
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        start = self._clock()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.stats["fatal"] += 1
+                    raise
+                wait = self.backoff(attempt, e)
+                elapsed = self._clock() - start
+                if (
+                    attempt >= self.max_attempts
+                    or elapsed + wait > self.max_total_seconds
+                ):
+                    self.stats["exhausted"] += 1
+                    logger.error(
+                        f"Giving up LLM call after {attempt} attempts "
+                        f"({elapsed:.1f}s): {e}"
+                    )
+                    raise
+                self.stats["retries"] += 1
+                logger.warning(
+                    f"Retrying LLM call in {wait:.1f}s (attempt {attempt}): {e}"
+                )
+                await self._sleep(wait)
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+def with_retries(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Run an LLM method under its instance's ``retry_policy``"""
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.retry_policy.call(method, self, *args, **kwargs)
+
+    return wrapper
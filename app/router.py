@@ -0,0 +1,225 @@
+"""Route LLM sub-tasks to the config their call site calls for.
+
+Agents reason with their own LLM, but cheaper sub-tasks (plan summaries,
+page extraction, ...) can run on a smaller model. Call sites name their
+task kind and `ModelRouter` picks an ``[llm.<name>]`` config from the
+``[llm_router]`` rules, matching on task, input token count and expected
+output size:
+
+    [[llm_router.rules]]
+    task = "summarize"
+    config = "fast"
+    max_input_tokens = 30000
+
+Every routed call is logged with its latency, tokens and estimated cost
+next to what the default config would have cost.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from pydantic import BaseModel, Field
+
+from app.config import LLMRouterSettings, RouteRule, config
+from app.llm import LLM, llm_registry
+from app.logger import logger
+from app.schema import Message
+from app.usage_ledger import PriceTable
+
+
+# Task kinds used by the built-in call sites
+PLAN = "plan"
+SUMMARIZE = "summarize"
+EXTRACT = "extract"
+
+T = TypeVar("T")
+
+
+class RoutingDecision(BaseModel):
+    """One routed call and its measured impact"""
+
+    timestamp: float = Field(default_factory=time.time)
+    task: str
+    config_name: str
+    model: str
+    default_model: str
+    input_tokens: int = Field(0, description="Estimated before routing")
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: Optional[float] = None
+    cost: Optional[float] = Field(None, description="USD on the routed model")
+    default_cost: Optional[float] = Field(
+        None, description="USD the same tokens would cost on the default model"
+    )
+
+
+class ModelRouter:
+    """Picks an LLM config per call from the [llm_router] rules"""
+
+    def __init__(
+        self,
+        settings: Optional[LLMRouterSettings] = None,
+        max_decisions: int = 1000,
+    ):
+        self.settings = settings or config.llm_router
+        self.prices = PriceTable(config.usage_ledger.prices)
+        self.decisions: Deque[RoutingDecision] = deque(maxlen=max_decisions)
+
+    @staticmethod
+    def _matches(
+        rule: RouteRule,
+        task: str,
+        input_tokens: int,
+        expected_output_tokens: Optional[int],
+    ) -> bool:
+        if rule.task is not None and rule.task != task:
+            return False
+        if rule.min_input_tokens is not None and input_tokens < rule.min_input_tokens:
+            return False
+        if rule.max_input_tokens is not None and input_tokens > rule.max_input_tokens:
+            return False
+        if rule.max_output_tokens is not None and (
+            expected_output_tokens is None
+            or expected_output_tokens > rule.max_output_tokens
+        ):
+            return False
+        return True
+
+    def route(
+        self,
+        task: str,
+        input_tokens: int = 0,
+        expected_output_tokens: Optional[int] = None,
+    ) -> Optional[str]:
+        """Config name of the first matching rule, None to keep the default"""
+        for rule in self.settings.rules:
+            if not self._matches(rule, task, input_tokens, expected_output_tokens):
+                continue
+            if rule.config not in config.llm:
+                logger.warning(
+                    f"Routing rule for {task!r} names unknown LLM config {rule.config!r}"
+                )
+                continue
+            return rule.config
+        return None
+
+    async def run(
+        self,
+        task: str,
+        call: Callable[[LLM], Awaitable[T]],
+        default: LLM,
+        messages: Optional[List[Message]] = None,
+        expected_output_tokens: Optional[int] = None,
+    ) -> T:
+        """Run call with the LLM routed for task, falling back to default.
+
+        Args:
+            task: Task kind, e.g. SUMMARIZE
+            call: Makes the request with the given LLM
+            default: LLM used when no rule matches
+            messages: Request messages, used to estimate the input tokens
+            expected_output_tokens: Call site's estimate of the output size
+        """
+        input_tokens = (
+            default.count_message_tokens(LLM.format_messages(messages))
+            if messages and self.settings.rules
+            else 0
+        )
+        config_name = self.route(task, input_tokens, expected_output_tokens)
+        if config_name is None or config_name == default.config_name:
+            return await call(default)
+
+        # A session handle keeps its session on the routed config
+        with llm_registry.on_config(default, config_name) as llm:
+            # Shared LLMs count every caller, so concurrent calls may blur these
+            prompt_before = llm.total_input_tokens
+            completion_before = llm.total_completion_tokens
+            start = time.monotonic()
+            try:
+                return await call(llm)
+            finally:
+                self._log(
+                    task,
+                    llm,
+                    default,
+                    input_tokens,
+                    llm.total_input_tokens - prompt_before,
+                    llm.total_completion_tokens - completion_before,
+                    time.monotonic() - start,
+                )
+
+    def _log(
+        self,
+        task: str,
+        llm: LLM,
+        default: LLM,
+        input_tokens: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+    ) -> None:
+        decision = RoutingDecision(
+            task=task,
+            config_name=llm.config_name,
+            model=llm.model,
+            default_model=default.model,
+            input_tokens=input_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=latency,
+            cost=self.prices.cost(llm.model, prompt_tokens, completion_tokens, 0),
+            default_cost=self.prices.cost(
+                default.model, prompt_tokens, completion_tokens, 0
+            ),
+        )
+        self.decisions.append(decision)
+
+        impact = ""
+        if decision.cost is not None and decision.default_cost is not None:
+            impact = (
+                f", cost ${decision.cost:.4f} vs ${decision.default_cost:.4f} "
+                f"on {default.model}"
+            )
+        logger.info(
+            f"Routed {task} to {llm.config_name} ({llm.model}): "
+            f"{prompt_tokens} prompt + {completion_tokens} completion tokens "
+            f"in {latency:.2f}s{impact}"
+        )
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Routed calls, tokens, latency and cost per task"""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for decision in self.decisions:
+            task = stats.setdefault(
+                decision.task,
+                {
+                    "calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "latency": 0.0,
+                    "cost": 0.0,
+                    "default_cost": 0.0,
+                },
+            )
+            task["calls"] += 1
+            task["prompt_tokens"] += decision.prompt_tokens
+            task["completion_tokens"] += decision.completion_tokens
+            task["latency"] += decision.latency or 0.0
+            task["cost"] += decision.cost or 0.0
+            task["default_cost"] += decision.default_cost or 0.0
+        return stats
+
+
+_shared_router: Optional[ModelRouter] = None
+_shared_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide model router"""
+    global _shared_router
+    if _shared_router is None:
+        with _shared_router_lock:
+            if _shared_router is None:
+                _shared_router = ModelRouter()
+    return _shared_router
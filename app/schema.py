@@ -1,7 +1,11 @@
+import asyncio
+import json
 from enum import Enum
-from typing import Any, List, Literal, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from app.logger import logger
 
 
 class Role(str, Enum):
@@ -38,6 +42,43 @@ class AgentState(str, Enum):
     ERROR = "ERROR"
 
 
+def format_message_dict(message: dict, supports_images: bool = False) -> dict:
+    """Fold a message dict's base64_image into its content, in place.
+
+    Without image support the image is dropped and the text content kept.
+    """
+    if supports_images and message.get("base64_image"):
+        # Initialize or convert content to appropriate format
+        if not message.get("content"):
+            message["content"] = []
+        elif isinstance(message["content"], str):
+            message["content"] = [{"type": "text", "text": message["content"]}]
+        elif isinstance(message["content"], list):
+            # Convert string items to proper text objects
+            message["content"] = [
+                {"type": "text", "text": item} if isinstance(item, str) else item
+                for item in message["content"]
+            ]
+
+        # Add the image to content
+        message["content"].append(
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{message['base64_image']}"
+                },
+            }
+        )
+
+        # Remove the base64_image field
+        del message["base64_image"]
+    # If model doesn't support images but message has base64_image, handle gracefully
+    elif not supports_images and message.get("base64_image"):
+        # Just remove the base64_image field and keep the text content
+        del message["base64_image"]
+    return message
+
+
 class Function(BaseModel):
     name: str
     arguments: str
@@ -61,6 +102,23 @@ class Message(BaseModel):
     tool_call_id: Optional[str] = Field(default=None)
     base64_image: Optional[str] = Field(default=None)
 
+    # Provider-ready dicts by supports_images and the token count used by
+    # Memory, cleared whenever a field is set
+    _formatted: Dict[bool, dict] = PrivateAttr(default_factory=dict)
+    _tokens: Optional[int] = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self._formatted = {}
+            self._tokens = None
+
+    def model_copy(self, *, update=None, deep: bool = False) -> "Message":
+        copied = super().model_copy(update=update, deep=deep)
+        copied._formatted = {}
+        copied._tokens = None
+        return copied
+
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
         if isinstance(other, list):
@@ -96,6 +154,21 @@ class Message(BaseModel):
             message["base64_image"] = self.base64_image
         return message
 
+    def to_formatted(self, supports_images: bool = False) -> dict:
+        """Provider-ready dict of the message, built once and then cached.
+
+        The dict is shared by every request using the message and must not
+        be modified; in-place changes to tool_calls are not detected.
+        """
+        # Read the cache through the slot, as private attribute access goes
+        # through BaseModel.__getattr__ and dominates long histories
+        cache = self.__pydantic_private__["_formatted"]
+        formatted = cache.get(supports_images)
+        if formatted is None:
+            formatted = format_message_dict(self.to_dict(), supports_images)
+            cache[supports_images] = formatted
+        return formatted
+
     @classmethod
     def user_message(
         cls, content: str, base64_image: Optional[str] = None
@@ -156,29 +229,260 @@ class Message(BaseModel):
         )
 
 
+# Summarizes evicted messages, given the previous summary (None at first)
+Summarizer = Callable[[Optional[str], List[Message]], Awaitable[str]]
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
 class Memory(BaseModel):
     messages: List[Message] = Field(default_factory=list)
     max_messages: int = Field(default=100)
+    max_tokens: Optional[int] = Field(
+        default=None, description="Token budget, None to bound by message count only"
+    )
+    token_counter: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="TokenCounter for the budget; sizes are estimated without one",
+    )
+    summarizer: Optional[Summarizer] = Field(
+        default=None,
+        exclude=True,
+        description="Turns evicted messages into a rolling summary, in the background",
+    )
+
+    # Formatted messages handed to the LLM, grown at the tail between calls
+    _formatted: List[dict] = PrivateAttr(default_factory=list)
+    _formatted_images: bool = PrivateAttr(default=False)
+    # Token total of the messages; may go stale when messages are replaced,
+    # so it is recounted before evicting
+    _total_tokens: int = PrivateAttr(default=0)
+    _summary: Optional[Message] = PrivateAttr(default=None)
+    _evicted: List[Message] = PrivateAttr(default_factory=list)
+    _summary_task: Optional[asyncio.Task] = PrivateAttr(default=None)
+    # Compact copy of the messages while the agent is idle, see `park`
+    _parked: Optional[Any] = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Assigned messages replace the whole history, parked messages included
+        if name == "messages":
+            self._parked = None
+        super().__setattr__(name, value)
 
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
+        self.unpark()
         self.messages.append(message)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        if self.max_tokens is not None:
+            self._total_tokens += self.count_tokens(message)
+        self._evict()
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
+        self.unpark()
         self.messages.extend(messages)
+        if self.max_tokens is not None:
+            self._total_tokens += sum(self.count_tokens(m) for m in messages)
+        self._evict()
+
+    def count_tokens(self, message: Message) -> int:
+        """Tokens of a message, cached on it until it changes"""
+        private = message.__pydantic_private__
+        tokens = private.get("_tokens")
+        if tokens is None:
+            formatted = message.to_formatted(False)
+            if self.token_counter is not None:
+                tokens = self.token_counter.count_single_message(formatted)
+                if message.base64_image:
+                    tokens += self.token_counter.count_image({"detail": "medium"})
+            else:
+                # Roughly 4 bytes per token, plus a flat cost for an image
+                size = len(json.dumps(formatted, ensure_ascii=False).encode("utf-8"))
+                tokens = size // 4 + (1000 if message.base64_image else 0)
+            private["_tokens"] = tokens
+        return tokens
+
+    def _over_budget(self) -> bool:
+        if len(self.messages) > self.max_messages:
+            return True
+        if self.max_tokens is None or self._total_tokens <= self.max_tokens:
+            return False
+        self._total_tokens = sum(self.count_tokens(m) for m in self.messages)
+        return self._total_tokens > self.max_tokens
+
+    def _oldest_group(self) -> tuple:
+        """Bounds of the oldest evictable group of messages.
+
+        Leading system messages (and the summary) are kept. An assistant
+        message with tool calls is evicted with the tool messages answering
+        it, so no tool result is left without its call. The last group is
+        never evicted.
+        """
+        start = 0
+        while start < len(self.messages) and self.messages[start].role == Role.SYSTEM:
+            start += 1
+        end = start + 1
+        first = self.messages[start] if start < len(self.messages) else None
+        if first is not None and first.role == Role.ASSISTANT and first.tool_calls:
+            call_ids = {call.id for call in first.tool_calls}
+            while (
+                end < len(self.messages)
+                and self.messages[end].role == Role.TOOL
+                and self.messages[end].tool_call_id in call_ids
+            ):
+                end += 1
+        # Tool results whose call was evicted earlier go with it
+        while end < len(self.messages) and self.messages[end].role == Role.TOOL:
+            end += 1
+        return start, end
+
+    def _evict(self) -> None:
+        """Drop the oldest groups, in place, until memory fits its bounds"""
+        evicted: List[Message] = []
+        while self._over_budget():
+            start, end = self._oldest_group()
+            if end >= len(self.messages):
+                break
+            group = self.messages[start:end]
+            del self.messages[start:end]
+            if self.max_tokens is not None:
+                self._total_tokens -= sum(self.count_tokens(m) for m in group)
+            evicted.extend(group)
+        if evicted and self.summarizer is not None:
+            self._evicted.extend(evicted)
+            self._schedule_summary()
+
+    def _schedule_summary(self) -> None:
+        if self._summary_task is not None and not self._summary_task.done():
+            return  # Picked up when the running summary finishes
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Summarized on the next eviction inside the event loop
+        batch, self._evicted = self._evicted, []
+        self._summary_task = loop.create_task(self._summarize(batch))
+
+    async def _summarize(self, batch: List[Message]) -> None:
+        previous = self._summary.content if self._summary else None
+        if previous:
+            previous = previous[len(SUMMARY_PREFIX) :].strip()
+        try:
+            text = await self.summarizer(previous, batch)
+        except Exception as e:
+            logger.warning(f"Summarizing {len(batch)} evicted messages failed: {e}")
+            self._evicted[:0] = batch
+            return
+        summary = Message.system_message(f"{SUMMARY_PREFIX}\n{text}")
+        index = next(
+            (i for i, m in enumerate(self.messages) if m is self._summary), None
+        )
+        if index is not None:
+            self.messages[index] = summary
+        else:
+            index = 0
+            while (
+                index < len(self.messages) and self.messages[index].role == Role.SYSTEM
+            ):
+                index += 1
+            self.messages.insert(index, summary)
+        self._summary = summary
+        if self.max_tokens is not None:
+            self._total_tokens = sum(self.count_tokens(m) for m in self.messages)
+        if self._evicted:
+            self._schedule_summary()
+
+    @property
+    def summary(self) -> Optional[str]:
+        """The rolling summary of evicted messages, if any"""
+        return self._summary.content if self._summary else None
+
+    async def wait_for_summary(self) -> None:
+        """Wait until evicted messages are summarized"""
+        while self._summary_task is not None and not self._summary_task.done():
+            await self._summary_task
+
+    @property
+    def parked(self) -> bool:
+        return self._parked is not None
+
+    def park(self) -> None:
+        """Move the messages into a compact `MessageStore` while idle.
+
+        ``messages`` stays empty until `unpark`, which adding messages,
+        `formatted_messages` and `get_recent_messages` do implicitly;
+        `to_dict_list` reads the store without rebuilding the messages.
+        """
+        # Imported here: message_store builds on this module
+        from app.message_store import MessageStore
+
+        if self._parked is not None or not self.messages:
+            return
+        if self._evicted or (
+            self._summary_task is not None and not self._summary_task.done()
+        ):
+            return  # A running summary edits the messages in place
+        parked = MessageStore.from_messages(self.messages)
+        self.messages = []
+        self._parked = parked
+        self._formatted = []
+
+    def unpark(self) -> None:
+        """Rebuild the messages of parked memory"""
+        if self._parked is None:
+            return
+        self.messages = self._parked.to_messages() + self.messages
+        if self._summary is not None:
+            self._summary = next(
+                (
+                    m
+                    for m in self.messages
+                    if m.role == Role.SYSTEM and m.content == self._summary.content
+                ),
+                None,
+            )
 
     def clear(self) -> None:
         """Clear all messages"""
+        self._parked = None
         self.messages.clear()
+        self._total_tokens = 0
+        self._summary = None
+        self._evicted.clear()
 
     def get_recent_messages(self, n: int) -> List[Message]:
         """Get n most recent messages"""
+        self.unpark()
         return self.messages[-n:]
 
     def to_dict_list(self) -> List[dict]:
         """Convert messages to list of dicts"""
+        if self._parked is not None:
+            return self._parked.to_dict_list()
         return [msg.to_dict() for msg in self.messages]
+
+    def formatted_messages(self, supports_images: bool = False) -> List[dict]:
+        """Provider-ready dicts of the messages, for `LLM.format_messages`.
+
+        While messages are only appended, the previous list is reused and
+        just the new tail is formatted; it is rebuilt from the per-message
+        caches when earlier messages were replaced, changed or removed.
+        """
+        self.unpark()
+        formatted = self._formatted
+        valid = 0
+        if supports_images == self._formatted_images and len(formatted) <= len(
+            self.messages
+        ):
+            for cached, message in zip(formatted, self.messages):
+                if message.to_formatted(supports_images) is not cached:
+                    break
+                valid += 1
+        if valid < len(formatted):
+            formatted = self._formatted = formatted[:valid]
+        self._formatted_images = supports_images
+        formatted.extend(
+            message.to_formatted(supports_images)
+            for message in self.messages[len(formatted) :]
+        )
+        return list(formatted)
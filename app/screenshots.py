@@ -0,0 +1,131 @@
+"""Screenshot pipeline for agent memory.
+
+Browser screenshots are full-page JPEGs at quality 100 and, left alone,
+every one of them is resent with every later request. `ScreenshotPipeline`
+keeps the per-step request size bounded:
+
+- screenshots are downscaled and recompressed to the [screenshots] config
+- a screenshot perceptually identical to the last attached one is skipped
+- only the last ``keep_last`` images stay in memory, older ones are
+  replaced by a short text placeholder
+"""
+import base64
+import io
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from app.config import ScreenshotSettings, config
+from app.logger import logger
+from app.schema import Message
+
+
+PLACEHOLDER = "[screenshot removed, superseded by later screenshots]"
+
+
+def difference_hash(image: Image.Image, size: int = 16) -> int:
+    """Perceptual hash (size² bits) comparing the brightness of adjacent pixels.
+
+    16x16 is fine enough for a changed form field or a scrolled page to show
+    up on a full-page screenshot; coarser hashes miss such changes.
+    """
+    pixels = list(
+        image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata()
+    )
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class ScreenshotPipeline:
+    """Prepares screenshots for memory and ages out old ones, per agent"""
+
+    def __init__(self, settings: Optional[ScreenshotSettings] = None):
+        self.settings = settings or config.screenshots
+        self._last_hash: Optional[int] = None
+        self.stats: Dict[str, int] = {
+            "screenshots": 0,
+            "duplicates": 0,
+            "aged_out": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+
+    def process(self, base64_image: str) -> Optional[str]:
+        """Return the screenshot to attach, or None if it repeats the last one.
+
+        Images that cannot be decoded are passed through unchanged.
+        """
+        self.stats["screenshots"] += 1
+        self.stats["bytes_in"] += len(base64_image)
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(base64_image)))
+            image.load()
+        except Exception as e:
+            logger.warning(f"Could not decode screenshot, attaching it as is: {e}")
+            self.stats["bytes_out"] += len(base64_image)
+            return base64_image
+
+        # Compare with the last attached screenshot, so small changes cannot
+        # accumulate unseen across a run of skipped ones
+        image_hash = difference_hash(image)
+        distance = self.settings.dedupe_distance
+        if (
+            distance is not None
+            and self._last_hash is not None
+            and hash_distance(self._last_hash, image_hash) <= distance
+        ):
+            self.stats["duplicates"] += 1
+            return None
+        self._last_hash = image_hash
+
+        encoded = base64.b64encode(self.compress(image)).decode("ascii")
+        self.stats["bytes_out"] += len(encoded)
+        return encoded
+
+    def compress(self, image: Image.Image) -> bytes:
+        """Downscale to max_width, crop to max_height and encode as JPEG"""
+        settings = self.settings
+        if image.width > settings.max_width:
+            height = max(1, round(image.height * settings.max_width / image.width))
+            image = image.resize((settings.max_width, height), Image.Resampling.LANCZOS)
+        if image.height > settings.max_height:
+            image = image.crop((0, 0, image.width, settings.max_height))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(
+            buffer, format="JPEG", quality=settings.quality, optimize=True
+        )
+        return buffer.getvalue()
+
+    def age_out(self, messages: List[Message]) -> int:
+        """Replace all but the last keep_last images with a placeholder, in place.
+
+        Messages are replaced by copies, so other holders of the old objects
+        are unaffected. Returns the number of images removed.
+        """
+        kept = 0
+        removed = 0
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            if not message.base64_image:
+                continue
+            if kept < self.settings.keep_last:
+                kept += 1
+                continue
+            content = (
+                f"{message.content}\n{PLACEHOLDER}" if message.content else PLACEHOLDER
+            )
+            messages[index] = message.model_copy(
+                update={"content": content, "base64_image": None}
+            )
+            removed += 1
+        self.stats["aged_out"] += removed
+        return removed
@@ -0,0 +1,56 @@
+"""Coalesce identical LLM requests while one is in flight.
+
+Concurrent agents and flows often send the very same request at once (the
+same planning prompt, an extraction of the same page). `SingleFlight` lets
+the first caller send it and hands every identical request that arrives
+before the response the same result, so the provider sees one call.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Shares the result of an in-flight call with callers using the same key.
+
+    The call runs as its own task: a caller that is cancelled does not
+    cancel it for the others. Errors are raised to every caller and the key
+    is released as soon as the call finishes, so retries send anew.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"sent": 0, "coalesced": 0}
+
+    async def run(
+        self, key: str, call: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """Await call, or the identical call in flight.
+
+        Returns:
+            The result and whether it was shared from another caller's call
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future), True
+
+        self.stats["sent"] += 1
+        future = asyncio.ensure_future(call())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._release(key, done))
+        return await asyncio.shield(future), False
+
+    def _release(self, key: str, future: asyncio.Future) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.stats["sent"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight(),
+            "coalesced_rate": self.stats["coalesced"] / total if total else 0.0,
+        }
@@ -0,0 +1,242 @@
+"""Destinations for streamed completion text.
+
+Streaming calls used to print every chunk to the terminal. They now write
+to a `StreamSink`: the terminal (`StdoutSink`), an asyncio queue
+(`QueueSink`), any number of WebSocket/SSE listeners (`FanoutSink`) or
+nowhere (`NullSink`). Chunks are buffered and flushed on a short timer
+rather than once per token.
+
+The sink of a call is, in order: the ``sink`` argument of the LLM method,
+the sink set with `stream_to` (agents set theirs for their steps), and a
+new sink of the config's ``stream_sink`` kind. Sinks buffer per completion,
+so one sink should not serve concurrent completions unless, like
+`FanoutSink`, it is meant to merge them.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional, Set, TextIO
+
+
+STDOUT = "stdout"
+NULL = "null"
+
+_sink: ContextVar[Optional["StreamSink"]] = ContextVar("stream_sink", default=None)
+
+
+@contextmanager
+def stream_to(sink: Optional["StreamSink"]):
+    """Send streamed text of LLM calls made inside the block to sink"""
+    if sink is None:
+        yield
+        return
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
+
+
+def current_stream_sink() -> Optional["StreamSink"]:
+    return _sink.get()
+
+
+class StreamSink(ABC):
+    """Receives the text of streamed completions.
+
+    Subclasses implement `_emit`, which gets buffered text at most every
+    flush_interval seconds (and at the end of each completion), and
+    optionally `_end`, called once a completion is complete.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, max_buffer_chars: int = 4096):
+        self.flush_interval = flush_interval
+        self.max_buffer_chars = max_buffer_chars
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        # The first chunk of each completion is written at once
+        self._last_flush = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = threading.Lock()
+        self.stats = {"chunks": 0, "flushes": 0}
+
+    def write(self, text: str) -> None:
+        """Buffer a chunk, flushing if the interval elapsed or the buffer is full"""
+        if not text:
+            return
+        with self._lock:
+            self._buffer.append(text)
+            self._buffered_chars += len(text)
+            self.stats["chunks"] += 1
+            due = (
+                self._buffered_chars >= self.max_buffer_chars
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        # Flush a trailing chunk even if the stream stalls; only possible from
+        # the event loop thread, other threads rely on the next write or end
+        if self._timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._buffered_chars = 0
+            self._last_flush = time.monotonic()
+        if text:
+            self.stats["flushes"] += 1
+            self._emit(text)
+
+    def end(self) -> None:
+        """Flush and mark the end of a completion"""
+        self.flush()
+        self._last_flush = 0.0
+        self._end()
+
+    @abstractmethod
+    def _emit(self, text: str) -> None:
+        """Deliver buffered text"""
+
+    def _end(self) -> None:
+        pass
+
+
+class StdoutSink(StreamSink):
+    """Writes to the terminal, one line per completion"""
+
+    def __init__(self, stream: Optional[TextIO] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream
+
+    def _emit(self, text: str) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+    def _end(self) -> None:
+        self._emit("\n")
+
+
+class NullSink(StreamSink):
+    """Discards streamed text"""
+
+    def write(self, text: str) -> None:
+        pass
+
+    def _emit(self, text: str) -> None:
+        pass
+
+
+class QueueSink(StreamSink):
+    """Puts text on an asyncio queue; None marks the end of a completion.
+
+    Safe to write from worker threads: items are handed to the queue's
+    event loop.
+    """
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.queue = queue or asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+
+    def _put(self, item: Optional[str]) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self.queue.put_nowait(item)
+        else:
+            self._loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def _emit(self, text: str) -> None:
+        self._put(text)
+
+    def _end(self) -> None:
+        self._put(None)
+
+
+class FanoutSink(StreamSink):
+    """Broadcasts text to every subscriber, e.g. WebSocket or SSE clients.
+
+    Each subscriber gets its own queue and reads with `events` or
+    `sse_events`; subscribers that fall max_queue chunks behind are dropped.
+    """
+
+    def __init__(self, max_queue: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_queue = max_queue
+        self._subscribers: Set[QueueSink] = set()
+        self.stats["dropped_subscribers"] = 0
+
+    def subscribe(self) -> QueueSink:
+        subscriber = QueueSink(asyncio.Queue(self.max_queue), flush_interval=0)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: QueueSink) -> None:
+        self._subscribers.discard(subscriber)
+
+    def _broadcast(self, item: Optional[str]) -> None:
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber._put(item)
+            except asyncio.QueueFull:
+                self.unsubscribe(subscriber)
+                self.stats["dropped_subscribers"] += 1
+
+    def _emit(self, text: str) -> None:
+        self._broadcast(text)
+
+    def _end(self) -> None:
+        self._broadcast(None)
+
+    async def events(self) -> AsyncIterator[Optional[str]]:
+        """Yield text chunks, and None at the end of each completion"""
+        subscriber = self.subscribe()
+        try:
+            while True:
+                yield await subscriber.queue.get()
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def sse_events(self) -> AsyncIterator[str]:
+        """Yield Server-Sent Events frames: text as data, completions as "end" """
+        subscriber = self.subscribe()
+        try:
+            while True:
+                item = await subscriber.queue.get()
+                if item is None:
+                    yield "event: end\ndata: \n\n"
+                else:
+                    yield f"data: {json.dumps(item)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def make_stream_sink(kind: str, flush_interval: float = 0.05) -> StreamSink:
+    """Build the sink named in an LLM config (stdout or null)"""
+    if kind == NULL:
+        return NullSink()
+    if kind == STDOUT:
+        return StdoutSink(flush_interval=flush_interval)
+    raise ValueError(f"Unknown stream sink: {kind}")
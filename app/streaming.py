@@ -0,0 +1,114 @@
+"""Helpers for consuming streamed chat completions."""
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.completion_usage import CompletionUsage
+
+
+ToolCallCallback = Callable[
+    [ChatCompletionMessageToolCall], Union[None, Awaitable[None]]
+]
+
+
+async def notify_tool_call(
+    callback: Optional[ToolCallCallback], tool_call: ChatCompletionMessageToolCall
+) -> None:
+    """Invoke a sync or async tool call callback"""
+    if callback is None:
+        return
+    result = callback(tool_call)
+    if inspect.isawaitable(result):
+        await result
+
+
+class ToolCallAssembler:
+    """Assemble a streamed completion into a ChatCompletionMessage.
+
+    Tool call deltas arrive as fragments (id and name first, then argument
+    pieces) addressed by index. A call is complete once a delta for a later
+    index arrives or the stream ends, at which point ``on_tool_call`` fires,
+    so callers can start acting on the first call while later ones are
+    still being generated.
+    """
+
+    def __init__(self, on_tool_call: Optional[ToolCallCallback] = None):
+        self.on_tool_call = on_tool_call
+        self.content_parts: List[str] = []
+        self.usage: Optional[CompletionUsage] = None
+        self.finish_reason: Optional[str] = None
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self._completed: List[ChatCompletionMessageToolCall] = []
+        self._open_index: Optional[int] = None
+
+    @property
+    def content(self) -> str:
+        return "".join(self.content_parts)
+
+    @property
+    def completion_text(self) -> str:
+        """All generated text, used to estimate completion tokens"""
+        arguments = "".join(call["arguments"] for call in self._calls.values())
+        names = "".join(call["name"] for call in self._calls.values())
+        return self.content + names + arguments
+
+    async def add_chunk(self, chunk: Any) -> None:
+        """Consume one ChatCompletionChunk"""
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta is not None:
+            if delta.content:
+                self.content_parts.append(delta.content)
+            for fragment in delta.tool_calls or []:
+                await self._add_tool_call_delta(fragment)
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+            await self._close_open_call()
+
+    async def _add_tool_call_delta(self, fragment: Any) -> None:
+        index = fragment.index if fragment.index is not None else len(self._calls)
+        if self._open_index is not None and index != self._open_index:
+            await self._close_open_call()
+        call = self._calls.setdefault(index, {"id": "", "name": "", "arguments": ""})
+        self._open_index = index
+        if fragment.id:
+            call["id"] = fragment.id
+        function = fragment.function
+        if function is not None:
+            if function.name:
+                call["name"] += function.name
+            if function.arguments:
+                call["arguments"] += function.arguments
+
+    async def _close_open_call(self) -> None:
+        if self._open_index is None:
+            return
+        call = self._calls[self._open_index]
+        self._open_index = None
+        tool_call = ChatCompletionMessageToolCall.model_validate(
+            {
+                "id": call["id"],
+                "type": "function",
+                "function": {"name": call["name"], "arguments": call["arguments"]},
+            }
+        )
+        self._completed.append(tool_call)
+        await notify_tool_call(self.on_tool_call, tool_call)
+
+    async def finish(self) -> Optional[ChatCompletionMessage]:
+        """Close any pending tool call and build the final message.
+
+        Returns None if the stream produced neither content nor tool calls.
+        """
+        await self._close_open_call()
+        if not self.content_parts and not self._completed:
+            return None
+        return ChatCompletionMessage(
+            role="assistant",
+            content=self.content or None,
+            tool_calls=list(self._completed) or None,
+        )
@@ -0,0 +1,83 @@
+"""Fast token estimates for long texts.
+
+Encoding a 50k-character page dump with tiktoken on every step costs far
+more than the request bookkeeping it feeds, and for non-OpenAI models the
+local tokenizer is only an approximation anyway. `TokenEstimator` instead
+estimates long texts from their UTF-8 size and learns the bytes-per-token
+ratio online from the ``usage.prompt_tokens`` providers report.
+"""
+import math
+from contextvars import ContextVar
+from typing import Dict, Tuple
+
+
+# (estimated bytes, tokens estimated for them) of the last message count in
+# the current task, used to calibrate against the provider's usage
+last_estimate: ContextVar[Tuple[int, int]] = ContextVar(
+    "last_token_estimate", default=(0, 0)
+)
+
+
+class TokenEstimator:
+    """Bytes-per-token estimator for texts above a size threshold.
+
+    Any object with the same methods can be plugged into `TokenCounter`.
+    """
+
+    def __init__(
+        self,
+        threshold_chars: int = 4000,
+        bytes_per_token: float = 4.0,
+        alpha: float = 0.2,
+        min_bytes_per_token: float = 1.0,
+        max_bytes_per_token: float = 8.0,
+    ):
+        self.threshold_chars = threshold_chars
+        self.bytes_per_token = bytes_per_token
+        self.alpha = alpha
+        self.min_bytes_per_token = min_bytes_per_token
+        self.max_bytes_per_token = max_bytes_per_token
+        self.stats: Dict[str, float] = {"estimated_texts": 0, "calibrations": 0}
+
+    def should_estimate(self, text: str) -> bool:
+        return len(text) >= self.threshold_chars
+
+    def measure(self, text: str) -> int:
+        """Size of a text in UTF-8 bytes"""
+        self.stats["estimated_texts"] += 1
+        return len(text.encode("utf-8"))
+
+    def tokens_for(self, n_bytes: int) -> int:
+        return math.ceil(n_bytes / self.bytes_per_token) if n_bytes else 0
+
+    def calibrate(
+        self,
+        counted_tokens: int,
+        actual_tokens: int,
+        estimated_bytes: int,
+        estimated_tokens: int,
+    ) -> None:
+        """Update the ratio from one request.
+
+        Args:
+            counted_tokens: Local count of the whole prompt
+            actual_tokens: Prompt tokens reported by the provider
+            estimated_bytes: Bytes of the prompt that were estimated
+            estimated_tokens: Tokens the estimate contributed to counted_tokens
+        """
+        if not estimated_bytes or not actual_tokens:
+            return
+        # Attribute the whole difference to the estimated part
+        exact_tokens = counted_tokens - estimated_tokens
+        target = actual_tokens - exact_tokens
+        if target <= 0:
+            return
+        observed = min(
+            self.max_bytes_per_token,
+            max(self.min_bytes_per_token, estimated_bytes / target),
+        )
+        self.bytes_per_token += self.alpha * (observed - self.bytes_per_token)
+        self.stats["calibrations"] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        return {**self.stats, "bytes_per_token": self.bytes_per_token}
@@ -8,6 +8,8 @@ class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # No side effects: agents may run it before a streamed response is complete
+    read_only: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -20,6 +22,14 @@ class BaseTool(ABC, BaseModel):
     async def execute(self, **kwargs) -> Any:
         """Execute the tool with given parameters."""
 
+    def is_read_only(self, **kwargs) -> bool:
+        """Whether a call with these arguments has no side effects.
+
+        Tools with both reading and writing commands override this to judge
+        each call; by default it is ``read_only``.
+        """
+        return self.read_only
+
     def to_param(self) -> Dict:
         """Convert tool to function call format."""
         return {
@@ -12,6 +12,7 @@ from pydantic_core.core_schema import ValidationInfo
 
 from app.config import config
 from app.llm import LLM
+from app.router import EXTRACT, get_model_router
 from app.tool.base import BaseTool, ToolResult
 from app.tool.web_search import WebSearch
 
@@ -48,6 +49,9 @@ Utility:
 
 Context = TypeVar("Context")
 
+# Actions that only read the current page
+READ_ONLY_ACTIONS = ("extract_content", "get_dropdown_options")
+
 
 class BrowserUseTool(BaseTool, Generic[Context]):
     name: str = "browser_use"
@@ -151,6 +155,9 @@ class BrowserUseTool(BaseTool, Generic[Context]):
             raise ValueError("Parameters cannot be empty")
         return v
 
+    def is_read_only(self, **kwargs) -> bool:
+        return kwargs.get("action") in READ_ONLY_ACTIONS
+
     async def _ensure_browser_initialized(self) -> BrowserContext:
         """Ensure browser and context are initialized."""
         if self.browser is None:
@@ -471,11 +478,17 @@ Page content:
                             },
                         }
 
-                        # Use LLM to extract content with required function calling
-                        response = await self.llm.ask_tool(
-                            messages,
-                            tools=[extraction_function],
-                            tool_choice="required",
+                        # Use LLM to extract content with required function calling,
+                        # on the config routed for extraction
+                        response = await get_model_router().run(
+                            EXTRACT,
+                            lambda llm: llm.ask_tool(
+                                messages,
+                                tools=[extraction_function],
+                                tool_choice="required",
+                            ),
+                            default=self.llm,
+                            messages=messages,
                         )
 
                         # Extract content from function call response
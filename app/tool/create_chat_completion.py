@@ -10,6 +10,7 @@ class CreateChatCompletion(BaseTool):
     description: str = (
         "Creates a structured completion with specified output formatting."
     )
+    read_only: bool = True
 
     # Type mapping for JSON schema
     type_mapping: dict = {
@@ -1,5 +1,5 @@
 """Collection classes for managing multiple tools."""
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
 
 from app.exceptions import ToolError
 from app.tool.base import BaseTool, ToolFailure, ToolResult
@@ -14,12 +14,49 @@ class ToolCollection:
     def __init__(self, *tools: BaseTool):
         self.tools = tools
         self.tool_map = {tool.name: tool for tool in tools}
+        self._params_cache: Optional[Tuple[tuple, List[Dict[str, Any]]]] = None
+        self._params_tokens: Dict[Hashable, int] = {}
 
     def __iter__(self):
         return iter(self.tools)
 
     def to_params(self) -> List[Dict[str, Any]]:
-        return [tool.to_param() for tool in self.tools]
+        """Return the tool schemas, serialized once per set of tools.
+
+        The returned list is shared between calls and must not be mutated.
+        Replacing ``self.tools`` invalidates the cache automatically; call
+        `invalidate_params` after changing a tool's schema in place.
+        """
+        if self._params_cache is None or self._params_cache[0] is not self.tools:
+            self._params_cache = (
+                self.tools,
+                [tool.to_param() for tool in self.tools],
+            )
+            self._params_tokens = {}
+        return self._params_cache[1]
+
+    def params_token_count(
+        self, count_tokens: Callable[[str], int], tokenizer: Hashable
+    ) -> int:
+        """Return the token cost of the tool schemas, computed once per tokenizer.
+
+        Args:
+            count_tokens: Token counting function, e.g. ``LLM.count_tokens``
+            tokenizer: Name of the encoding count_tokens uses, e.g.
+                ``llm.tokenizer.name``; LLMs (and their session handles)
+                sharing an encoding share the cached count
+        """
+        params = self.to_params()
+        if tokenizer not in self._params_tokens:
+            self._params_tokens[tokenizer] = sum(
+                count_tokens(str(param)) for param in params
+            )
+        return self._params_tokens[tokenizer]
+
+    def invalidate_params(self) -> None:
+        """Drop the cached tool schemas and their token cost"""
+        self._params_cache = None
+        self._params_tokens = {}
 
     async def execute(
         self, *, name: str, tool_input: Dict[str, Any] = None
@@ -50,6 +87,7 @@ class ToolCollection:
     def add_tool(self, tool: BaseTool):
         self.tools += (tool,)
         self.tool_map[tool.name] = tool
+        self.invalidate_params()
         return self
 
     def add_tools(self, *tools: BaseTool):
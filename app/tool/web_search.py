@@ -35,6 +35,7 @@ class WebSearch(BaseTool):
         },
         "required": ["query"],
     }
+    read_only: bool = True
     _search_engine: dict[str, WebSearchEngine] = {
         "google": GoogleSearchEngine(),
         "baidu": BaiduSearchEngine(),
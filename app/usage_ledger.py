@@ -0,0 +1,317 @@
+"""Per-call usage ledger with agent/step attribution and cost estimates.
+
+`LLM` instances are shared per config, so their cumulative counters mix
+every agent, flow and planner using the config. The ledger instead keeps
+one `UsageRecord` per completed call, attributed through `usage_scope`:
+
+    with usage_scope(agent="manus", step=3):
+        await llm.ask_tool(...)
+
+Scopes nest and follow asyncio tasks (they are context variables), so
+`BaseAgent.run` and `PlanningFlow.execute` set them once and every LLM call
+underneath is attributed automatically.
+
+Records bound for ``export_path`` are buffered and appended in batches, off
+the event loop, every ``export_interval`` seconds; `UsageLedger.flush` writes
+them out at once and runs at exit.
+"""
+import asyncio
+import atexit
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.config import PROJECT_ROOT, ModelPrice, UsageLedgerSettings, config
+from app.logger import logger
+
+
+# USD per million tokens; [usage_ledger.prices] entries take precedence
+DEFAULT_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4o": ModelPrice(input=2.5, cached_input=1.25, output=10.0),
+    "gpt-4o-mini": ModelPrice(input=0.15, cached_input=0.075, output=0.6),
+    "o1": ModelPrice(input=15.0, cached_input=7.5, output=60.0),
+    "o3-mini": ModelPrice(input=1.1, cached_input=0.55, output=4.4),
+    "claude-3-opus": ModelPrice(
+        input=15.0, cached_input=1.5, cache_write_input=18.75, output=75.0
+    ),
+    "claude-3-sonnet": ModelPrice(
+        input=3.0, cached_input=0.3, cache_write_input=3.75, output=15.0
+    ),
+    "claude-3-5-sonnet": ModelPrice(
+        input=3.0, cached_input=0.3, cache_write_input=3.75, output=15.0
+    ),
+    "claude-3-7-sonnet": ModelPrice(
+        input=3.0, cached_input=0.3, cache_write_input=3.75, output=15.0
+    ),
+    "claude-3-haiku": ModelPrice(
+        input=0.25, cached_input=0.03, cache_write_input=0.3, output=1.25
+    ),
+}
+
+_scope: ContextVar[Dict[str, Any]] = ContextVar("usage_scope", default={})
+
+
+@contextmanager
+def usage_scope(**attributes: Any):
+    """Attribute LLM calls made inside the block (agent, step, flow, plan_id, ...)"""
+    token = _scope.set({**_scope.get(), **attributes})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> Dict[str, Any]:
+    return dict(_scope.get())
+
+
+class UsageRecord(BaseModel):
+    """Usage of one completed LLM call"""
+
+    timestamp: float = Field(default_factory=time.time)
+    model: str
+    config_name: Optional[str] = None
+    session_id: Optional[str] = None
+    call: str = Field(..., description="LLM method, e.g. ask_tool")
+    agent: Optional[str] = None
+    step: Optional[int] = None
+    flow: Optional[str] = None
+    plan_id: Optional[str] = None
+    plan_step: Optional[int] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = Field(
+        0, description="Prompt tokens written to the provider's prompt cache"
+    )
+    latency: Optional[float] = Field(None, description="Seconds, None if unknown")
+    server_latency: Optional[float] = Field(
+        None, description="Seconds the provider reports spending, None if unknown"
+    )
+    cost: Optional[float] = Field(None, description="USD, None if unpriced")
+    estimated: bool = Field(
+        False, description="Token counts are local estimates, not provider usage"
+    )
+
+
+class PriceTable:
+    """Model prices, matched on the longest known name contained in the model id"""
+
+    def __init__(self, prices: Optional[Dict[str, ModelPrice]] = None):
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+
+    def lookup(self, model: str) -> Optional[ModelPrice]:
+        model = model.lower()
+        if model in self.prices:
+            return self.prices[model]
+        matches = [name for name in self.prices if name.lower() in model]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def cost(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cache_write_tokens: int = 0,
+    ) -> Optional[float]:
+        """USD for a call; prompt_tokens includes cache reads and writes"""
+        price = self.lookup(model)
+        if price is None:
+            return None
+        cached_price = (
+            price.cached_input if price.cached_input is not None else price.input
+        )
+        write_price = (
+            price.cache_write_input
+            if price.cache_write_input is not None
+            else price.input
+        )
+        return (
+            (prompt_tokens - cached_tokens - cache_write_tokens) * price.input
+            + cached_tokens * cached_price
+            + cache_write_tokens * write_price
+            + completion_tokens * price.output
+        ) / 1_000_000
+
+
+class UsageLedger:
+    """Thread-safe, bounded log of UsageRecords"""
+
+    def __init__(self, settings: Optional[UsageLedgerSettings] = None):
+        self.settings = settings or UsageLedgerSettings()
+        self.prices = PriceTable(self.settings.prices)
+        self._records: Deque[UsageRecord] = deque(maxlen=self.settings.max_records)
+        self._lock = threading.Lock()
+        self.export_path: Optional[Path] = None
+        # JSON lines not yet appended to export_path
+        self._unexported: List[str] = []
+        self._exported_at = time.monotonic()
+        # Keeps concurrent flushes from interleaving their lines
+        self._export_lock = threading.Lock()
+        if self.settings.export_path:
+            path = Path(self.settings.export_path)
+            self.export_path = path if path.is_absolute() else PROJECT_ROOT / path
+            self.export_path.parent.mkdir(parents=True, exist_ok=True)
+            atexit.register(self.flush)
+
+    def record(
+        self,
+        model: str,
+        call: str,
+        prompt_tokens: int,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        latency: Optional[float] = None,
+        estimated: bool = False,
+        config_name: Optional[str] = None,
+        session_id: Optional[str] = None,
+        cache_write_tokens: int = 0,
+        server_latency: Optional[float] = None,
+    ) -> UsageRecord:
+        """Add a record attributed to the current usage_scope"""
+        scope = current_scope()
+        fields = {
+            name: scope.pop(name)
+            for name in ("agent", "step", "flow", "plan_id", "plan_step")
+            if name in scope
+        }
+        record = UsageRecord(
+            model=model,
+            config_name=config_name,
+            session_id=session_id,
+            call=call,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            cache_write_tokens=cache_write_tokens,
+            latency=latency,
+            server_latency=server_latency,
+            cost=self.prices.cost(
+                model,
+                prompt_tokens,
+                completion_tokens,
+                cached_tokens,
+                cache_write_tokens,
+            ),
+            estimated=estimated,
+            **fields,
+        )
+        line = record.model_dump_json() + "\n" if self.export_path else None
+        with self._lock:
+            self._records.append(record)
+            if line is None:
+                return record
+            self._unexported.append(line)
+            due = time.monotonic() - self._exported_at >= self.settings.export_interval
+            if due:
+                self._exported_at = time.monotonic()
+        if due:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self.flush)
+            except RuntimeError:
+                self.flush()
+        return record
+
+    def flush(self) -> None:
+        """Append buffered records to export_path"""
+        with self._export_lock:
+            with self._lock:
+                lines, self._unexported = self._unexported, []
+            if not lines or self.export_path is None:
+                return
+            try:
+                with self.export_path.open("a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Failed to export usage records: {e}")
+
+    @property
+    def records(self) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def query(self, **filters: Any) -> List[UsageRecord]:
+        """Records whose fields equal all the given values, e.g. agent="manus" """
+        return [
+            record
+            for record in self.records
+            if all(getattr(record, name) == value for name, value in filters.items())
+        ]
+
+    @staticmethod
+    def _totals(records: Iterable[UsageRecord]) -> Dict[str, Any]:
+        totals = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "cache_write_tokens": 0,
+            "latency": 0.0,
+            "cost": 0.0,
+        }
+        for record in records:
+            totals["calls"] += 1
+            totals["prompt_tokens"] += record.prompt_tokens
+            totals["completion_tokens"] += record.completion_tokens
+            totals["cached_tokens"] += record.cached_tokens
+            totals["cache_write_tokens"] += record.cache_write_tokens
+            totals["latency"] += record.latency or 0.0
+            totals["cost"] += record.cost or 0.0
+        return totals
+
+    def summarize(
+        self, group_by: Tuple[str, ...] = ("agent",), **filters: Any
+    ) -> Dict[Tuple, Dict[str, Any]]:
+        """Aggregate tokens, latency and cost per group of record fields.
+
+        Example:
+            >>> ledger.summarize(group_by=("agent", "call"))
+            {("manus", "ask_tool"): {"calls": 12, "prompt_tokens": ..., ...}}
+        """
+        groups: Dict[Tuple, List[UsageRecord]] = {}
+        for record in self.query(**filters):
+            key = tuple(getattr(record, name) for name in group_by)
+            groups.setdefault(key, []).append(record)
+        return {key: self._totals(records) for key, records in groups.items()}
+
+    def export_jsonl(self, path: Path, **filters: Any) -> int:
+        """Write (matching) records as JSON lines; returns the number written"""
+        self.flush()
+        records = self.query(**filters)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for record in records:
+                f.write(record.model_dump_json() + "\n")
+        logger.info(f"Exported {len(records)} usage records to {path}")
+        return len(records)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+_shared_ledger: Optional[UsageLedger] = None
+_shared_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> Optional[UsageLedger]:
+    """Return the process-wide usage ledger, or None when it is disabled"""
+    global _shared_ledger
+    if not config.usage_ledger.enabled:
+        return None
+    if _shared_ledger is None:
+        with _shared_ledger_lock:
+            if _shared_ledger is None:
+                _shared_ledger = UsageLedger(config.usage_ledger)
+    return _shared_ledger
@@ -0,0 +1,83 @@
+"""Benchmark an agent run against a recorded LLM cassette.
+
+Record once against the provider, then replay without network access:
+
+    python -m benchmarks.bench_agent_replay --agent manus --mode record \\
+        --cassette cassettes/manus.jsonl --prompt "Summarize README.md"
+    python -m benchmarks.bench_agent_replay --agent manus \\
+        --cassette cassettes/manus.jsonl --prompt "Summarize README.md"
+
+Every LLM config is pointed at the cassette, so agents and planners using
+different configs all replay. Tools still execute for real; only the
+provider is replaced. ``--latency-scale 1`` replays recorded latencies.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from app.config import config
+from app.llm import LLM
+
+
+async def run_agent(agent_name: str, prompt: str) -> None:
+    if agent_name == "manus":
+        from app.agent.manus import Manus
+
+        await Manus().run(prompt)
+    elif agent_name == "flow":
+        from app.agent.manus import Manus
+        from app.flow.base import FlowType
+        from app.flow.flow_factory import FlowFactory
+
+        flow = FlowFactory.create_flow(FlowType.PLANNING, {"manus": Manus()})
+        await flow.execute(prompt)
+    else:
+        from app.agent.mcp import MCPAgent
+
+        agent = MCPAgent()
+        await agent.initialize(
+            connection_type="stdio",
+            command=sys.executable,
+            args=["-m", "app.mcp.server"],
+        )
+        try:
+            await agent.run(prompt)
+        finally:
+            await agent.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agent", choices=["manus", "flow", "mcp"], default="manus")
+    parser.add_argument("--cassette", required=True)
+    parser.add_argument(
+        "--mode", choices=["record", "replay", "auto"], default="replay"
+    )
+    parser.add_argument("--latency-scale", type=float, default=0.0)
+    parser.add_argument("--prompt", required=True)
+    args = parser.parse_args()
+
+    for name, settings in config.llm.items():
+        config.llm[name] = settings.model_copy(
+            update={
+                "cassette": args.cassette,
+                "cassette_mode": args.mode,
+                "cassette_latency_scale": args.latency_scale,
+            }
+        )
+
+    start = time.perf_counter()
+    asyncio.run(run_agent(args.agent, args.prompt))
+    elapsed = time.perf_counter() - start
+
+    print(f"Agent: {args.agent}, mode: {args.mode}, wall time: {elapsed:.2f} s")
+    for name, llm in LLM._instances.items():
+        print(
+            f"  {name:12} {llm.client.stats}  input tokens: {llm.total_input_tokens}, "
+            f"completion tokens: {llm.total_completion_tokens}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark per-step message formatting over a growing conversation.
+
+Simulates an agent that appends one message per step to a long history
+(with a screenshot on every tenth observation) and formats the whole
+history before every request, as ``LLM.ask_tool`` does:
+
+- before: every message is rebuilt from ``Message.to_dict()``
+- cached: ``Message`` objects reuse their cached provider-ready dict
+- memory: ``Memory.formatted_messages`` only formats the new tail
+
+Usage:
+    python -m benchmarks.bench_format_messages [--messages 500] [--steps 50]
+"""
+import argparse
+import base64
+import time
+
+from app.llm import LLM
+from app.schema import Memory, Message, ToolCall
+
+
+SCREENSHOT = base64.b64encode(b"\x89PNG" * 50_000).decode()
+
+
+def build_history(size: int) -> list:
+    """Build an agent history: user turns, tool calls and observations."""
+    history = [Message.system_message("You are a helpful agent. " * 50)]
+    for i in range(size - 1):
+        if i % 3 == 0:
+            history.append(Message.user_message(f"Step {i}: continue the task. " * 10))
+        elif i % 3 == 1:
+            call = ToolCall(
+                id=f"call_{i}",
+                function={
+                    "name": "browser_use",
+                    "arguments": '{"action": "extract_content", "goal": "all prices"}',
+                },
+            )
+            history.append(
+                Message(
+                    role="assistant",
+                    content=f"Thinking about step {i}",
+                    tool_calls=[call],
+                )
+            )
+        else:
+            history.append(
+                Message.tool_message(
+                    f"Observed output of step {i}: " + "lorem ipsum " * 200,
+                    name="browser_use",
+                    tool_call_id=f"call_{i - 1}",
+                    base64_image=SCREENSHOT if i % 10 == 2 else None,
+                )
+            )
+    return history
+
+
+def run(mode: str, history: list, steps: int) -> list:
+    """Return the per-step formatting time (seconds) as the history grows"""
+    memory = Memory(messages=list(history), max_messages=len(history) + steps)
+    timings = []
+    for step in range(steps):
+        memory.add_message(Message.user_message(f"New observation {step} " * 20))
+        start = time.perf_counter()
+        if mode == "before":
+            LLM.format_messages([m.to_dict() for m in memory.messages], True)
+        elif mode == "cached":
+            LLM.format_messages(memory.messages, True)
+        else:
+            LLM.format_messages(memory.formatted_messages(True), True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--steps", type=int, default=50)
+    args = parser.parse_args()
+
+    def ms(value: float) -> str:
+        return f"{value * 1000:8.3f} ms"
+
+    print(f"History: {args.messages} messages, {args.steps} steps")
+    print(f"{'':20}{'first step':>12}{'mean step':>12}{'last step':>12}")
+    for mode in ("before", "cached", "memory"):
+        # Fresh messages, so no mode benefits from another's caches
+        timings = run(mode, build_history(args.messages), args.steps)
+        mean = sum(timings) / len(timings)
+        print(f"{mode:20}{ms(timings[0])}{ms(mean)}{ms(timings[-1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark the memory footprint of session histories.
+
+Builds the same agent history (user turns, tool calls, observations and
+an occasional screenshot) for many sessions and measures the memory held:
+
+- memory: ``Memory`` with a list of ``Message`` models, as agents keep it
+- parked: the same ``Memory`` after ``park()`` (``[memory] park_idle``),
+  its messages in a ``MessageStore`` of slotted records and a byte arena
+
+Usage:
+    python -m benchmarks.bench_message_store [--sessions 1000] [--messages 60]
+"""
+import argparse
+import base64
+import gc
+import os
+import time
+import tracemalloc
+
+from app.schema import Memory, Message, ToolCall
+
+
+def unique_screenshot(screenshot: str, session: int, step: int) -> str:
+    """A distinct copy of screenshot, as every real capture is its own string"""
+    tag = (session * 1000 + step).to_bytes(6, "big")
+    return screenshot + base64.b64encode(tag).decode()
+
+
+def build_history(session: int, size: int, screenshot: str) -> list:
+    """Build one session's history; contents differ between sessions."""
+    history = []
+    for i in range(size):
+        if i % 3 == 0:
+            history.append(
+                Message.user_message(f"Session {session} step {i}: continue. " * 5)
+            )
+        elif i % 3 == 1:
+            call = ToolCall(
+                id=f"call_{session}_{i}",
+                function={
+                    "name": "browser_use",
+                    "arguments": f'{{"action": "go_to_url", "url": "https://x/{i}"}}',
+                },
+            )
+            history.append(
+                Message(role="assistant", content=f"Step {i}", tool_calls=[call])
+            )
+        else:
+            history.append(
+                Message.tool_message(
+                    f"Observed output {session}/{i}: " + "lorem ipsum " * 40,
+                    name="browser_use",
+                    tool_call_id=f"call_{session}_{i - 1}",
+                    base64_image=(
+                        unique_screenshot(screenshot, session, i)
+                        if i % 30 == 2
+                        else None
+                    ),
+                )
+            )
+    return history
+
+
+def measure(mode: str, sessions: int, messages: int, screenshot: str) -> tuple:
+    """Return (bytes held, seconds to build) for all sessions"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = []
+    for session in range(sessions):
+        history = build_history(session, messages, screenshot)
+        memory = Memory()
+        memory.add_messages(history)
+        if mode == "parked":
+            memory.park()
+        held.append(memory)
+        del history
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--screenshot-kb", type=int, default=60)
+    args = parser.parse_args()
+
+    # A multiple of 3 bytes, so unique_screenshot can append to it
+    raw_size = args.screenshot_kb * 1024 // 3 * 3
+    screenshot = base64.b64encode(os.urandom(raw_size)).decode()
+    results = {}
+    for mode in ("memory", "parked"):
+        results[mode] = measure(mode, args.sessions, args.messages, screenshot)
+
+    print(f"{args.sessions} sessions x {args.messages} messages")
+    for mode, (size, elapsed) in results.items():
+        print(
+            f"  {mode:7} {size / 2**20:8.1f} MiB  "
+            f"{size / args.sessions / 1024:7.1f} KiB/session  build {elapsed:.2f} s"
+        )
+    saved = 1 - results["parked"][0] / results["memory"][0]
+    print(f"  parking saves {saved:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark per-step pre-flight token counting over a growing conversation.
+
+Simulates an agent that appends one message per step to a 500-message
+history and counts the whole formatted history before every request, as
+``LLM.ask_tool`` does, with and without per-message memoization.
+
+Usage:
+    python -m benchmarks.bench_token_counting [--messages 500] [--steps 50]
+"""
+import argparse
+import re
+import time
+
+import tiktoken
+
+from app.llm import TokenCounter
+
+
+class _RegexTokenizer:
+    """Rough stand-in used only when tiktoken's BPE files cannot be fetched."""
+
+    _pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text: str):
+        return self._pattern.findall(text)
+
+
+def load_tokenizer():
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"cl100k_base unavailable ({type(e).__name__}), using regex tokenizer")
+        return _RegexTokenizer()
+
+
+def build_history(size: int) -> list:
+    """Build a realistic agent history: user turns, tool calls and observations."""
+    history = [{"role": "system", "content": "You are a helpful agent. " * 50}]
+    for i in range(size - 1):
+        if i % 3 == 0:
+            history.append(
+                {"role": "user", "content": f"Step {i}: continue the task. " * 10}
+            )
+        elif i % 3 == 1:
+            history.append(
+                {
+                    "role": "assistant",
+                    "content": f"Thinking about step {i}",
+                    "tool_calls": [
+                        {
+                            "id": f"call_{i}",
+                            "type": "function",
+                            "function": {
+                                "name": "browser_use",
+                                "arguments": '{"action": "extract_content", "goal": "all prices"}',
+                            },
+                        }
+                    ],
+                }
+            )
+        else:
+            history.append(
+                {
+                    "role": "tool",
+                    "name": "browser_use",
+                    "tool_call_id": f"call_{i - 1}",
+                    "content": f"Observed output of step {i}: "
+                    + "lorem ipsum dolor sit amet " * 200,
+                }
+            )
+    return history
+
+
+def run(counter: TokenCounter, history: list, steps: int) -> list:
+    """Return the per-step counting time (seconds) as the history grows"""
+    messages = list(history)
+    timings = []
+    for step in range(steps):
+        messages.append({"role": "user", "content": f"New observation {step} " * 20})
+        # format_messages hands over fresh dicts every step
+        formatted = [dict(message) for message in messages]
+        start = time.perf_counter()
+        counter.count_message_tokens(formatted)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--steps", type=int, default=50)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer()
+    history = build_history(args.messages)
+
+    before = run(TokenCounter(tokenizer, cache_size=0), history, args.steps)
+    after = run(TokenCounter(tokenizer), history, args.steps)
+
+    def ms(value: float) -> str:
+        return f"{value * 1000:8.3f} ms"
+
+    print(f"History: {args.messages} messages, {args.steps} steps")
+    print(f"{'':20}{'first step':>12}{'mean step':>12}{'last step':>12}")
+    for label, timings in (("before (no memo)", before), ("after (memoized)", after)):
+        mean = sum(timings) / len(timings)
+        print(f"{label:20}{ms(timings[0])}{ms(mean)}{ms(timings[-1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import pytest
+
+from app.agent.base import BaseAgent
+from app.config import config
+from app.llm import LLM
+from app.schema import AgentState, Memory, Message
+
+
+class WordCounter:
+    """Counts whitespace-separated words of a message's content"""
+
+    def count_single_message(self, message: dict) -> int:
+        return len((message.get("content") or "").split())
+
+    def count_image(self, image_item: dict) -> int:
+        return 0
+
+
+def _tool_turn(call_ids, result_words: int = 1) -> list:
+    calls = [
+        {
+            "id": call_id,
+            "type": "function",
+            "function": {"name": "bash", "arguments": "{}"},
+        }
+        for call_id in call_ids
+    ]
+    call_message = Message(role="assistant", content="running", tool_calls=calls)
+    results = [
+        Message.tool_message("out " * result_words, name="bash", tool_call_id=call_id)
+        for call_id in call_ids
+    ]
+    return [call_message, *results]
+
+
+def test_eviction_keeps_tool_calls_with_their_results():
+    memory = Memory(max_messages=4)
+    messages = memory.messages
+    memory.add_message(Message.system_message("be brief"))
+    memory.add_message(Message.user_message("list files"))
+    memory.add_messages(_tool_turn(["a", "b"]))
+
+    # The user message goes first, then the whole tool turn at once
+    assert [m.role for m in memory.messages] == ["system", "assistant", "tool", "tool"]
+    memory.add_message(Message.user_message("thanks"))
+    assert [m.role for m in memory.messages] == ["system", "user"]
+    assert memory.messages is messages
+
+
+@pytest.mark.asyncio
+async def test_token_budget_with_rolling_summary():
+    batches = []
+
+    async def summarizer(previous, evicted):
+        batches.append((previous, [m.role for m in evicted]))
+        return f"summary {len(batches)}"
+
+    memory = Memory(max_tokens=20, token_counter=WordCounter(), summarizer=summarizer)
+    memory.add_message(Message.user_message("find the bug " * 2))
+    memory.add_messages(_tool_turn(["a"], result_words=12))
+    memory.add_message(Message.assistant_message("fixed it"))
+    await memory.wait_for_summary()
+
+    assert batches == [(None, ["user"])]
+    assert memory.summary.endswith("summary 1")
+    assert [m.role for m in memory.messages] == [
+        "system",
+        "assistant",
+        "tool",
+        "assistant",
+    ]
+
+    memory.add_message(Message.user_message("now add a test " * 2))
+    await memory.wait_for_summary()
+
+    # The summary replaces the evicted spans and is never evicted itself
+    assert batches[1] == ("summary 1", ["assistant", "tool"])
+    assert memory.summary.endswith("summary 2")
+    assert [m.role for m in memory.messages] == ["system", "assistant", "user"]
+    assert sum(memory.count_tokens(m) for m in memory.messages) <= 20
+
+
+def test_parked_memory_is_rebuilt_on_use():
+    memory = Memory()
+    memory.add_message(Message.system_message("be brief"))
+    memory.add_messages(_tool_turn(["a", "b"]))
+    dicts = memory.to_dict_list()
+    formatted = memory.formatted_messages()
+
+    memory.park()
+
+    assert memory.parked and memory.messages == []
+    # Read straight from the store
+    assert memory.to_dict_list() == dicts
+    assert memory.parked
+
+    memory.add_message(Message.user_message("next"))
+    assert not memory.parked
+    assert memory.to_dict_list() == dicts + [Message.user_message("next").to_dict()]
+    assert memory.formatted_messages()[:-1] == formatted
+
+
+@pytest.mark.asyncio
+async def test_summary_survives_parking():
+    async def summarizer(previous, evicted):
+        return "summary"
+
+    memory = Memory(max_tokens=20, token_counter=WordCounter(), summarizer=summarizer)
+    memory.add_message(Message.user_message("find the bug " * 2))
+    memory.add_messages(_tool_turn(["a"], result_words=12))
+    await memory.wait_for_summary()
+
+    memory.park()
+    memory.unpark()
+    memory.add_message(Message.user_message("now add a test " * 2))
+    await memory.wait_for_summary()
+
+    # The rebuilt summary message is still replaced in place
+    assert [m.role for m in memory.messages].count("system") == 1
+
+
+class IdleAgent(BaseAgent):
+    name: str = "idle"
+
+    async def step(self) -> str:
+        self.memory.add_message(Message.assistant_message("done"))
+        self.state = AgentState.FINISHED
+        return "done"
+
+
+@pytest.mark.asyncio
+async def test_agent_parks_memory_between_runs(monkeypatch):
+    monkeypatch.setattr(config.memory, "park_idle", True)
+    # The agent never calls its LLM
+    agent = IdleAgent(llm=object.__new__(LLM))
+
+    await agent.run("first")
+
+    assert agent.memory.parked
+    assert [m.content for m in agent.messages] == ["first", "done"]
+    assert not agent.memory.parked
+
+    agent.memory.park()
+    agent.state = AgentState.IDLE
+    await agent.run("second")
+    assert agent.memory.parked
+    assert [m["content"] for m in agent.memory.to_dict_list()] == [
+        "first",
+        "done",
+        "second",
+        "done",
+    ]
+
+
+def test_assigned_messages_replace_parked_history():
+    agent = IdleAgent(llm=object.__new__(LLM))
+    agent.memory.add_messages([Message.user_message("old"), Message.user_message("x")])
+    agent.memory.park()
+
+    agent.messages = [Message.user_message("new")]
+
+    assert not agent.memory.parked
+    assert [m.content for m in agent.messages] == ["new"]
+    assert not agent.is_stuck()
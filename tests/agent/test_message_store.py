@@ -0,0 +1,74 @@
+import base64
+
+from app.message_store import MessageStore
+from app.schema import Message, ToolCall
+
+
+def tool_call(call_id: str, name: str = "bash") -> ToolCall:
+    return ToolCall(id=call_id, function={"name": name, "arguments": '{"a": 1}'})
+
+
+def history():
+    image = base64.b64encode(b"\x89PNG raw bytes").decode()
+    return [
+        Message.system_message("You are an agent"),
+        Message.user_message("héllo"),
+        Message.from_tool_calls([tool_call("c1"), tool_call("c2", "browser_use")]),
+        Message.tool_message("one", name="bash", tool_call_id="c1"),
+        Message.tool_message(
+            "two", name="browser_use", tool_call_id="c2", base64_image=image
+        ),
+        Message.assistant_message("done"),
+        Message.tool_message(
+            "odd", name="x", tool_call_id="y", base64_image="not b64!"
+        ),
+    ]
+
+
+def test_round_trip():
+    messages = history()
+    store = MessageStore.from_messages(messages)
+
+    assert len(store) == len(messages)
+    assert store.to_messages() == messages
+    assert store.to_dict_list() == [message.to_dict() for message in messages]
+    assert store[-1].base64_image == "not b64!"
+
+
+def test_roles_and_tool_names_are_interned():
+    store = MessageStore.from_messages(history() + history())
+    records = list(store._records)
+
+    assert records[1].role is records[8].role
+    assert records[2].tool_calls[1][1] is records[9].tool_calls[1][1]
+
+
+def test_trimming_keeps_tool_results_with_their_call():
+    store = MessageStore(max_messages=4)
+    store.extend(history()[1:6])
+
+    # Dropping the user message would leave the call and both results (4)
+    assert [message.role for message in store] == [
+        "assistant",
+        "tool",
+        "tool",
+        "assistant",
+    ]
+    # Over the limit again: the call goes with both of its results
+    store.append(Message.user_message("next"))
+    assert [message.content for message in store] == ["done", "next"]
+
+
+def test_trim_compacts_arena():
+    store = MessageStore()
+    store.extend(Message.user_message(f"message {i} " * 50) for i in range(10))
+    full = store.nbytes
+
+    store.trim(7)
+
+    assert store.nbytes < full / 2
+    assert [message.content for message in store] == [
+        f"message {i} " * 50 for i in range(7, 10)
+    ]
+    store.trim(10)
+    assert len(store) == 0 and store.nbytes == 0
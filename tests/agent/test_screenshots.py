@@ -0,0 +1,69 @@
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from app.config import ScreenshotSettings
+from app.schema import Message
+from app.screenshots import PLACEHOLDER, ScreenshotPipeline
+
+
+def _screenshot(width: int = 1920, height: int = 5000, boxes: int = 1) -> str:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(boxes):
+        draw.rectangle((100 + i * 300, 100, 300 + i * 300, 2000), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=100)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_screenshots_are_downscaled_and_recompressed():
+    pipeline = ScreenshotPipeline(ScreenshotSettings(max_width=640, max_height=800))
+    original = _screenshot()
+
+    processed = pipeline.process(original)
+
+    image = Image.open(io.BytesIO(base64.b64decode(processed)))
+    assert image.size == (640, 800)
+    assert len(processed) < len(original) / 4
+
+
+def test_identical_screenshots_are_skipped():
+    pipeline = ScreenshotPipeline(ScreenshotSettings())
+
+    assert pipeline.process(_screenshot(boxes=1)) is not None
+    assert pipeline.process(_screenshot(boxes=1)) is None
+    assert pipeline.process(_screenshot(boxes=3)) is not None
+    assert pipeline.stats["duplicates"] == 1
+
+
+def test_duplicates_are_compared_with_the_last_attached_screenshot(monkeypatch):
+    pipeline = ScreenshotPipeline(ScreenshotSettings(dedupe_distance=1))
+    hashes = iter([0b000, 0b001, 0b011, 0b111])
+    monkeypatch.setattr("app.screenshots.difference_hash", lambda image: next(hashes))
+
+    attached = [pipeline.process(_screenshot(100, 100)) is not None for _ in range(4)]
+
+    # Each screenshot is one bit from its predecessor, but drifts from the
+    # last attached one
+    assert attached == [True, False, True, False]
+
+
+def test_old_images_become_placeholders():
+    pipeline = ScreenshotPipeline(ScreenshotSettings(keep_last=2))
+    messages = [Message.system_message("agent")]
+    for i in range(5):
+        messages.append(
+            Message.user_message("Current browser screenshot:", base64_image=f"img{i}")
+        )
+        messages.append(Message.assistant_message(f"step {i}"))
+    original = list(messages)
+
+    assert pipeline.age_out(messages) == 3
+
+    images = [m.base64_image for m in messages if m.base64_image]
+    assert images == ["img3", "img4"]
+    assert messages[1].content == f"Current browser screenshot:\n{PLACEHOLDER}"
+    assert original[1].base64_image == "img0"
+    assert pipeline.age_out(messages) == 0
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+import tiktoken
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from app import rate_limiter, retry_policy, usage_ledger
+from app.config import LLMSettings
+from app.llm import LLM
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer so tests do not need tiktoken's BPE downloads."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text: str) -> List[str]:
+        self.calls += 1
+        return text.split()
+
+
+class FakeCompletions:
+    """Records requests and replays canned ChatCompletion responses."""
+
+    def __init__(self):
+        self.requests: List[dict] = []
+        self.responses: List[ChatCompletion] = []
+
+    async def create(self, **params):
+        self.requests.append(params)
+        if self.responses:
+            return self.responses.pop(0)
+        return make_completion(content="ok")
+
+
+def make_completion(
+    content: Optional[str] = "ok",
+    tool_calls: Optional[List[dict]] = None,
+    prompt_tokens: int = 10,
+    completion_tokens: int = 5,
+    cached_tokens: int = 0,
+) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "test-model",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls" if tool_calls else "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": tool_calls,
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+    )
+
+
+@pytest.fixture
+def fake_tokenizer(monkeypatch) -> FakeTokenizer:
+    tokenizer = FakeTokenizer()
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: tokenizer)
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: tokenizer)
+    return tokenizer
+
+
+@pytest.fixture
+def llm_factory(fake_tokenizer, monkeypatch):
+    """Builds isolated LLM instances backed by a fake completions client."""
+    monkeypatch.setattr(LLM, "_instances", {})
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setattr(retry_policy, "_breakers", {})
+    monkeypatch.setattr(usage_ledger, "_shared_ledger", None)
+
+    def factory(config_name: str = "default", **overrides) -> LLM:
+        settings = LLMSettings(
+            **{
+                "model": "test-model",
+                "base_url": "http://localhost:0/v1",
+                "api_key": "test",
+                "max_tokens": 256,
+                "temperature": 0.0,
+                "api_type": "openai",
+                "api_version": "",
+                **overrides,
+            }
+        )
+        llm = LLM(config_name, {"default": settings, config_name: settings})
+        llm.client = SimpleNamespace(
+            chat=SimpleNamespace(completions=FakeCompletions())
+        )
+        return llm
+
+    return factory
+
+
+def make_chunk(
+    content: Optional[str] = None,
+    tool_calls: Optional[List[dict]] = None,
+    finish_reason: Optional[str] = None,
+    usage: Optional[dict] = None,
+) -> ChatCompletionChunk:
+    choices = []
+    if content is not None or tool_calls is not None or finish_reason is not None:
+        choices.append(
+            {
+                "index": 0,
+                "delta": {"content": content, "tool_calls": tool_calls},
+                "finish_reason": finish_reason,
+            }
+        )
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "test-model",
+            "choices": choices,
+            "usage": usage,
+        }
+    )
+
+
+async def stream_chunks(chunks: List[ChatCompletionChunk], delay: float = 0.0):
+    """Async iterator over chunks, optionally pausing between them."""
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Local stand-in for an OpenAI-compatible chat completions endpoint."""
+
+    def __init__(self, name: str):
+        super().__init__(("127.0.0.1", 0), _MockOpenAIHandler)
+        self.name = name
+        self.status = 200
+        self.delay = 0.0
+        self.requests: List[dict] = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _MockOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server: MockOpenAIServer = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        server.requests.append(json.loads(self.rfile.read(length) or b"{}"))
+        if server.delay:
+            threading.Event().wait(server.delay)
+        if server.status != 200:
+            body = {"error": {"message": f"{server.name} unavailable"}}
+        else:
+            body = make_completion(content=server.name).model_dump()
+        data = json.dumps(body).encode()
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_openai_servers():
+    """Factory for local mock OpenAI servers, shut down after the test."""
+    servers: List[MockOpenAIServer] = []
+
+    def factory(name: str) -> MockOpenAIServer:
+        server = MockOpenAIServer(name)
+        servers.append(server)
+        return server
+
+    yield factory
+    for server in servers:
+        server.close()
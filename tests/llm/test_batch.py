@@ -0,0 +1,226 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import InternalServerError
+
+from app.batch import CONCURRENT, PROVIDER, BatchJob, provider_batch_endpoint
+from app.config import LLMBatchSettings, config
+from app.exceptions import BatchRequestError
+from app.schema import Message
+from tests.llm.conftest import make_completion
+
+
+class LocalBatchEndpoint:
+    """Stand-in for the provider file and batch APIs.
+
+    A batch completes on the second status check; every request is answered
+    with its first user message echoed back.
+    """
+
+    def __init__(self):
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(
+            create=self._create_batch, retrieve=self._retrieve
+        )
+        self.stored = {}
+        self.jobs = {}
+        self.created = 0
+
+    async def _create_file(self, file, purpose):
+        file_id = f"file-{len(self.stored)}"
+        self.stored[file_id] = file[1].decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    async def _content(self, file_id):
+        return SimpleNamespace(text=self.stored[file_id])
+
+    async def _create_batch(self, input_file_id, endpoint, completion_window, metadata):
+        self.created += 1
+        batch_id = f"batch_{len(self.jobs)}"
+        self.jobs[batch_id] = {"input": input_file_id, "polls": 0}
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    async def _retrieve(self, batch_id):
+        job = self.jobs[batch_id]
+        job["polls"] += 1
+        if job["polls"] < 2:
+            return SimpleNamespace(
+                status="in_progress", output_file_id=None, error_file_id=None
+            )
+        lines = []
+        for line in self.stored[job["input"]].splitlines():
+            request = json.loads(line)
+            prompt = request["body"]["messages"][-1]["content"]
+            body = {
+                "choices": [
+                    {"message": {"role": "assistant", "content": f"echo: {prompt}"}}
+                ],
+                "usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 2,
+                    "total_tokens": 12,
+                },
+            }
+            if prompt == "bad":
+                response = {"status_code": 400, "body": {"error": {"message": "no"}}}
+            else:
+                response = {"status_code": 200, "body": body}
+            lines.append(
+                json.dumps({"custom_id": request["custom_id"], "response": response})
+            )
+        output_id = f"file-{len(self.stored)}"
+        self.stored[output_id] = "\n".join(lines)
+        return SimpleNamespace(
+            status="completed", output_file_id=output_id, error_file_id=None
+        )
+
+
+@pytest.fixture
+def batch_settings(tmp_path, monkeypatch):
+    settings = LLMBatchSettings(state_dir=str(tmp_path), poll_interval=0.0)
+    monkeypatch.setattr(config._config, "llm_batch", settings)
+    return settings
+
+
+OPENAI_URL = "https://api.openai.com/v1"
+
+
+def _error(cls, status: int):
+    request = httpx.Request("POST", "http://localhost:0/v1/chat/completions")
+    return cls("error", response=httpx.Response(status, request=request), body=None)
+
+
+def _requests(*prompts):
+    return [{"messages": [Message.user_message(prompt)]} for prompt in prompts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fallback_under_rate_limiter(llm_factory, batch_settings):
+    llm = llm_factory(rpm_limit=600)
+
+    job = await llm.submit_batch(_requests("a", "b", "c"))
+    results = await job.wait()
+
+    assert job.mode == CONCURRENT
+    assert [r.content for r in results] == ["ok", "ok", "ok"]
+    assert len(llm.client.chat.completions.requests) == 3
+    assert llm.rate_limiter.stats["acquired"] == 3
+    state = json.loads(job.path.read_text())
+    assert sorted(state["results"]) == ["request-0", "request-1", "request-2"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_retried_and_saved_sparingly(
+    llm_factory, batch_settings, monkeypatch
+):
+    llm = llm_factory()
+    completions = llm.client.chat.completions
+    failures = [_error(InternalServerError, 503)]
+
+    async def create(**params):
+        completions.requests.append(params)
+        if failures:
+            raise failures.pop()
+        return make_completion("ok")
+
+    async def no_sleep(seconds):
+        pass
+
+    completions.create = create
+    llm.retry_policy._sleep = no_sleep
+    saves = []
+    save = BatchJob.save
+    monkeypatch.setattr(BatchJob, "save", lambda job: saves.append(save(job)))
+
+    job = await llm.submit_batch(_requests(*"abcdefgh"))
+    results = await job.wait()
+
+    assert [r.content for r in results] == ["ok"] * 8
+    assert len(completions.requests) == 9
+    # Submission and the final save, not one save per request
+    assert len(saves) == 2
+    assert len(json.loads(job.path.read_text())["results"]) == 8
+
+
+@pytest.mark.asyncio
+async def test_provider_batch_job(llm_factory, batch_settings):
+    llm = llm_factory(base_url=OPENAI_URL)
+    endpoint = LocalBatchEndpoint()
+    llm.client.files, llm.client.batches = endpoint.files, endpoint.batches
+
+    job = await llm.submit_batch(_requests("first", "bad", "second"))
+    first, bad, second = job.futures
+    assert (await first).content == "echo: first"
+    results = await job.wait()
+
+    assert job.mode == PROVIDER
+    assert endpoint.created == 1
+    assert results[0].content == "echo: first" and results[2].content == "echo: second"
+    assert results[1] is None
+    with pytest.raises(BatchRequestError):
+        await bad
+    # Only successful requests are billed
+    assert llm.total_input_tokens == 20
+    assert llm.client.chat.completions.requests == []
+
+
+@pytest.mark.asyncio
+async def test_resume_collects_submitted_provider_batch(llm_factory, batch_settings):
+    llm = llm_factory(base_url=OPENAI_URL)
+    endpoint = LocalBatchEndpoint()
+    llm.client.files, llm.client.batches = endpoint.files, endpoint.batches
+
+    job = await llm.submit_batch(_requests("one"))
+    job.task.cancel()  # Simulate the process going away after submission
+
+    saved = BatchJob.load(job.id, batch_settings.state_dir)
+    assert saved.provider_batch_id == "batch_0" and saved.pending == ["request-0"]
+
+    resumed = await llm.resume_batch(job.id)
+    results = await resumed.wait()
+
+    assert [r.content for r in results] == ["echo: one"]
+    assert endpoint.created == 1
+
+
+@pytest.mark.asyncio
+async def test_compatible_endpoints_dispatch_concurrently(llm_factory, batch_settings):
+    llm = llm_factory(base_url="https://api.anthropic.com/v1/", api_type="")
+    endpoint = LocalBatchEndpoint()
+    llm.client.files, llm.client.batches = endpoint.files, endpoint.batches
+
+    job = await llm.submit_batch(_requests("a"))
+    await job.wait()
+
+    assert job.mode == CONCURRENT
+    assert endpoint.created == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_submission_falls_back_to_concurrent(llm_factory, batch_settings):
+    llm = llm_factory(base_url=OPENAI_URL)
+    endpoint = LocalBatchEndpoint()
+
+    async def reject(**kwargs):
+        raise RuntimeError("404 Not Found")
+
+    llm.client.files = SimpleNamespace(create=reject)
+    llm.client.batches = endpoint.batches
+
+    job = await llm.submit_batch(_requests("a", "b"))
+    results = await job.wait()
+
+    assert job.mode == CONCURRENT
+    assert [r.content for r in results] == ["ok", "ok"]
+    assert json.loads(job.path.read_text())["mode"] == CONCURRENT
+
+
+def test_batch_endpoint_per_provider():
+    assert provider_batch_endpoint("", OPENAI_URL) == "/v1/chat/completions"
+    assert provider_batch_endpoint("azure", "https://x.openai.azure.com/openai") == (
+        "/chat/completions"
+    )
+    assert provider_batch_endpoint("ollama", "http://localhost:11434/v1") is None
+    assert provider_batch_endpoint("", "https://api.anthropic.com/v1/") is None
@@ -0,0 +1,277 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from app.bedrock import BedrockClient, ChatCompletions
+from app.retry_policy import is_retryable
+from app.stream_sink import QueueSink, stream_to
+
+
+DELAY = 0.2
+
+
+def _converse_response(text: str) -> dict:
+    return {
+        "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+        "stopReason": "end_turn",
+        "usage": {"inputTokens": 10, "outputTokens": 2, "totalTokens": 12},
+        "metrics": {"latencyMs": 200},
+    }
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    client = BedrockClient(max_concurrency=4, region_name="us-east-1")
+    # Every stubbed call takes DELAY seconds on its worker thread
+    client.client.meta.events.register_first(
+        "before-call.*.*", lambda **kwargs: time.sleep(DELAY)
+    )
+    with Stubber(client.client) as stubber:
+        yield client, stubber
+    client.executor.shutdown()
+
+
+async def _ticker(ticks: list):
+    while True:
+        ticks.append(time.monotonic())
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_overlap_without_blocking_the_loop(bedrock):
+    client, stubber = bedrock
+    for text in ("one", "two", "three"):
+        stubber.add_response("converse", _converse_response(text))
+    ticks = []
+    ticker = asyncio.create_task(_ticker(ticks))
+
+    start = time.monotonic()
+    responses = await asyncio.gather(
+        *(
+            client.chat.completions.create(
+                model="m",
+                messages=[{"role": "user", "content": "hi"}],
+                max_tokens=10,
+                temperature=0.0,
+                stream=False,
+            )
+            for _ in range(3)
+        )
+    )
+    elapsed = time.monotonic() - start
+    ticker.cancel()
+
+    assert sorted(r.choices[0].message.content for r in responses) == [
+        "one",
+        "three",
+        "two",
+    ]
+    # Serial calls would take 3 * DELAY
+    assert elapsed < 2 * DELAY
+    # The event loop kept running other coroutines meanwhile
+    assert len(ticks) >= DELAY / 0.01 / 2
+    stubber.assert_no_pending_responses()
+
+
+@pytest.mark.asyncio
+async def test_throttling_is_left_to_the_retry_policy(bedrock):
+    client, stubber = bedrock
+    stubber.add_client_error("converse", "ThrottlingException", http_status_code=429)
+
+    with pytest.raises(ClientError) as raised:
+        await client.chat.completions.create(
+            model="m",
+            messages=[{"role": "user", "content": "hi"}],
+            max_tokens=10,
+            temperature=0.0,
+            stream=False,
+        )
+
+    assert is_retryable(raised.value)
+    # botocore sends once; RetryPolicy decides whether to send again
+    assert client.client.meta.config.retries["total_max_attempts"] == 1
+
+
+def test_bedrock_requests_are_not_hedged(llm_factory, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    llm = llm_factory(api_type="aws", hedge_percentile=95)
+    assert llm.hedge_policy is None
+
+
+@pytest.mark.asyncio
+async def test_stream_events_are_async():
+    events = [
+        {"messageStart": {"role": "assistant"}},
+        {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "Hel"}}},
+        {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "lo"}}},
+        {"contentBlockStop": {"contentBlockIndex": 0}},
+        {"messageStop": {"stopReason": "end_turn"}},
+    ]
+
+    def slow_stream():
+        for event in events:
+            time.sleep(DELAY / len(events))
+            yield event
+
+    # Stubber cannot build event streams, so stand in for the boto3 client
+    completions = ChatCompletions(
+        SimpleNamespace(converse_stream=lambda **request: {"stream": slow_stream()})
+    )
+    ticks = []
+    ticker = asyncio.create_task(_ticker(ticks))
+    sink = QueueSink(flush_interval=0)
+
+    with stream_to(sink):
+        response = await completions.create(
+            model="m",
+            messages=[{"role": "user", "content": "hi"}],
+            max_tokens=10,
+            temperature=0.0,
+        )
+    ticker.cancel()
+
+    assert response.choices[0].message.content == "Hello"
+    assert [sink.queue.get_nowait() for _ in range(3)] == ["Hel", "lo", None]
+    assert len(ticks) >= DELAY / 0.01 / 2
+
+
+def _tool_call(call_id: str, name: str, arguments: str) -> dict:
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": arguments},
+    }
+
+
+def test_every_tool_call_maps_to_its_own_blocks():
+    completions = ChatCompletions(client=None)
+    messages = [
+        {"role": "user", "content": "list and read"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                _tool_call("a", "bash", '{"command": "ls"}'),
+                _tool_call("b", "read", '{"path": "x"}'),
+            ],
+        },
+        {"role": "tool", "content": "x", "tool_call_id": "a"},
+        {"role": "tool", "content": "hello", "tool_call_id": "b"},
+    ]
+
+    _, bedrock_messages = completions._convert_openai_messages_to_bedrock_format(
+        messages
+    )
+
+    assert [m["role"] for m in bedrock_messages] == ["user", "assistant", "user"]
+    assert [c["toolUse"]["toolUseId"] for c in bedrock_messages[1]["content"]] == [
+        "a",
+        "b",
+    ]
+    assert bedrock_messages[1]["content"][1]["toolUse"]["input"] == {"path": "x"}
+    results = [c["toolResult"] for c in bedrock_messages[2]["content"]]
+    assert [(r["toolUseId"], r["content"]) for r in results] == [
+        ("a", [{"text": "x"}]),
+        ("b", [{"text": "hello"}]),
+    ]
+
+    tools = [{"toolSpec": {"name": "bash"}}]
+    request = completions._build_request(
+        "m", [], bedrock_messages, 10, 0.0, tools, "required"
+    )
+    assert request["toolConfig"]["toolChoice"] == {"any": {}}
+    named = {"type": "function", "function": {"name": "bash"}}
+    request = completions._build_request("m", [], [], 10, 0.0, tools, named)
+    assert request["toolConfig"]["toolChoice"] == {"tool": {"name": "bash"}}
+    assert "toolConfig" not in completions._build_request(
+        "m", [], [], 10, 0.0, tools, "none"
+    )
+
+
+@pytest.mark.asyncio
+async def test_streamed_parallel_tool_uses():
+    def tool_start(index, call_id, name):
+        return {
+            "contentBlockStart": {
+                "contentBlockIndex": index,
+                "start": {"toolUse": {"toolUseId": call_id, "name": name}},
+            }
+        }
+
+    def tool_delta(index, fragment):
+        return {
+            "contentBlockDelta": {
+                "contentBlockIndex": index,
+                "delta": {"toolUse": {"input": fragment}},
+            }
+        }
+
+    events = [
+        {"messageStart": {"role": "assistant"}},
+        {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "Both"}}},
+        {"contentBlockStop": {"contentBlockIndex": 0}},
+        tool_start(1, "a", "bash"),
+        tool_delta(1, '{"command"'),
+        tool_delta(1, ': "ls"}'),
+        {"contentBlockStop": {"contentBlockIndex": 1}},
+        tool_start(2, "b", "read"),
+        tool_delta(2, '{"path": "x"}'),
+        {"contentBlockStop": {"contentBlockIndex": 2}},
+        {"messageStop": {"stopReason": "tool_use"}},
+        {
+            "metadata": {
+                "usage": {"inputTokens": 5, "outputTokens": 9, "totalTokens": 14},
+                "metrics": {"latencyMs": 120},
+            }
+        },
+    ]
+    completions = ChatCompletions(
+        SimpleNamespace(converse_stream=lambda **request: {"stream": iter(events)})
+    )
+
+    sink = QueueSink(flush_interval=0)
+    response = await completions.create(
+        model="m",
+        messages=[{"role": "user", "content": "hi"}],
+        max_tokens=10,
+        temperature=0.0,
+        sink=sink,
+    )
+
+    # Tool input fragments are not text and never reach the sink
+    assert [sink.queue.get_nowait() for _ in range(2)] == ["Both", None]
+    message = response.choices[0].message
+    assert message.content == "Both"
+    assert [
+        (c.id, c.function.name, c.function.arguments) for c in message.tool_calls
+    ] == [
+        ("a", "bash", '{"command": "ls"}'),
+        ("b", "read", '{"path": "x"}'),
+    ]
+    assert response.choices[0].finish_reason == "tool_use"
+    assert (response.usage.prompt_tokens, response.usage.latency_ms) == (5, 120)
+
+
+@pytest.mark.asyncio
+async def test_streamed_bedrock_text_uses_the_configured_sink(
+    llm_factory, monkeypatch, capsys
+):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    llm = llm_factory(api_type="aws", stream_sink="null")
+    events = [
+        {"messageStart": {"role": "assistant"}},
+        {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "quiet"}}},
+        {"messageStop": {"stopReason": "end_turn"}},
+    ]
+    llm.client.chat.completions = ChatCompletions(
+        SimpleNamespace(converse_stream=lambda **request: {"stream": iter(events)})
+    )
+
+    assert await llm.ask([{"role": "user", "content": "hi"}]) == "quiet"
+    assert "quiet" not in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.cassette import AUTO, RECORD, REPLAY, CassetteClient
+from app.exceptions import CassetteMissError
+from app.schema import Message
+from tests.llm.conftest import (
+    FakeCompletions,
+    make_chunk,
+    make_completion,
+    stream_chunks,
+)
+
+
+def _provider():
+    completions = FakeCompletions()
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions)), completions
+
+
+def _history(call_id: str) -> list:
+    return [
+        {"role": "user", "content": "list files"},
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": "bash", "arguments": "{}"},
+                }
+            ],
+        },
+        {"role": "tool", "content": "a.txt", "tool_call_id": call_id},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_offline(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    provider, completions = _provider()
+    call = {"id": "call_1", "type": "function"}
+    call["function"] = {"name": "bash", "arguments": '{"command": "ls"}'}
+    completions.responses = [make_completion(None, [call]), make_completion("done")]
+
+    recorder = CassetteClient(path, RECORD, client=provider)
+    first = await recorder.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "list files"}]
+    )
+    await recorder.chat.completions.create(
+        model="m", messages=_history("call_abc"), stream_options={"x": 1}
+    )
+    assert len(path.read_text().splitlines()) == 2
+
+    player = CassetteClient(path, REPLAY, latency_scale=1.0)
+    replayed = await player.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "list files"}]
+    )
+    assert replayed.choices[0].message.tool_calls == first.choices[0].message.tool_calls
+    # Tool call ids and transport options do not affect matching
+    second = await player.chat.completions.create(model="m", messages=_history("xyz"))
+    assert second.choices[0].message.content == "done"
+    assert player.stats == {"replayed": 2, "recorded": 0}
+
+    with pytest.raises(CassetteMissError):
+        await player.chat.completions.create(model="m", messages=[])
+
+
+@pytest.mark.asyncio
+async def test_streams_are_recorded_chunk_by_chunk(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    provider, _ = _provider()
+    chunks = [make_chunk("Hel"), make_chunk("lo", finish_reason="stop")]
+
+    async def create(**params):
+        return stream_chunks(chunks)
+
+    provider.chat.completions.create = create
+    recorder = CassetteClient(path, AUTO, client=provider)
+    params = {"model": "m", "messages": [], "stream": True}
+    recorded = [c async for c in await recorder.chat.completions.create(**params)]
+    assert recorded == chunks
+
+    player = CassetteClient(path, REPLAY)
+    replayed = [c async for c in await player.chat.completions.create(**params)]
+    assert [c.choices[0].delta.content for c in replayed] == ["Hel", "lo"]
+    assert json.loads(path.read_text())["kind"] == "stream"
+
+
+@pytest.mark.asyncio
+async def test_llm_replays_from_cassette(llm_factory, tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    llm = llm_factory()
+    provider = llm.client
+    llm.client = CassetteClient(path, RECORD, client=provider)
+    answer = await llm.ask([Message.user_message("hi")], stream=False)
+
+    llm.client = CassetteClient(path, REPLAY)
+    assert await llm.ask([Message.user_message("hi")], stream=False) == answer
+    assert len(provider.chat.completions.requests) == 1
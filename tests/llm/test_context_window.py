@@ -0,0 +1,80 @@
+import pytest
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from app.context_window import ContextWindow
+from app.llm import TokenCounter
+from app.schema import Message, Role
+
+
+def _call(call_id: str) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall(
+        id=call_id, type="function", function={"name": "bash", "arguments": "{}"}
+    )
+
+
+def _step(i: int, observation_words: int = 300) -> list:
+    """One agent step: a user prompt, a tool call and its observation."""
+    return [
+        Message.user_message(f"step {i}"),
+        Message.from_tool_calls(tool_calls=[_call(f"call_{i}")], content=f"run {i}"),
+        Message.tool_message(
+            "word " * observation_words, name="bash", tool_call_id=f"call_{i}"
+        ),
+    ]
+
+
+@pytest.fixture
+def counter(fake_tokenizer) -> TokenCounter:
+    return TokenCounter(fake_tokenizer)
+
+
+@pytest.fixture
+def history() -> list:
+    messages = [Message.system_message("you are an agent")]
+    for i in range(5):
+        messages += _step(i)
+    return messages
+
+
+def _total(window: ContextWindow, messages: list, counter: TokenCounter) -> int:
+    return sum(window.count(m, counter) for m in messages)
+
+
+def test_history_within_budget_is_unchanged(history, counter):
+    window = ContextWindow(max_tokens=100_000)
+    assert window.fit(history, counter) is history
+
+
+def test_old_observations_are_condensed_first(history, counter):
+    """Tests that condensing old observations happens before dropping."""
+    window = ContextWindow(max_tokens=1200, keep_recent_turns=2, condensed_chars=20)
+    fitted = window.fit(history, counter)
+
+    assert len(fitted) == len(history)
+    assert _total(window, fitted, counter) <= 1200
+    assert "condensed" in fitted[3].content
+    # The two most recent turns are untouched
+    assert fitted[-6:] == history[-6:]
+    # Memory itself was not modified
+    assert "condensed" not in history[3].content
+
+
+def test_oldest_pairs_dropped_together(history, counter):
+    """Tests that dropping never separates a tool call from its result."""
+    window = ContextWindow(max_tokens=750, keep_recent_turns=2, condensed_chars=20)
+    fitted = window.fit(history, counter, reserved_tokens=50)
+
+    assert _total(window, fitted, counter) <= 700
+    assert len(fitted) < len(history)
+    assert fitted[0].role == Role.SYSTEM
+    assert "omitted to fit the context window" in fitted[1].content
+    assert fitted[-6:] == history[-6:]
+
+    call_ids = {call.id for m in fitted if m.tool_calls for call in m.tool_calls}
+    result_ids = {m.tool_call_id for m in fitted if m.role == Role.TOOL}
+    assert call_ids == result_ids
+
+
+def test_group_messages_pairs_calls_with_results(history):
+    groups = ContextWindow.group_messages(history)
+    assert [len(group) for group in groups] == [1] + [1, 2] * 5
@@ -0,0 +1,199 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from app.config import EndpointSettings
+from app.endpoint_pool import (
+    WEIGHTED_ROUND_ROBIN,
+    Endpoint,
+    EndpointPool,
+    is_endpoint_failure,
+)
+from app.schema import Message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _endpoint(name: str, weight: int = 1) -> Endpoint:
+    return Endpoint(name, client=SimpleNamespace(), weight=weight)
+
+
+def test_weighted_round_robin_distribution():
+    """Tests that traffic is split in proportion to endpoint weights."""
+    pool = EndpointPool(
+        [_endpoint("a", 3), _endpoint("b", 1)], strategy=WEIGHTED_ROUND_ROBIN
+    )
+    picks = [pool.select().name for _ in range(8)]
+    assert picks.count("a") == 6
+    assert picks.count("b") == 2
+
+
+def test_least_outstanding_prefers_idle_endpoint():
+    a, b = _endpoint("a"), _endpoint("b")
+    pool = EndpointPool([a, b])
+    a.outstanding = 2
+    assert pool.select() is b
+    b.outstanding = 3
+    assert pool.select() is a
+
+
+def test_ejection_and_recovery():
+    """Tests that repeated failures eject an endpoint until its cool-down ends."""
+    clock = FakeClock()
+    a, b = _endpoint("a"), _endpoint("b")
+    pool = EndpointPool([a, b], failure_threshold=2, ejection_seconds=10, clock=clock)
+
+    pool.record_failure(a, RuntimeError("boom"))
+    assert a.is_healthy(clock.now)
+    pool.record_failure(a, RuntimeError("boom"))
+    assert not a.is_healthy(clock.now)
+    assert all(pool.select() is b for _ in range(4))
+
+    clock.now = 11
+    assert a.is_healthy(clock.now)
+    pool.record_success(a, 0.5)
+    assert a.consecutive_failures == 0
+    assert pool.get_stats()["a"]["latency_avg"] == 0.5
+
+
+class HeldStream:
+    """Streamed response whose last chunk waits until released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.closed = False
+
+    async def __aiter__(self):
+        yield "first"
+        await self.release.wait()
+        yield "last"
+
+    async def close(self):
+        self.closed = True
+
+
+def _streaming_endpoint(name: str) -> Endpoint:
+    async def create(**params):
+        return HeldStream()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace()))
+    client.chat.completions.create = create
+    return Endpoint(name, client=client)
+
+
+@pytest.mark.asyncio
+async def test_open_streams_count_as_outstanding():
+    a, b = _streaming_endpoint("a"), _streaming_endpoint("b")
+    pool = EndpointPool([a, b])
+
+    held = await pool.create_completion(stream=True)
+    first = held.__aiter__()
+    assert await first.__anext__() == "first"
+    assert a.outstanding + b.outstanding == 1
+    busy = a if a.outstanding else b
+    # The next request goes to the idle endpoint while the stream is open
+    assert pool.select() is not busy
+
+    other = await pool.create_completion(stream=True)
+    assert a.outstanding == b.outstanding == 1
+    await other.close()
+    assert other.closed
+
+    held._stream.release.set()
+    assert [chunk async for chunk in first] == ["last"]
+    assert a.outstanding == b.outstanding == 0
+
+
+def _throttling_endpoint(name: str) -> Endpoint:
+    async def create(**params):
+        request = httpx.Request("POST", "http://localhost:0/v1/chat/completions")
+        response = httpx.Response(429, headers={"retry-after": "5"}, request=request)
+        raise RateLimitError("slow down", response=response, body=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace()))
+    client.chat.completions.create = create
+    return Endpoint(name, client=client)
+
+
+@pytest.mark.asyncio
+async def test_throttled_endpoint_backs_off_without_ejection():
+    clock = FakeClock()
+    a, b = _throttling_endpoint("a"), _streaming_endpoint("b")
+    pool = EndpointPool([a, b], failure_threshold=1, clock=clock)
+
+    for _ in range(2):
+        stream = await pool.create_completion(stream=True)
+        await stream.close()
+
+    # Tried once, then skipped for its Retry-After; never ejected
+    assert (a.requests, a.throttled, a.failures) == (1, 1, 0)
+    assert a.is_healthy(clock.now)
+    clock.now = 6
+    assert pool.select(exclude={"b"}) is a
+
+
+class DroppedStream:
+    async def __aiter__(self):
+        yield "first"
+        raise httpx.ReadError("connection reset")
+
+
+@pytest.mark.asyncio
+async def test_errors_mid_stream_count_against_endpoint():
+    async def create(**params):
+        return DroppedStream()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace()))
+    client.chat.completions.create = create
+    a = Endpoint("a", client=client)
+    pool = EndpointPool([a], failure_threshold=1)
+
+    stream = await pool.create_completion(stream=True)
+    with pytest.raises(httpx.ReadError):
+        async for _ in stream:
+            pass
+
+    assert a.failures == 1 and not a.is_healthy(pool._clock())
+    assert a.outstanding == 0
+
+
+def test_request_errors_do_not_count_against_endpoint():
+    assert not is_endpoint_failure(ValueError("bad request"))
+
+
+@pytest.mark.asyncio
+async def test_llm_fails_over_between_mock_servers(llm_factory, mock_openai_servers):
+    """Tests load balancing, failover and ejection against local servers."""
+    healthy = mock_openai_servers("healthy")
+    broken = mock_openai_servers("broken")
+    broken.status = 500
+
+    llm = llm_factory(
+        endpoints=[
+            EndpointSettings(base_url=broken.base_url, name="broken"),
+            EndpointSettings(base_url=healthy.base_url, name="healthy"),
+        ],
+        endpoint_failure_threshold=2,
+        endpoint_ejection_seconds=60,
+    )
+    assert llm.endpoint_pool is not None
+
+    for _ in range(4):
+        response = await llm.ask([Message.user_message("hi")], stream=False)
+        assert response == "healthy"
+
+    stats = llm.get_endpoint_stats()
+    assert stats["broken"]["failures"] == 2
+    assert stats["broken"]["healthy"] is False
+    assert stats["healthy"]["requests"] == 4
+    assert stats["healthy"]["latency_ewma"] > 0
+    assert len(broken.requests) == 2
@@ -0,0 +1,53 @@
+import pytest
+
+from app.llm import LLM
+from app.schema import Memory, Message
+
+
+def test_formatted_dict_is_cached_until_mutation():
+    message = Message.user_message("look", base64_image="aGk=")
+
+    first = LLM.format_messages([message], supports_images=True)[0]
+    assert LLM.format_messages([message], supports_images=True)[0] is first
+    assert first["content"][1]["image_url"]["url"] == "data:image/jpeg;base64,aGk="
+    # Formatting does not consume the image
+    assert message.base64_image == "aGk="
+    assert "base64_image" not in LLM.format_messages([message])[0]
+
+    message.content = "look again"
+    updated = LLM.format_messages([message], supports_images=True)[0]
+    assert updated is not first and updated["content"][0]["text"] == "look again"
+
+    copied = message.model_copy(update={"content": "copy"})
+    assert copied.to_formatted()["content"] == "copy"
+
+
+def test_memory_formatted_list_grows_at_tail():
+    memory = Memory()
+    for i in range(5):
+        memory.add_message(Message.user_message(f"message {i}"))
+    first = memory.formatted_messages()
+
+    memory.add_message(Message.assistant_message("reply"))
+    second = memory.formatted_messages()
+    assert second[:5] == first and all(a is b for a, b in zip(first, second))
+    assert second[-1] == {"role": "assistant", "content": "reply"}
+    assert LLM.format_messages(second) == [m.to_dict() for m in memory.messages]
+
+    # Replacing an earlier message invalidates the tail from there on
+    memory.messages[2] = Message.user_message("replaced")
+    assert memory.formatted_messages()[2]["content"] == "replaced"
+    memory.messages[3].content = "changed"
+    assert memory.formatted_messages()[3]["content"] == "changed"
+
+
+@pytest.mark.asyncio
+async def test_ask_with_images_keeps_cached_dicts_intact(llm_factory):
+    llm = llm_factory(model="gpt-4o")
+    message = Message.user_message("describe")
+
+    await llm.ask_with_images([message], ["http://img"], stream=False)
+
+    sent = llm.client.chat.completions.requests[0]["messages"][-1]
+    assert sent["content"][-1]["image_url"] == {"url": "http://img"}
+    assert message.to_formatted(True) == {"role": "user", "content": "describe"}
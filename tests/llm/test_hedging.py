@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from app import hedging
+from app.hedging import HedgePolicy, LatencyTracker
+from app.schema import Message
+from tests.llm.conftest import make_completion
+
+
+class SlowCompletions:
+    """Answers each request after the next configured delay."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.started = 0
+        self.cancelled = 0
+
+    async def create(self, **params):
+        index = self.started
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delays[index])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return make_completion(
+            content=f"response {index}", prompt_tokens=10 * (index + 1)
+        )
+
+
+def seeded_tracker(latency=0.01, samples=20) -> LatencyTracker:
+    tracker = LatencyTracker()
+    for _ in range(samples):
+        tracker.record(latency)
+    return tracker
+
+
+def test_percentile_nearest_rank():
+    tracker = LatencyTracker()
+    for value in range(1, 101):
+        tracker.record(value / 100)
+    assert tracker.percentile(95) == 0.95
+    assert tracker.percentile(50) == 0.5
+
+
+@pytest.mark.asyncio
+async def test_no_hedging_until_enough_samples():
+    completions = SlowCompletions([0.05])
+    policy = HedgePolicy(LatencyTracker(), percentile=90, min_samples=5)
+
+    await policy.run(completions.create)
+
+    assert completions.started == 1
+    assert policy.get_stats()["hedged"] == 0
+    assert len(policy.tracker) == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    completions = SlowCompletions([1.0, 0.01])
+    policy = HedgePolicy(seeded_tracker(0.02), percentile=95)
+
+    response = await policy.run(completions.create)
+
+    assert response.choices[0].message.content == "response 1"
+    await asyncio.sleep(0)  # Let the cancellation reach the loser
+    assert completions.cancelled == 1
+    stats = policy.get_stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert stats["hedge_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_delay_stays_stable_under_heavy_tail():
+    policy = HedgePolicy(seeded_tracker(0.02), percentile=50)
+    # Every primary is slow and every hedge fast
+    completions = SlowCompletions([0.5, 0.001] * 20)
+
+    for _ in range(20):
+        await policy.run(completions.create)
+
+    assert policy.get_stats()["hedge_wins"] == 20
+    # Recording the hedges' own latencies would pull the median to ~1ms
+    assert policy.delay() >= 0.02
+
+
+@pytest.mark.asyncio
+async def test_hedge_survives_primary_failure():
+    class FailingFirst(SlowCompletions):
+        async def create(self, **params):
+            if self.started == 0:
+                self.started += 1
+                await asyncio.sleep(0.03)
+                raise RuntimeError("boom")
+            return await super().create(**params)
+
+    completions = FailingFirst([None, 0.1])
+    policy = HedgePolicy(seeded_tracker(0.01), percentile=95)
+
+    response = await policy.run(completions.create)
+
+    assert response.choices[0].message.content == "response 1"
+
+
+@pytest.mark.asyncio
+async def test_llm_counts_only_the_winner(llm_factory, monkeypatch):
+    monkeypatch.setattr(hedging, "_trackers", {})
+    llm = llm_factory(hedge_percentile=95, hedge_min_samples=20)
+    for _ in range(20):
+        llm.hedge_policy.tracker.record(0.02)
+    completions = SlowCompletions([1.0, 0.01])
+    llm.client.chat.completions = completions
+
+    await llm.ask([Message.user_message("hi")], stream=False)
+
+    # Only the hedge (20 prompt tokens) is billed, not the cancelled original
+    assert llm.total_input_tokens == 20
+    assert llm.get_hedge_stats()["hedge_wins"] == 1
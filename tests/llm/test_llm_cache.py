@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from app.config import LLMCacheSettings
+from app.llm_cache import ResponseCache, make_cache_key
+from app.schema import Message
+from tests.llm.conftest import make_completion
+
+
+@pytest.fixture
+def cache(tmp_path) -> ResponseCache:
+    return ResponseCache(
+        LLMCacheSettings(
+            enabled=True,
+            memory_max_entries=2,
+            disk_path=str(tmp_path / "cache.sqlite3"),
+        )
+    )
+
+
+def test_cache_key_is_order_independent():
+    """Tests that logically identical requests hash to the same key."""
+    a = make_cache_key(model="m", messages=[{"role": "user", "content": "hi"}])
+    b = make_cache_key(messages=[{"role": "user", "content": "hi"}], model="m")
+    c = make_cache_key(model="m", messages=[{"role": "user", "content": "hey"}])
+    assert a == b
+    assert a != c
+
+
+def test_memory_and_disk_tiers(cache):
+    """Tests LRU eviction from memory with fallback to the disk tier."""
+    for i in range(3):
+        cache.set(f"k{i}", {"content": str(i)})
+    assert len(cache.memory) == 2
+    assert cache.get("k0") == {"content": "0"}
+    assert cache.stats["disk_hits"] == 1
+    assert cache.get("k0") == {"content": "0"}
+    assert cache.stats["memory_hits"] == 1
+    assert cache.get("missing") is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_ttl_expiry(cache):
+    """Tests that expired entries are dropped from both tiers."""
+    cache.settings.ttl = 1
+    cache.set("k", {"content": "v"})
+    cache.memory._entries["k"] = (time.time() - 10, {"content": "v"})
+    cache.disk._conn.execute("UPDATE responses SET created_at = ?", (time.time() - 10,))
+    assert cache.get("k") is None
+    assert len(cache.disk) == 0
+
+
+def test_disk_size_eviction(tmp_path):
+    """Tests that the disk tier evicts least recently used entries past max size."""
+    cache = ResponseCache(
+        LLMCacheSettings(
+            enabled=True,
+            disk_path=str(tmp_path / "cache.sqlite3"),
+            disk_max_bytes=100,
+        )
+    )
+    for i in range(5):
+        cache.set(f"k{i}", {"content": "x" * 20})
+    assert 0 < len(cache.disk) < 5
+    assert cache.disk.get("k4") is not None
+    assert cache.disk.get("k0") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_hits_touch_access_time_sparingly(cache):
+    """Tests that hits only rewrite the access time once it has gone stale."""
+    await cache.aset("k", {"content": "v"})
+    cache.memory.clear()
+
+    def accessed_at():
+        return cache.disk._conn.execute("SELECT accessed_at FROM responses").fetchone()[
+            0
+        ]
+
+    stored = accessed_at()
+    assert await cache.aget("k") == {"content": "v"}
+    assert accessed_at() == stored
+
+    cache.disk._conn.execute("UPDATE responses SET accessed_at = 0")
+    cache.memory.clear()
+    assert await cache.aget("k") == {"content": "v"}
+    assert accessed_at() > 0
+    assert cache.stats["disk_hits"] == 2
+
+
+def test_should_cache_respects_temperature(cache):
+    assert cache.should_cache(0.0)
+    assert not cache.should_cache(0.7)
+    cache.settings.deterministic_only = False
+    assert cache.should_cache(0.7)
+
+
+@pytest.mark.asyncio
+async def test_ask_tool_served_from_cache(llm_factory, cache):
+    """Tests that a repeated ask_tool request is answered without the provider."""
+    llm = llm_factory()
+    llm.response_cache = cache
+    completions = llm.client.chat.completions
+    completions.responses.append(
+        make_completion(
+            content="calling",
+            tool_calls=[
+                {
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {"name": "terminate", "arguments": "{}"},
+                }
+            ],
+        )
+    )
+    messages = [Message.user_message("hello")]
+
+    first = await llm.ask_tool(messages=messages, tools=[{"type": "function"}])
+    second = await llm.ask_tool(messages=messages, tools=[{"type": "function"}])
+
+    assert len(completions.requests) == 1
+    assert second.content == first.content == "calling"
+    assert second.tool_calls[0].id == "call_1"
+    assert second.tool_calls[0].function.name == "terminate"
+    assert llm.get_cache_stats()["hits"] == 1
+    assert llm.total_input_tokens == 10
+
+
+@pytest.mark.asyncio
+async def test_ask_served_from_cache(llm_factory, cache):
+    llm = llm_factory()
+    llm.response_cache = cache
+    messages = [Message.user_message("hello")]
+
+    assert await llm.ask(messages, stream=False) == "ok"
+    assert await llm.ask(messages, stream=False) == "ok"
+    assert len(llm.client.chat.completions.requests) == 1
@@ -0,0 +1,146 @@
+import pytest
+
+from app.bedrock import ChatCompletions
+from app.prompt_cache import (
+    ANTHROPIC,
+    BEDROCK,
+    OPENAI,
+    add_cache_breakpoint,
+    add_tools_breakpoint,
+    get_cache_style,
+    get_cached_tokens,
+)
+from app.schema import Message
+from tests.llm.conftest import make_completion
+
+
+TOOLS = [
+    {"type": "function", "function": {"name": "bash", "parameters": {}}},
+    {"type": "function", "function": {"name": "terminate", "parameters": {}}},
+]
+
+
+def test_cache_style_by_provider():
+    assert get_cache_style("openai", "gpt-4o") == OPENAI
+    assert get_cache_style("openai", "anthropic/claude-3.7-sonnet") == ANTHROPIC
+    assert get_cache_style("aws", "us.anthropic.claude-3-7-sonnet") == BEDROCK
+
+
+def test_breakpoint_marks_last_text_message_without_mutating_input():
+    messages = [
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": None, "tool_calls": []},
+    ]
+    original = dict(messages[0])
+
+    add_cache_breakpoint(messages)
+
+    assert messages[0]["content"] == [
+        {"type": "text", "text": "hello", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert "cache_control" not in str(messages[1])
+    assert original == {"role": "user", "content": "hello"}
+
+
+@pytest.mark.asyncio
+async def test_ask_tool_marks_prefix_and_reports_cached_tokens(llm_factory):
+    llm = llm_factory(model="claude-3-7-sonnet", prompt_cache=True)
+    completions = llm.client.chat.completions
+    completions.responses = [make_completion(prompt_tokens=100, cached_tokens=80)]
+
+    await llm.ask_tool(
+        messages=[Message.user_message("step one")],
+        system_msgs=[Message.system_message("You are an agent")],
+        tools=TOOLS,
+    )
+
+    request = completions.requests[0]
+    system, user = request["messages"]
+    assert system["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert user["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert request["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in TOOLS[-1]
+
+    assert llm.total_cached_tokens == 80
+    assert llm.get_prompt_cache_stats()["hit_rate"] == pytest.approx(0.8)
+
+
+@pytest.mark.asyncio
+async def test_openai_prefix_caching_needs_no_markers(llm_factory):
+    llm = llm_factory(model="gpt-4o", prompt_cache=True)
+    completions = llm.client.chat.completions
+    completions.responses = [make_completion(prompt_tokens=50, cached_tokens=32)]
+
+    await llm.ask_tool(messages=[Message.user_message("hi")], tools=TOOLS)
+
+    request = completions.requests[0]
+    assert request["messages"][0]["content"] == "hi"
+    assert request["tools"] is TOOLS
+    assert llm.total_cached_tokens == 32
+
+
+def test_bedrock_converts_breakpoints_to_cache_points():
+    messages = add_cache_breakpoint(
+        [
+            {"role": "user", "content": "run it"},
+            {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [
+                    {
+                        "id": "tool_1",
+                        "type": "function",
+                        "function": {"name": "bash", "arguments": "{}"},
+                    }
+                ],
+            },
+            {"role": "tool", "tool_call_id": "tool_1", "content": "done"},
+        ]
+    )
+    system = add_cache_breakpoint([{"role": "system", "content": "Be brief"}])
+
+    system_prompt, bedrock_messages = ChatCompletions(
+        None
+    )._convert_openai_messages_to_bedrock_format(system + messages)
+
+    assert system_prompt == [{"text": "Be brief"}, {"cachePoint": {"type": "default"}}]
+    tool_message = bedrock_messages[-1]["content"]
+    assert tool_message[0]["toolResult"]["content"] == [{"text": "done"}]
+    assert tool_message[1] == {"cachePoint": {"type": "default"}}
+
+
+def test_bedrock_caches_tool_config_and_reports_cache_usage(llm_factory):
+    completions = ChatCompletions(None)
+    tools = completions._convert_openai_tools_to_bedrock_format(
+        add_tools_breakpoint(TOOLS)
+    )
+    assert [next(iter(tool)) for tool in tools] == [
+        "toolSpec",
+        "toolSpec",
+        "cachePoint",
+    ]
+
+    response = completions._convert_bedrock_response_to_openai_format(
+        {
+            "output": {"message": {"role": "assistant", "content": [{"text": "ok"}]}},
+            "stopReason": "end_turn",
+            "usage": {
+                "inputTokens": 50,
+                "outputTokens": 10,
+                "totalTokens": 1260,
+                "cacheReadInputTokens": 1000,
+                "cacheWriteInputTokens": 200,
+            },
+            "metrics": {"latencyMs": 850},
+        }
+    )
+    usage = response.usage
+    assert (usage.prompt_tokens, usage.completion_tokens) == (1250, 10)
+    assert get_cached_tokens(usage) == 1000 and usage.latency_ms == 850
+
+    llm = llm_factory()
+    llm._record_usage("ask", 1.0, usage)
+    assert llm.get_prompt_cache_stats()["cache_write_tokens"] == 200
+    assert llm.total_cached_tokens == 1000
+    record = llm.usage_ledger.records[-1]
+    assert (record.cache_write_tokens, record.server_latency) == (200, 0.85)
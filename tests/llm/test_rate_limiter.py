@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rate_limiter import RateLimiter, TokenBucket, get_rate_limiter
+from app.schema import Message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(600, clock)
+    bucket.take(600)
+    assert bucket.wait_time(10) == pytest.approx(1.0)
+    clock.now = 1.0
+    assert bucket.wait_time(10) == 0
+    clock.now = 1000
+    bucket.give(0)
+    assert bucket.level == 600
+
+
+def test_reconcile_charges_underestimates():
+    """Tests that usage above the estimate becomes debt on the bucket."""
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute=600, clock=clock)
+    limiter.tokens.take(100)
+    limiter.reconcile(estimated_tokens=100, actual_tokens=700)
+    assert limiter.tokens.level == pytest.approx(-100)
+    assert limiter.tokens.wait_time(50) == pytest.approx(15.0)
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_order():
+    """Tests that queued callers are admitted FIFO once capacity refills."""
+    limiter = RateLimiter(tokens_per_minute=6000)  # 100 tokens per second
+    limiter.tokens.level = 0
+    order = []
+
+    async def call(i: int):
+        await limiter.acquire(10)
+        order.append(i)
+
+    start = time.monotonic()
+    await asyncio.gather(*(call(i) for i in range(3)))
+    assert order == [0, 1, 2]
+    assert time.monotonic() - start >= 0.25
+    assert limiter.stats["acquired"] == 3
+
+
+def test_limiters_are_shared_per_config():
+    assert get_rate_limiter("test-shared") is None
+    first = get_rate_limiter("test-shared", requests_per_minute=10)
+    assert get_rate_limiter("test-shared", requests_per_minute=10) is first
+    assert get_rate_limiter("test-other", requests_per_minute=10) is not first
+
+
+@pytest.mark.asyncio
+async def test_ask_tool_reserves_and_reconciles(llm_factory):
+    """Tests that ask_tool reserves the estimate and settles actual usage."""
+    llm = llm_factory(tpm_limit=6000, rpm_limit=100)
+    limiter = llm.rate_limiter
+    assert limiter is not None
+
+    await llm.ask_tool(messages=[Message.user_message("one two three")])
+
+    assert limiter.stats["acquired"] == 1
+    # The fake completion reports 10 prompt + 5 completion tokens
+    assert limiter.tokens.level == pytest.approx(6000 - 15, abs=1)
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.config import LLMSettings
+from app.llm import LLM, LLMRegistry
+from app.schema import Message
+
+
+@pytest.mark.asyncio
+async def test_sessions_share_resources_but_not_accounting(llm_factory):
+    base = llm_factory(rpm_limit=6000)
+    registry = LLMRegistry()
+    first = registry.session(session_id="a")
+    second = registry.session(session_id="b")
+
+    assert first.client is base.client and second.client is base.client
+    assert first.tokenizer is base.tokenizer
+    assert first.rate_limiter is base.rate_limiter
+
+    async def run(handle: LLM, calls: int):
+        for _ in range(calls):
+            await handle.ask([Message.user_message("hi")], stream=False)
+
+    await asyncio.gather(run(first, 3), run(second, 1))
+
+    assert first.total_input_tokens == 30
+    assert second.total_input_tokens == 10
+    assert base.total_input_tokens == 0
+    assert base.rate_limiter.stats["acquired"] == 4
+    records = base.usage_ledger.query(session_id="a")
+    assert len(records) == 3
+
+
+@pytest.mark.asyncio
+async def test_session_budget_and_rate_limits_are_isolated(llm_factory):
+    llm_factory()
+    registry = LLMRegistry()
+    small = registry.session(max_input_tokens=15, rpm_limit=60)
+    large = registry.session(max_input_tokens=1000)
+
+    await small.ask([Message.user_message("hi")], stream=False)
+    await large.ask([Message.user_message("hi")], stream=False)
+
+    # Each session spent 10 of its own budget
+    assert not small.check_token_limit(10)
+    assert large.check_token_limit(10)
+
+    assert small.session_rate_limiter.stats["acquired"] == 1
+    assert large.session_rate_limiter is None
+
+
+def test_session_lookup_and_close(llm_factory):
+    llm_factory()
+    registry = LLMRegistry()
+    handle = registry.session(session_id="worker-1")
+
+    assert registry.session(session_id="worker-1") is handle
+    assert registry.get_session("worker-1") is handle
+    registry.close_session("worker-1")
+    assert registry.session_ids == []
+
+
+def test_concurrent_construction_yields_one_instance(fake_tokenizer, monkeypatch):
+    monkeypatch.setattr(LLM, "_instances", {})
+    llm_config = {
+        "default": LLMSettings(
+            model="test-model",
+            base_url="http://localhost:0/v1",
+            api_key="test",
+            api_type="openai",
+            api_version="",
+        )
+    }
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: LLM("default", llm_config), range(16)))
+
+    assert all(instance is instances[0] for instance in instances)
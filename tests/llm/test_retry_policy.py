@@ -0,0 +1,199 @@
+import httpx
+import pytest
+from openai import AuthenticationError, InternalServerError, RateLimitError
+
+from app.exceptions import CircuitOpenError, TokenLimitExceeded
+from app.retry_policy import CLOSED, OPEN, CircuitBreaker, RetryPolicy
+from app.schema import Message
+from app.stream_sink import NullSink
+from tests.llm.conftest import make_chunk, stream_chunks
+
+
+def _error(cls, status: int, headers: dict = None):
+    request = httpx.Request("POST", "http://localhost:0/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _failing(*errors):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return call, calls
+
+
+@pytest.mark.asyncio
+async def test_fatal_errors_are_not_retried():
+    clock = FakeClock()
+    policy = RetryPolicy(clock=clock, sleep=clock.sleep)
+    for error in (TokenLimitExceeded("too long"), _error(AuthenticationError, 401)):
+        call, calls = _failing(error)
+        with pytest.raises(type(error)):
+            await policy.call(call)
+        assert len(calls) == 1
+    assert clock.sleeps == []
+    assert policy.get_stats()["fatal"] == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_after_and_total_time_cap():
+    clock = FakeClock()
+    policy = RetryPolicy(max_total_seconds=10, clock=clock, sleep=clock.sleep)
+    throttled = _error(RateLimitError, 429, {"retry-after": "3"})
+    call, calls = _failing(throttled, _error(InternalServerError, 500))
+    assert await policy.call(call) == "ok"
+    assert clock.sleeps[0] == 3.0
+    assert len(calls) == 3
+
+    # The second 8s wait would exceed the 10s budget
+    slow = _error(RateLimitError, 429, {"retry-after-ms": "8000"})
+    call, calls = _failing(slow, slow, slow)
+    with pytest.raises(RateLimitError):
+        await policy.call(call)
+    assert len(calls) == 2
+    assert policy.get_stats()["exhausted"] == 1
+
+
+def test_circuit_opens_then_half_opens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("ep", failure_threshold=2, reset_seconds=30, clock=clock)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 31
+    breaker.before_call()  # trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    assert breaker.get_stats()["rejected"] == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_fails_fast_on_dead_endpoint(llm_factory):
+    llm = llm_factory(retry_max_attempts=1, circuit_failure_threshold=2)
+    completions = llm.client.chat.completions
+    outage = _error(InternalServerError, 503)
+
+    async def create(**params):
+        completions.requests.append(params)
+        raise outage
+
+    completions.create = create
+    for _ in range(2):
+        with pytest.raises(InternalServerError):
+            await llm.ask([Message.user_message("hi")], stream=False)
+    with pytest.raises(CircuitOpenError):
+        await llm.ask([Message.user_message("hi")], stream=False)
+    assert len(completions.requests) == 2
+    assert llm.get_retry_stats()["circuit"]["state"] == OPEN
+
+    # Token limits are raised before any request, without retrying
+    llm.max_input_tokens = 1
+    with pytest.raises(TokenLimitExceeded):
+        await llm.ask([Message.user_message("far too long")], stream=False)
+    assert llm.get_retry_stats()["fatal"] == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_is_waited_out_within_budget(llm_factory):
+    llm = llm_factory(circuit_failure_threshold=1, circuit_reset_seconds=30)
+    clock = FakeClock()
+    llm.retry_policy = RetryPolicy(clock=clock, sleep=clock.sleep)
+    llm.circuit_breaker._clock = clock
+    completions = llm.client.chat.completions
+    completions.create, create = None, completions.create
+    call, calls = _failing(_error(InternalServerError, 503))
+
+    async def flaky(**params):
+        await call()
+        return await create(**params)
+
+    completions.create = flaky
+    assert await llm.ask([Message.user_message("hi")], stream=False) == "ok"
+    # One failure opened the circuit; the retry waited for the trial call
+    assert len(calls) == 2
+    assert clock.now >= 30
+    assert llm.circuit_breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_throttling_does_not_open_circuit(llm_factory):
+    llm = llm_factory(retry_max_attempts=1, circuit_failure_threshold=2)
+    completions = llm.client.chat.completions
+
+    async def create(**params):
+        completions.requests.append(params)
+        raise _error(RateLimitError, 429, {"retry-after": "1"})
+
+    completions.create = create
+    for _ in range(3):
+        with pytest.raises(RateLimitError):
+            await llm.ask([Message.user_message("hi")], stream=False)
+    assert len(completions.requests) == 3
+    assert llm.get_retry_stats()["circuit"]["state"] == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_bad_key_does_not_open_circuit_for_other_configs(llm_factory):
+    bad = llm_factory("bad", retry_max_attempts=1, circuit_failure_threshold=2)
+    good = llm_factory("good", retry_max_attempts=1, circuit_failure_threshold=2)
+    assert bad.circuit_breaker is not good.circuit_breaker
+
+    async def create(**params):
+        raise _error(AuthenticationError, 401)
+
+    bad.client.chat.completions.create = create
+    for _ in range(3):
+        with pytest.raises(AuthenticationError):
+            await bad.ask([Message.user_message("hi")], stream=False)
+    assert bad.get_retry_stats()["circuit"]["state"] == CLOSED
+
+    assert await good.ask([Message.user_message("hi")], stream=False) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_stream_dropped_midway_is_retried(llm_factory):
+    llm = llm_factory()
+    clock = FakeClock()
+    llm.retry_policy = RetryPolicy(clock=clock, sleep=clock.sleep)
+    completions = llm.client.chat.completions
+
+    async def dropped():
+        yield make_chunk(content="Hel")
+        raise httpx.RemoteProtocolError("peer closed connection")
+
+    streams = [dropped(), stream_chunks([make_chunk(content="Hello")])]
+
+    async def create(**params):
+        completions.requests.append(params)
+        return streams.pop(0)
+
+    completions.create = create
+    answer = await llm.ask([Message.user_message("hi")], sink=NullSink())
+
+    assert answer == "Hello"
+    assert len(completions.requests) == 2
+    assert llm.get_retry_stats()["retries"] == 1
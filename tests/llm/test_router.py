@@ -0,0 +1,89 @@
+import pytest
+
+from app.config import LLMRouterSettings, RouteRule, config
+from app.llm import LLMRegistry
+from app.router import EXTRACT, SUMMARIZE, ModelRouter
+from app.schema import Message
+
+
+@pytest.fixture
+def llms(llm_factory, monkeypatch):
+    strong = llm_factory("default", model="gpt-4o")
+    fast = llm_factory("fast", model="gpt-4o-mini")
+    # Rules may only name configs defined in [llm.<name>]
+    monkeypatch.setattr(
+        config._config, "llm", {**config.llm, "fast": config.llm["default"]}
+    )
+    return strong, fast
+
+
+def _router(*rules: RouteRule) -> ModelRouter:
+    return ModelRouter(LLMRouterSettings(rules=list(rules)))
+
+
+@pytest.mark.asyncio
+async def test_routes_task_to_matching_config(llms):
+    strong, fast = llms
+    router = _router(RouteRule(task=SUMMARIZE, config="fast", max_input_tokens=100))
+    messages = [Message.user_message("summarize the plan")]
+
+    result = await router.run(
+        SUMMARIZE,
+        lambda llm: llm.ask(messages, stream=False),
+        default=strong,
+        messages=messages,
+    )
+
+    assert result == "ok"
+    assert len(fast.client.chat.completions.requests) == 1
+    assert strong.client.chat.completions.requests == []
+    decision = router.decisions[-1]
+    assert (decision.config_name, decision.prompt_tokens) == ("fast", 10)
+    assert decision.cost < decision.default_cost
+    assert router.get_stats()[SUMMARIZE]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unmatched_calls_keep_default(llms):
+    strong, fast = llms
+    router = _router(
+        RouteRule(task=SUMMARIZE, config="fast", max_input_tokens=5),
+        RouteRule(task=EXTRACT, config="fast", max_output_tokens=100),
+    )
+    messages = [Message.user_message("a long page " * 10)]
+
+    # Too many input tokens for the rule, and no output estimate for extract
+    for task in (SUMMARIZE, EXTRACT, "reason"):
+        await router.run(
+            task,
+            lambda llm: llm.ask(messages, stream=False),
+            default=strong,
+            messages=messages,
+        )
+
+    assert len(strong.client.chat.completions.requests) == 3
+    assert fast.client.chat.completions.requests == []
+    assert not router.decisions
+
+
+@pytest.mark.asyncio
+async def test_routed_session_call_keeps_its_session(llms):
+    strong, fast = llms
+    session = LLMRegistry().session(session_id="s1", rpm_limit=600)
+    router = _router(RouteRule(task=SUMMARIZE, config="fast"))
+    messages = [Message.user_message("summarize the plan")]
+
+    await router.run(
+        SUMMARIZE,
+        lambda llm: llm.ask(messages, stream=False),
+        default=session,
+        messages=messages,
+    )
+
+    assert len(fast.client.chat.completions.requests) == 1
+    # Accounted to the session, not to the shared fast config
+    assert session.total_input_tokens == 10
+    assert fast.total_input_tokens == 0
+    assert session.session_rate_limiter.stats["acquired"] == 1
+    [record] = fast.usage_ledger.query(session_id="s1")
+    assert record.config_name == "fast"
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.schema import Message
+from tests.llm.conftest import make_completion
+
+
+def _slow_completions(llm):
+    completions = llm.client.chat.completions
+    release = asyncio.Event()
+
+    async def create(**params):
+        completions.requests.append(params)
+        await release.wait()
+        return make_completion("plan", prompt_tokens=10, completion_tokens=5)
+
+    completions.create = create
+    return completions, release
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_call(llm_factory):
+    llm = llm_factory()
+    completions, release = _slow_completions(llm)
+    messages = [Message.user_message("make a plan")]
+
+    calls = [asyncio.create_task(llm.ask(messages, stream=False)) for _ in range(3)]
+    other = asyncio.create_task(llm.ask([Message.user_message("other")], stream=False))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*calls) == ["plan"] * 3
+    assert await other == "plan"
+    assert len(completions.requests) == 2
+    assert llm.get_coalescing_stats()["coalesced"] == 2
+    assert llm.get_coalescing_stats()["in_flight"] == 0
+    # Tokens of the shared call are counted once
+    assert (llm.total_input_tokens, llm.total_completion_tokens) == (20, 10)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call(llm_factory):
+    llm = llm_factory()
+    completions, release = _slow_completions(llm)
+    messages = [Message.user_message("make a plan")]
+
+    first = asyncio.create_task(llm.ask(messages, stream=False))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(llm.ask(messages, stream=False))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == "plan"
+    assert len(completions.requests) == 1
+    # Finished requests are sent anew
+    assert await llm.ask(messages, stream=False) == "plan"
+    assert len(completions.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_sampled_requests_are_not_coalesced(llm_factory):
+    llm = llm_factory()
+    completions, release = _slow_completions(llm)
+    messages = [Message.user_message("brainstorm")]
+
+    calls = [
+        asyncio.create_task(llm.ask(messages, stream=False, temperature=0.8))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*calls)
+
+    assert len(completions.requests) == 2
+    assert llm.get_coalescing_stats()["coalesced"] == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_callers_get_their_own_message(llm_factory):
+    llm = llm_factory()
+    completions, release = _slow_completions(llm)
+    params = {"model": "test-model", "messages": [], "temperature": 0.0}
+
+    calls = [asyncio.create_task(llm._create_completion(1, **params)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    first, second = await asyncio.gather(*calls)
+
+    assert len(completions.requests) == 1
+    assert first.choices[0].message is not second.choices[0].message
+    second.choices[0].message.content = "edited"
+    assert first.choices[0].message.content == "plan"
@@ -0,0 +1,79 @@
+import asyncio
+import io
+
+import pytest
+
+from app.schema import Message
+from app.stream_sink import FanoutSink, QueueSink, StdoutSink, StreamSink, stream_to
+from tests.llm.conftest import make_chunk, stream_chunks
+
+
+def _stream(llm, *texts):
+    chunks = [make_chunk(text) for text in texts]
+    chunks.append(make_chunk(finish_reason="stop"))
+
+    async def create(**params):
+        return stream_chunks(chunks)
+
+    llm.client.chat.completions.create = create
+
+
+@pytest.mark.asyncio
+async def test_ask_streams_buffered_text_to_call_sink(llm_factory, capsys):
+    llm = llm_factory()
+    _stream(llm, "Hel", "lo", " wor", "ld")
+    sink = QueueSink(flush_interval=60)
+
+    assert await llm.ask([Message.user_message("hi")], sink=sink) == "Hello world"
+
+    # The first chunk at once, the rest buffered, then the end marker
+    assert sink.queue.get_nowait() == "Hel"
+    assert sink.queue.get_nowait() == "lo world"
+    assert sink.queue.get_nowait() is None
+    assert sink.stats == {"chunks": 4, "flushes": 2}
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.asyncio
+async def test_scoped_fanout_sink_serves_sse_listeners(llm_factory):
+    llm = llm_factory(stream_sink="null")
+    _stream(llm, "a", "b")
+    sink = FanoutSink(flush_interval=0)
+    first, second = sink.sse_events(), sink.sse_events()
+    pending = [asyncio.ensure_future(events.__anext__()) for events in (first, second)]
+    await asyncio.sleep(0)
+
+    with stream_to(sink):
+        await llm.ask([Message.user_message("hi")])
+
+    assert [await p for p in pending] == ['data: "a"\n\n'] * 2
+    assert await first.__anext__() == 'data: "b"\n\n'
+    assert await first.__anext__() == "event: end\ndata: \n\n"
+    await first.aclose()
+    await second.aclose()
+    assert not sink._subscribers
+
+
+@pytest.mark.asyncio
+async def test_stalled_stream_is_flushed_on_timer():
+    out = io.StringIO()
+    sink = StdoutSink(out, flush_interval=0.01)
+    sink.write("thinking")
+    sink.write("...")
+    assert out.getvalue() == "thinking"
+
+    await asyncio.sleep(0.05)
+    assert out.getvalue() == "thinking..."
+    sink.end()
+    assert out.getvalue() == "thinking...\n"
+
+
+def test_default_sink_is_not_shared_between_calls(llm_factory):
+    llm = llm_factory(stream_sink="stdout")
+
+    first, second = llm.get_stream_sink(), llm.get_stream_sink()
+
+    # Concurrent agents must not flush or end each other's buffers
+    assert isinstance(first, StdoutSink) and first is not second
+    with pytest.raises(TypeError):
+        StreamSink()
@@ -0,0 +1,244 @@
+import asyncio
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.schema import Message
+from app.streaming import ToolCallAssembler
+from app.tool import Terminate, ToolCollection
+from app.tool.base import BaseTool, ToolResult
+from app.tool.str_replace_editor import StrReplaceEditor
+from tests.llm.conftest import make_chunk, stream_chunks
+
+
+def _tool_call_chunks(second_tool: str = "record") -> list:
+    return [
+        make_chunk(content="Let me "),
+        make_chunk(content="check."),
+        make_chunk(
+            tool_calls=[
+                {
+                    "index": 0,
+                    "id": "call_a",
+                    "type": "function",
+                    "function": {"name": "record", "arguments": ""},
+                }
+            ]
+        ),
+        make_chunk(tool_calls=[{"index": 0, "function": {"arguments": '{"label"'}}]),
+        make_chunk(tool_calls=[{"index": 0, "function": {"arguments": ': "a"}'}}]),
+        make_chunk(
+            tool_calls=[
+                {
+                    "index": 1,
+                    "id": "call_b",
+                    "type": "function",
+                    "function": {"name": second_tool, "arguments": '{"label": "b"}'},
+                }
+            ]
+        ),
+        make_chunk(finish_reason="tool_calls"),
+        make_chunk(
+            usage={"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10}
+        ),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_assembler_fires_each_call_when_complete():
+    """Tests that a call is reported once the next call starts."""
+    seen = []
+    assembler = ToolCallAssembler(on_tool_call=lambda call: seen.append(call.id))
+
+    chunks = _tool_call_chunks()
+    for chunk in chunks[:5]:
+        await assembler.add_chunk(chunk)
+    assert seen == []
+    await assembler.add_chunk(chunks[5])
+    assert seen == ["call_a"]
+    for chunk in chunks[6:]:
+        await assembler.add_chunk(chunk)
+
+    message = await assembler.finish()
+    assert seen == ["call_a", "call_b"]
+    assert message.content == "Let me check."
+    assert message.tool_calls[0].function.arguments == '{"label": "a"}'
+    assert message.tool_calls[1].function.name == "record"
+    assert assembler.usage.prompt_tokens == 7
+
+
+@pytest.mark.asyncio
+async def test_ask_tool_streaming(llm_factory):
+    """Tests streamed ask_tool assembles calls and uses streamed usage."""
+    llm = llm_factory()
+    completions = llm.client.chat.completions
+
+    async def create(**params):
+        completions.requests.append(params)
+        return stream_chunks(_tool_call_chunks())
+
+    completions.create = create
+    seen = []
+
+    async def on_tool_call(call):
+        seen.append(call.function.arguments)
+
+    message = await llm.ask_tool(
+        messages=[Message.user_message("go")],
+        tools=[{"type": "function"}],
+        stream=True,
+        on_tool_call=on_tool_call,
+    )
+
+    assert completions.requests[0]["stream"] is True
+    assert seen == ['{"label": "a"}', '{"label": "b"}']
+    assert [call.id for call in message.tool_calls] == ["call_a", "call_b"]
+    assert llm.total_input_tokens == 7
+    assert llm.total_completion_tokens == 3
+
+
+EVENTS = []
+
+
+class RecordTool(BaseTool):
+    name: str = "record"
+    description: str = "Record a label"
+    parameters: dict = {"type": "object", "properties": {"label": {"type": "string"}}}
+    read_only: bool = True
+
+    async def execute(self, label: str) -> ToolResult:
+        EVENTS.append(f"run {label}")
+        return ToolResult(output=label)
+
+
+class WriteTool(RecordTool):
+    name: str = "write"
+    read_only: bool = False
+
+    async def execute(self, label: str) -> ToolResult:
+        EVENTS.append(f"write {label}")
+        return ToolResult(output=label)
+
+
+@pytest.mark.asyncio
+async def test_agent_starts_first_tool_while_streaming(llm_factory):
+    """Tests that the first tool runs before the model finishes the response."""
+    llm = llm_factory()
+    events = EVENTS
+    events.clear()
+
+    async def create(**params):
+        async def chunks():
+            for chunk in _tool_call_chunks():
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    # Give the first tool a chance to run before the stream ends
+                    await asyncio.sleep(0.01)
+                    events.append("stream finished")
+                yield chunk
+
+        return chunks()
+
+    llm.client.chat.completions.create = create
+    agent = ToolCallAgent(
+        llm=llm,
+        available_tools=ToolCollection(RecordTool(), Terminate()),
+        stream_tool_calls=True,
+    )
+    agent.memory.add_message(Message.user_message("record a and b"))
+
+    assert await agent.think()
+    result = await agent.act()
+
+    assert events.index("run a") < events.index("stream finished")
+    assert events.count("run a") == 1 and events.count("run b") == 1
+    assert result.endswith("b")
+    tool_messages = [m for m in agent.memory.messages if m.role == "tool"]
+    assert [m.tool_call_id for m in tool_messages] == ["call_a", "call_b"]
+
+
+@pytest.mark.asyncio
+async def test_side_effecting_tools_wait_for_the_full_response(llm_factory):
+    """Tests that a failed stream leaves no unrecorded side effects."""
+    llm = llm_factory(retry_max_attempts=1)
+    events = EVENTS
+    events.clear()
+
+    async def create(**params):
+        async def chunks():
+            for chunk in _tool_call_chunks(second_tool="write"):
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    await asyncio.sleep(0.01)
+                    raise ConnectionError("stream dropped")
+                yield chunk
+
+        return chunks()
+
+    llm.client.chat.completions.create = create
+    agent = ToolCallAgent(
+        llm=llm,
+        available_tools=ToolCollection(RecordTool(), WriteTool(), Terminate()),
+        stream_tool_calls=True,
+    )
+    agent.memory.add_message(Message.user_message("record a, write b"))
+
+    with pytest.raises(ConnectionError):
+        await agent.think()
+
+    # The read-only call may have run; the write never started
+    assert "write b" not in events
+
+
+class SlowRecordTool(RecordTool):
+    async def execute(self, label: str) -> ToolResult:
+        await asyncio.sleep(0.05)
+        return await super().execute(label)
+
+
+@pytest.mark.asyncio
+async def test_retried_stream_runs_started_tool_once(llm_factory):
+    """Tests that a call reported again by a retried stream is not run twice."""
+    llm = llm_factory()
+    events = EVENTS
+    events.clear()
+    attempts = []
+
+    async def no_sleep(seconds):
+        pass
+
+    async def create(**params):
+        attempts.append(1)
+
+        async def chunks():
+            for chunk in _tool_call_chunks():
+                if (
+                    len(attempts) == 1
+                    and chunk.choices
+                    and chunk.choices[0].finish_reason
+                ):
+                    raise ConnectionError("stream dropped")
+                yield chunk
+
+        return chunks()
+
+    llm.client.chat.completions.create = create
+    llm.retry_policy._sleep = no_sleep
+    agent = ToolCallAgent(
+        llm=llm,
+        available_tools=ToolCollection(SlowRecordTool(), Terminate()),
+        stream_tool_calls=True,
+    )
+    agent.memory.add_message(Message.user_message("record a and b"))
+
+    assert await agent.think()
+    await agent.act()
+
+    assert len(attempts) == 2
+    assert events.count("run a") == 1 and events.count("run b") == 1
+
+
+def test_read_only_is_judged_per_call():
+    editor = StrReplaceEditor()
+
+    assert editor.is_read_only(command="view", path="/tmp")
+    assert not editor.is_read_only(command="create", path="/tmp/x", file_text="")
+    assert RecordTool().is_read_only(label="a")
@@ -0,0 +1,107 @@
+import pytest
+
+from app.llm import TokenCounter
+from app.schema import Message
+from app.token_estimator import TokenEstimator
+from tests.llm.conftest import make_completion
+
+
+def _history(size: int) -> list:
+    return [
+        {"role": "user" if i % 2 else "assistant", "content": f"message number {i}"}
+        for i in range(size)
+    ]
+
+
+def test_memoized_count_matches_uncached(fake_tokenizer):
+    """Tests that memoization does not change the counted total."""
+    history = _history(20) + [
+        {
+            "role": "assistant",
+            "content": "calling",
+            "tool_calls": [
+                {"id": "c1", "function": {"name": "bash", "arguments": "ls -la"}}
+            ],
+        },
+        {"role": "tool", "content": "a b c", "name": "bash", "tool_call_id": "c1"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "look"},
+                {"type": "image_url", "image_url": {"url": "data:x"}},
+            ],
+        },
+    ]
+    cached = TokenCounter(fake_tokenizer)
+    uncached = TokenCounter(fake_tokenizer, cache_size=0)
+    expected = uncached.count_message_tokens(history)
+    assert cached.count_message_tokens(history) == expected
+    assert cached.count_message_tokens([dict(m) for m in history]) == expected
+
+
+def test_only_new_messages_are_encoded(fake_tokenizer):
+    """Tests that a growing history only encodes the appended messages."""
+    counter = TokenCounter(fake_tokenizer)
+    history = _history(100)
+    counter.count_message_tokens(history)
+
+    history.append({"role": "user", "content": "one more"})
+    calls_before = fake_tokenizer.calls
+    counter.count_message_tokens([dict(m) for m in history])
+    # Only the role and content of the single new message are encoded
+    assert fake_tokenizer.calls - calls_before == 2
+
+
+def test_cache_is_bounded(fake_tokenizer):
+    counter = TokenCounter(fake_tokenizer, cache_size=10)
+    counter.count_message_tokens(_history(50))
+    assert len(counter._message_cache) == 10
+
+
+def test_long_texts_are_estimated_not_encoded(fake_tokenizer):
+    counter = TokenCounter(fake_tokenizer, estimator=TokenEstimator(100))
+    page = "word " * 1000  # 5000 bytes
+
+    tokens = counter.count_message_tokens([{"role": "tool", "content": page}])
+
+    # Only the role is encoded; the content is 5000 bytes at 4 bytes per token
+    assert fake_tokenizer.calls == 1
+    assert (
+        tokens
+        == TokenCounter.FORMAT_TOKENS + TokenCounter.BASE_MESSAGE_TOKENS + 1 + 1250
+    )
+    exact = counter.count_message_tokens(
+        [{"role": "tool", "content": page}], exact=True
+    )
+    assert (
+        exact
+        == TokenCounter.FORMAT_TOKENS + TokenCounter.BASE_MESSAGE_TOKENS + 1 + 1000
+    )
+
+
+def test_estimator_calibrates_on_prompt_tokens(fake_tokenizer):
+    estimator = TokenEstimator(100, alpha=1.0)
+    counter = TokenCounter(fake_tokenizer, estimator=estimator)
+    messages = [{"role": "tool", "content": "word " * 1000}]
+
+    counted = counter.count_message_tokens(messages)
+    # The provider saw 1000 tokens for the 5000 estimated bytes
+    counter.calibrate(counted, counted - 1250 + 1000)
+
+    assert estimator.bytes_per_token == pytest.approx(5.0)
+    # Memoized messages follow the new ratio
+    assert counter.count_message_tokens(messages) == counted - 1250 + 1000
+
+
+@pytest.mark.asyncio
+async def test_exact_count_near_budget(llm_factory, fake_tokenizer):
+    llm = llm_factory(token_estimate_threshold=100, max_input_tokens=1300)
+    page = "word " * 1000
+
+    # 1257 estimated tokens are within 10% of the budget, so count exactly
+    assert llm.count_message_tokens([{"role": "tool", "content": page}]) == 1007
+
+    llm.client.chat.completions.responses.append(make_completion(prompt_tokens=900))
+    await llm.ask([Message.user_message("word " * 100)], stream=False)
+    # Far from the budget the estimate is used and calibrated on usage
+    assert llm.token_counter.estimator.get_stats()["calibrations"] == 1
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from app.agent.base import BaseAgent
+from app.config import ModelPrice, UsageLedgerSettings
+from app.schema import AgentState, Message
+from app.usage_ledger import PriceTable, UsageLedger, usage_scope
+from tests.llm.conftest import make_chunk, make_completion, stream_chunks
+
+
+def test_price_table_matches_longest_model_name():
+    prices = PriceTable({"my-model": ModelPrice(input=1.0, output=2.0)})
+
+    assert prices.lookup("gpt-4o-mini-2024-07-18").input == 0.15
+    assert prices.lookup("gpt-4o-2024-08-06").input == 2.5
+    # 1000 uncached and 1000 cached input at the same price, 500 output
+    assert prices.cost("my-model", 2000, 500, 1000) == pytest.approx(0.003)
+    assert prices.cost("unknown-model", 10, 10, 0) is None
+    # 1000 uncached, 1000 read from and 1000 written to the cache, 100 output
+    assert prices.cost("claude-3-7-sonnet", 3000, 100, 1000, 1000) == pytest.approx(
+        (1000 * 3.0 + 1000 * 0.3 + 1000 * 3.75 + 100 * 15.0) / 1e6
+    )
+
+
+def test_exports_are_buffered_until_flushed(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    ledger = UsageLedger(
+        UsageLedgerSettings(export_path=str(path), export_interval=3600)
+    )
+
+    for _ in range(3):
+        ledger.record("gpt-4o", "ask", prompt_tokens=10)
+    assert not path.exists()
+
+    ledger.flush()
+    assert len(path.read_text().splitlines()) == 3
+
+
+@pytest.mark.asyncio
+async def test_calls_are_attributed_to_the_current_scope(llm_factory):
+    llm = llm_factory(model="gpt-4o")
+    llm.client.chat.completions.responses = [
+        make_completion(prompt_tokens=1000, completion_tokens=100, cached_tokens=400)
+    ]
+
+    with usage_scope(flow="PlanningFlow", plan_id="plan_1"):
+        with usage_scope(agent="manus", step=3):
+            await llm.ask_tool(messages=[Message.user_message("hi")])
+        await llm.ask([Message.user_message("summarize")], stream=False)
+
+    tool_call, summary = llm.usage_ledger.records
+    assert (tool_call.agent, tool_call.step, tool_call.plan_id) == (
+        "manus",
+        3,
+        "plan_1",
+    )
+    assert tool_call.call == "ask_tool" and tool_call.cached_tokens == 400
+    assert tool_call.cost == pytest.approx((600 * 2.5 + 400 * 1.25 + 100 * 10) / 1e6)
+    assert tool_call.latency is not None and not tool_call.estimated
+    assert summary.agent is None and summary.flow == "PlanningFlow"
+
+    totals = llm.usage_ledger.summarize(group_by=("plan_id",))
+    assert totals[("plan_1",)]["calls"] == 2
+    assert totals[("plan_1",)]["prompt_tokens"] == 1010
+
+
+@pytest.mark.asyncio
+async def test_streaming_ask_uses_reported_usage(llm_factory):
+    llm = llm_factory()
+    completions = llm.client.chat.completions
+    completions.responses = [
+        stream_chunks(
+            [
+                make_chunk(content="hello there"),
+                make_chunk(finish_reason="stop"),
+                make_chunk(
+                    usage={
+                        "prompt_tokens": 42,
+                        "completion_tokens": 7,
+                        "total_tokens": 49,
+                    }
+                ),
+            ]
+        ),
+        stream_chunks([make_chunk(content="no usage here", finish_reason="stop")]),
+    ]
+
+    assert await llm.ask([Message.user_message("hi")]) == "hello there"
+    await llm.ask([Message.user_message("again")])
+
+    reported, estimated = llm.usage_ledger.records
+    assert completions.requests[0]["stream_options"] == {"include_usage": True}
+    assert (reported.prompt_tokens, reported.completion_tokens) == (42, 7)
+    assert not reported.estimated
+    assert estimated.estimated and estimated.completion_tokens == 3
+
+
+@pytest.mark.asyncio
+async def test_agent_steps_are_recorded_and_exported(llm_factory, tmp_path):
+    llm = llm_factory()
+
+    class AskingAgent(BaseAgent):
+        async def step(self) -> str:
+            await self.llm.ask([Message.user_message("go")], stream=False)
+            if self.current_step == 2:
+                self.state = AgentState.FINISHED
+            return "done"
+
+    agent = AskingAgent(name="asker", llm=llm)
+    await agent.run("start")
+
+    records = llm.usage_ledger.query(agent="asker")
+    assert [record.step for record in records] == [1, 2]
+
+    path = tmp_path / "usage.jsonl"
+    assert llm.usage_ledger.export_jsonl(path, agent="asker") == 2
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines[1]["step"] == 2 and lines[1]["call"] == "ask"
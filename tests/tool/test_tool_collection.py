@@ -0,0 +1,68 @@
+import pytest
+
+from app.tool.base import BaseTool, ToolResult
+from app.tool.tool_collection import ToolCollection
+
+
+class EchoTool(BaseTool):
+    name: str = "echo"
+    description: str = "Echo the input back"
+    parameters: dict = {"type": "object", "properties": {"text": {"type": "string"}}}
+
+    async def execute(self, text: str = "") -> ToolResult:
+        return ToolResult(output=text)
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def count(self, text: str) -> int:
+        self.calls += 1
+        return len(text.split())
+
+
+@pytest.fixture
+def collection() -> ToolCollection:
+    return ToolCollection(EchoTool())
+
+
+def test_to_params_is_serialized_once(collection):
+    """Tests that tool schemas are reused until the tool set changes."""
+    first = collection.to_params()
+    assert collection.to_params() is first
+    assert first == [EchoTool().to_param()]
+
+
+def test_params_token_count_is_cached(collection):
+    """Tests that schema token cost is computed once per tokenizer."""
+    tokenizer = CountingTokenizer()
+    tokens = collection.params_token_count(tokenizer.count, "counting")
+    assert tokens == len(str(EchoTool().to_param()).split())
+    assert collection.params_token_count(tokenizer.count, "counting") == tokens
+    assert tokenizer.calls == 1
+    # Another counter for the same encoding (e.g. a session handle's) shares it
+    assert (
+        collection.params_token_count(CountingTokenizer().count, "counting") == tokens
+    )
+
+
+def test_add_tool_invalidates_cache(collection):
+    """Tests that adding tools refreshes both schemas and token cost."""
+    tokenizer = CountingTokenizer()
+    before = collection.params_token_count(tokenizer.count, "counting")
+    first = collection.to_params()
+
+    collection.add_tool(EchoTool(name="echo2"))
+
+    assert collection.to_params() is not first
+    assert len(collection.to_params()) == 2
+    assert collection.params_token_count(tokenizer.count, "counting") > before
+
+
+def test_reassigning_tools_invalidates_cache(collection):
+    """Tests that replacing the tools tuple (as MCP refresh does) is detected."""
+    first = collection.to_params()
+    collection.tools = tuple()
+    assert collection.to_params() == []
+    assert first != []